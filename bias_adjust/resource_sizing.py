@@ -0,0 +1,313 @@
+"""Resource sizing for bias adjustment Slurm jobs.
+
+The memory and time a job needs are estimated from the size of its input Zarr stores,
+read from their consolidated metadata (shape and dtype of the data variable) and from
+du (size on disk). An estimate is the input size times a coefficient, with a safety
+margin:
+    memory (GB) = input size (GB) * peak memory per GB of input
+    time (minutes) = input size (GB) * minutes per GB of input
+
+The coefficients start from conservative defaults and are refined from the actual
+usage of earlier jobs. After each job, sacct MaxRSS and Elapsed are recorded in a
+local SQLite history, and later estimates use the largest usage per GB of input seen
+for the same stage.
+
+Each job is sent to the partition with the fewest pending jobs among those whose node
+memory and time limit (from sinfo) fit the estimate, or to the largest partition,
+capped at its limits, if none does.
+"""
+
+import json
+import math
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+from utils import utils
+
+# History of actual job usage, used to refine the estimates
+default_history_db = os.path.join(os.path.dirname(__file__), "resource_history.sqlite")
+
+# Coefficients used until a stage has history, per GB of uncompressed input
+default_mem_gb_per_input_gb = 1.0
+default_time_min_per_input_gb = 5.0
+
+# Safety margin applied to every estimate, and the floor of each resource
+safety_factor = 1.5
+min_mem_gb = 8
+min_time_min = 60
+
+
+def parse_memory_gb(value):
+    """Parse a Slurm memory value, e.g. 123456K, 1.5G or 128000 (MB), to GB."""
+    value = value.strip().rstrip("+")
+    if not value:
+        return None
+    units = {"K": 1 / 1024**2, "M": 1 / 1024, "G": 1, "T": 1024}
+    if value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value) / 1024
+
+
+def parse_duration_min(value):
+    """Parse a Slurm duration, e.g. 1-02:03:04, 02:03:04 or 03:04, to minutes."""
+    value = value.strip()
+    if not value or value in ("infinite", "UNLIMITED"):
+        return math.inf
+    days = 0
+    if "-" in value:
+        days, value = value.split("-")
+    parts = [float(part) for part in value.split(":")]
+    while len(parts) < 3:
+        parts.insert(0, 0)
+    hours, minutes, seconds = parts
+    return int(days) * 24 * 60 + hours * 60 + minutes + seconds / 60
+
+
+def format_duration(minutes):
+    """Format minutes as a Slurm time limit, D-HH:MM:SS."""
+    minutes = math.ceil(minutes)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{days}-{hours:02d}:{minutes:02d}:00"
+
+
+def get_store_size(ssh, store):
+    """Get the uncompressed size of the largest array in a Zarr store from its
+    consolidated metadata (.zmetadata, or zarr.json for Zarr v3 stores), and the size
+    of the store on disk, both in bytes.
+    """
+    exit_status, stdout, stderr = utils.exec_command(
+        ssh, f"cat {store}/.zmetadata 2>/dev/null || cat {store}/zarr.json"
+    )
+    if exit_status != 0:
+        raise Exception(f"Error reading the metadata of {store}: {stderr}")
+    metadata = json.loads(stdout)
+
+    arrays = []
+    if "metadata" in metadata:
+        for key, array in metadata["metadata"].items():
+            if key.endswith("/.zarray"):
+                itemsize = int(re.sub(r"\D", "", array["dtype"]))
+                arrays.append((array["shape"], itemsize))
+    else:
+        for array in metadata["consolidated_metadata"]["metadata"].values():
+            if array.get("node_type") == "array":
+                itemsize = int(re.sub(r"\D", "", array["data_type"])) // 8
+                arrays.append((array["shape"], itemsize))
+    uncompressed_bytes = max(math.prod(shape) * itemsize for shape, itemsize in arrays)
+
+    exit_status, stdout, stderr = utils.exec_command(ssh, f"du -sb {store}")
+    if exit_status != 0:
+        raise Exception(f"Error getting the size of {store}: {stderr}")
+    disk_bytes = int(stdout.split()[0])
+
+    return uncompressed_bytes, disk_bytes
+
+
+def open_history_db(history_db=default_history_db):
+    conn = sqlite3.connect(history_db)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT,
+            recorded TEXT,
+            stage TEXT,
+            model TEXT,
+            variable TEXT,
+            input_bytes INTEGER,
+            partition TEXT,
+            requested_mem_gb REAL,
+            requested_time_min REAL,
+            max_rss_gb REAL,
+            elapsed_min REAL,
+            state TEXT
+        )
+        """)
+    # totals per stage of past runs, used by downscaling/plan_downscale_cmip6.py
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stage_runs (
+            run_dir TEXT,
+            recorded TEXT,
+            stage TEXT,
+            jobs INTEGER,
+            tasks INTEGER,
+            cpu_seconds INTEGER,
+            max_elapsed_sec INTEGER,
+            cpus REAL,
+            output_bytes INTEGER
+        )
+        """)
+    return conn
+
+
+def get_coefficients(conn, stage):
+    """Get the peak memory (GB) and time (minutes) per GB of input for a stage, the
+    largest seen in the completed jobs of the stage, or the defaults without history.
+    """
+    mem_per_gb, time_per_gb = conn.execute(
+        """
+        SELECT MAX(max_rss_gb * 1073741824.0 / input_bytes),
+            MAX(elapsed_min * 1073741824.0 / input_bytes)
+        FROM jobs WHERE stage = ? AND state = 'COMPLETED' AND input_bytes > 0
+        """,
+        (stage,),
+    ).fetchone()
+
+    return (
+        mem_per_gb or default_mem_gb_per_input_gb,
+        time_per_gb or default_time_min_per_input_gb,
+    )
+
+
+def estimate_resources(conn, stage, input_bytes):
+    """Estimate the memory (GB) and time (minutes) of a job with input_bytes of input."""
+    mem_per_gb, time_per_gb = get_coefficients(conn, stage)
+    input_gb = input_bytes / 1024**3
+    mem_gb = max(min_mem_gb, math.ceil(input_gb * mem_per_gb * safety_factor))
+    time_min = max(min_time_min, math.ceil(input_gb * time_per_gb * safety_factor))
+
+    return mem_gb, time_min
+
+
+def get_partition_limits(ssh, partitions):
+    """Get the node memory (GB), time limit (minutes) and number of pending jobs of
+    each partition.
+    """
+    limits = {}
+    for partition in partitions:
+        exit_status, stdout, stderr = utils.exec_command(
+            ssh, f'sinfo -h -p {partition} -o "%m %l"'
+        )
+        if exit_status != 0 or not stdout.strip():
+            raise Exception(f"Error getting the limits of {partition}: {stderr}")
+        # nodes of a partition may differ, the smallest is what every job can rely on
+        node_mem_gb = min(
+            parse_memory_gb(line.split()[0]) for line in stdout.strip().splitlines()
+        )
+        time_limit_min = parse_duration_min(stdout.split()[1])
+
+        exit_status, stdout, stderr = utils.exec_command(
+            ssh, f"squeue -h -p {partition} -t PENDING -o %i | wc -l"
+        )
+        limits[partition] = {
+            "mem_gb": node_mem_gb,
+            "time_min": time_limit_min,
+            "pending": int(stdout.strip() or 0),
+        }
+
+    return limits
+
+
+def choose_partition(limits, mem_gb, time_min):
+    """Choose the partition with the fewest pending jobs among those that fit a job,
+    and count the job as pending there, so that later jobs are spread out.
+
+    If no partition fits, the job goes to the largest one, with its resources capped
+    at the limits of that partition.
+
+    Returns:
+    - tuple of the partition, memory (GB) and time (minutes) of the job
+    """
+    fits = [
+        partition
+        for partition, limit in limits.items()
+        if limit["mem_gb"] >= mem_gb and limit["time_min"] >= time_min
+    ]
+    if fits:
+        partition = min(fits, key=lambda partition: limits[partition]["pending"])
+    else:
+        partition = max(
+            limits,
+            key=lambda partition: (
+                limits[partition]["mem_gb"],
+                limits[partition]["time_min"],
+            ),
+        )
+        print(
+            f"No partition fits a job of {mem_gb} GB for {time_min} minutes, "
+            f"capping it at the limits of {partition}"
+        )
+        mem_gb = min(mem_gb, math.floor(limits[partition]["mem_gb"]))
+        time_min = min(time_min, limits[partition]["time_min"])
+    limits[partition]["pending"] += 1
+
+    return partition, mem_gb, time_min
+
+
+def get_sbatch_env(mem_gb, time_min):
+    """Environment variables that override the --mem and --time of every sbatch call
+    made by a launcher script, as a prefix for a remote command.
+    """
+    return (
+        f"export SBATCH_MEM_PER_NODE={mem_gb}G "
+        f"SBATCH_TIMELIMIT={format_duration(time_min)}; "
+    )
+
+
+def get_job_usage(ssh, job_id):
+    """Get the state, peak memory (GB) and elapsed time (minutes) of a finished job
+    from sacct. The peak memory is the largest MaxRSS of any step or array task.
+    """
+    exit_status, stdout, stderr = utils.exec_command(
+        ssh, f"sacct -j {job_id} --format=JobID,State,MaxRSS,Elapsed -P -n"
+    )
+    if exit_status != 0 or not stdout.strip():
+        return None
+
+    states = []
+    max_rss_gb = 0
+    elapsed_min = 0
+    for line in stdout.strip().splitlines():
+        job_id_str, state, max_rss, elapsed = line.split("|")
+        if "." not in job_id_str:
+            states.append(state.split()[0])
+        max_rss_gb = max(max_rss_gb, parse_memory_gb(max_rss) or 0)
+        elapsed_min = max(elapsed_min, parse_duration_min(elapsed))
+
+    state = "COMPLETED" if set(states) == {"COMPLETED"} else ",".join(set(states))
+
+    return state, max_rss_gb, elapsed_min
+
+
+def record_job_usage(ssh, conn, stage, jobs):
+    """Record the sacct usage of finished jobs in the history.
+
+    Parameters:
+    - ssh: Paramiko SSHClient object, "connected"
+    - conn: Connection to the history database
+    - stage: Name of the stage the jobs belong to, e.g. "train_bias_adjustment"
+    - jobs: List of dicts with job_ids, model, variable, input_bytes, partition,
+        mem_gb and time_min of each submission
+    """
+    recorded = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for job in jobs:
+        for job_id in job["job_ids"]:
+            usage = get_job_usage(ssh, job_id)
+            if usage is None:
+                print(f"No sacct usage found for job {job_id}, not recording it")
+                continue
+            state, max_rss_gb, elapsed_min = usage
+            with conn:
+                conn.execute(
+                    "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job_id,
+                        recorded,
+                        stage,
+                        job["model"],
+                        job["variable"],
+                        job["input_bytes"],
+                        job["partition"],
+                        job["mem_gb"],
+                        job["time_min"],
+                        max_rss_gb,
+                        elapsed_min,
+                        state,
+                    ),
+                )
+            print(
+                f"Job {job_id} ({job['model']} {job['variable']}): {state}, "
+                f"{max_rss_gb:.1f} of {job['mem_gb']} GB, "
+                f"{elapsed_min:.0f} of {job['time_min']} minutes"
+            )
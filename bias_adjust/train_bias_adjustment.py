@@ -9,6 +9,7 @@ from prefect.logging import get_run_logger
 import paramiko
 from pathlib import Path
 from utils import utils, cmip6
+from bias_adjust import resource_sizing, trained_registry
 
 # Define your SSH parameters
 ssh_host = "chinook04.rcs.alaska.edu"
@@ -17,6 +18,9 @@ ssh_port = 22
 
 out_dir_name = "trained_datasets"
 
+# stage name of the training jobs in the resource history
+resource_stage = "train_bias_adjustment"
+
 
 @task
 def run_train_bias_adjustment(
@@ -32,11 +36,16 @@ def run_train_bias_adjustment(
     models,
     variables,
     slurm_dir,
+    sbatch_env="",
 ):
-    """This function will ssh to the remote server and run the slurm launcher script"""
+    """This function will ssh to the remote server and run the slurm launcher script.
+    sbatch_env is an optional prefix of environment variables that override the sbatch
+    options of the jobs, see resource_sizing.get_sbatch_env.
+    """
     logger = get_run_logger()
 
     cmd = (
+        f"{sbatch_env}"
         f"conda activate {conda_env_name}; "
         f"python {launcher_script} "
         f"--partition {partition} "
@@ -66,6 +75,132 @@ def run_train_bias_adjustment(
     return job_ids
 
 
+def get_trained_store_name(model, var_id):
+    return f"{var_id}_{model}_historical_quantiles.zarr"
+
+
+def get_training_stores(sim_dir, ref_dir, model, var_id):
+    """The inputs of one training job: the historical model store and the ERA5
+    reference store of a variable.
+    """
+    era5_var_id = cmip6.cmip6_to_era5_variables(var_id)
+    return (
+        f"{sim_dir}/{var_id}_{model}_historical.zarr",
+        f"{ref_dir}/{era5_var_id}_era5.zarr",
+    )
+
+
+def get_training_input_bytes(ssh, sim_dir, ref_dir, model, var_id):
+    """Uncompressed and on-disk size of the inputs of one training job."""
+    input_bytes = 0
+    input_disk_bytes = 0
+    for store in get_training_stores(sim_dir, ref_dir, model, var_id):
+        uncompressed_bytes, disk_bytes = resource_sizing.get_store_size(ssh, store)
+        input_bytes += uncompressed_bytes
+        input_disk_bytes += disk_bytes
+
+    return input_bytes, input_disk_bytes
+
+
+def link_registered_datasets(
+    ssh, sim_dir, ref_dir, output_dir, models, variables, registry_dir, versions
+):
+    """Link the trained datasets that are already in the registry into output_dir.
+
+    Returns:
+    - dict of the registry entry directory and fingerprint inputs of each (model,
+        variable) that still needs training
+    """
+    to_train = {}
+    # the reference store of a variable is shared by every model, digest it once
+    digests = {}
+    for model in models.split():
+        for var_id in variables.split():
+            sim_store, ref_store = get_training_stores(sim_dir, ref_dir, model, var_id)
+            store_name = get_trained_store_name(model, var_id)
+            fingerprint, inputs = trained_registry.get_fingerprint(
+                ssh,
+                sim_store,
+                ref_store,
+                versions | {"trained_store": store_name},
+                digests,
+            )
+            entry_dir = trained_registry.get_entry_dir(registry_dir, fingerprint)
+            if trained_registry.link_entry(ssh, entry_dir, store_name, output_dir):
+                print(f"Linked registered {store_name} from {entry_dir}")
+            else:
+                to_train[(model, var_id)] = (entry_dir, inputs)
+
+    return to_train
+
+
+def group_training_jobs(pairs):
+    """Group (model, variable) pairs into launcher calls, one per set of models that
+    need the same variables, as (models, variables) strings.
+    """
+    model_vars = {}
+    for model, var_id in pairs:
+        model_vars.setdefault(model, []).append(var_id)
+
+    groups = {}
+    for model, var_ids in model_vars.items():
+        groups.setdefault(" ".join(var_ids), []).append(model)
+
+    return [(" ".join(models), var_ids) for var_ids, models in groups.items()]
+
+
+def run_sized_train_bias_adjustment(ssh, kwargs, pairs, partitions, history_conn):
+    """Launch one training job per (model, variable) pair, each with memory and time
+    estimated from its inputs and sent to the least busy partition that fits it.
+
+    Returns:
+    - List of dicts describing each submission, for resource_sizing.record_job_usage
+    """
+    limits = resource_sizing.get_partition_limits(ssh, partitions)
+
+    jobs = []
+    for model, var_id in pairs:
+        input_bytes, input_disk_bytes = get_training_input_bytes(
+            ssh, kwargs["sim_dir"], kwargs["ref_dir"], model, var_id
+        )
+        mem_gb, time_min = resource_sizing.estimate_resources(
+            history_conn, resource_stage, input_bytes
+        )
+        partition, mem_gb, time_min = resource_sizing.choose_partition(
+            limits, mem_gb, time_min
+        )
+        print(
+            f"Training {model} {var_id} ({input_bytes / 1024**3:.1f} GB of input, "
+            f"{input_disk_bytes / 1024**3:.1f} GB on disk) "
+            f"with {mem_gb} GB for {time_min} minutes on {partition}"
+        )
+
+        job_ids = run_train_bias_adjustment(
+            **(
+                kwargs
+                | {
+                    "models": model,
+                    "variables": var_id,
+                    "partition": partition,
+                    "sbatch_env": resource_sizing.get_sbatch_env(mem_gb, time_min),
+                }
+            )
+        )
+        jobs.append(
+            {
+                "job_ids": job_ids,
+                "model": model,
+                "variable": var_id,
+                "input_bytes": input_bytes,
+                "partition": partition,
+                "mem_gb": mem_gb,
+                "time_min": time_min,
+            }
+        )
+
+    return jobs
+
+
 @flow(log_prints=True)
 def train_bias_adjustment(
     ssh_username,
@@ -80,7 +215,23 @@ def train_bias_adjustment(
     base_output_dir,
     run_name,
     partition,
+    size_resources=False,
+    partitions="",
+    history_db=resource_sizing.default_history_db,
+    trained_registry_dir="",
 ):
+    """Train the bias adjustment of each model and variable.
+
+    Trained datasets are kept in a registry shared across runs (trained_registry_dir,
+    default <base_output_dir>/trained_registry), keyed by a fingerprint of their
+    inputs and the training code. Datasets already in the registry are linked into
+    the trained_datasets directory of the run, and only the rest are trained.
+
+    With size_resources, each model and variable is launched as its own job, with the
+    memory and time estimated from the size of its Zarr stores and the usage of
+    earlier jobs kept in history_db, on the least busy of partitions (space-separated,
+    defaults to partition) that fits it. The actual usage is recorded in history_db.
+    """
     variables = cmip6.validate_vars(variables, return_list=False)
     models = cmip6.validate_models(models, return_list=False)
 
@@ -117,6 +268,26 @@ def train_bias_adjustment(
 
         utils.create_directories(ssh, [tmp_dir, output_dir, slurm_dir])
 
+        if not trained_registry_dir:
+            trained_registry_dir = project_base_dir.joinpath("trained_registry")
+        versions = trained_registry.get_training_versions(
+            ssh, conda_env_name, repo_path, worker_script
+        )
+        to_train = link_registered_datasets(
+            ssh,
+            sim_dir,
+            ref_dir,
+            output_dir,
+            models,
+            variables,
+            trained_registry_dir,
+            versions,
+        )
+        if not to_train:
+            print("All trained datasets found in the registry, nothing to train.")
+            return output_dir
+        print(f"Training {len(to_train)} datasets not found in the registry")
+
         kwargs = {
             "ssh": ssh,
             "launcher_script": launcher_script,
@@ -128,16 +299,51 @@ def train_bias_adjustment(
             "ref_dir": ref_dir,
             "output_dir": output_dir,
             "slurm_dir": slurm_dir,
-            "models": models,
-            "variables": variables,
         }
-        job_ids = run_train_bias_adjustment(**kwargs)
+        if size_resources:
+            history_conn = resource_sizing.open_history_db(history_db)
+            jobs = []
+            try:
+                jobs = run_sized_train_bias_adjustment(
+                    ssh,
+                    kwargs,
+                    list(to_train),
+                    (partitions or partition).split(),
+                    history_conn,
+                )
 
-        utils.wait_for_jobs_completion(
-            ssh,
-            job_ids,
-            completion_message="Slurm jobs for bias adjustment training complete.",
-        )
+                utils.wait_for_jobs_completion(
+                    ssh,
+                    [job_id for job in jobs for job_id in job["job_ids"]],
+                    completion_message="Slurm jobs for bias adjustment training complete.",
+                )
+            finally:
+                # record usage of whatever ran, failed jobs included
+                resource_sizing.record_job_usage(
+                    ssh, history_conn, resource_stage, jobs
+                )
+                history_conn.close()
+        else:
+            job_ids = []
+            for group_models, group_variables in group_training_jobs(to_train):
+                job_ids += run_train_bias_adjustment(
+                    **(kwargs | {"models": group_models, "variables": group_variables})
+                )
+
+            utils.wait_for_jobs_completion(
+                ssh,
+                job_ids,
+                completion_message="Slurm jobs for bias adjustment training complete.",
+            )
+
+        for (model, var_id), (entry_dir, inputs) in to_train.items():
+            trained_registry.register_store(
+                ssh,
+                entry_dir,
+                get_trained_store_name(model, var_id),
+                output_dir,
+                inputs,
+            )
 
     finally:
         ssh.close()
@@ -158,6 +364,12 @@ if __name__ == "__main__":
     ref_dir = "/center1/CMIP6/snapdata/cmip6_4km_downscaling/era5_zarr"
     run_name = "cmip6_4km_downscaling"
     partition = "t2small"
+    # launch each model and variable as its own job, sized from its inputs and the
+    # usage of earlier jobs, on the least busy of these partitions that fits it
+    size_resources = False
+    partitions = "t2small t2standard"
+    # shared registry of trained datasets, empty → <project_base_dir>/trained_registry
+    trained_registry_dir = ""
 
     train_bias_adjustment.serve(
         name="train-bias-adjustment-cmip6",
@@ -175,5 +387,8 @@ if __name__ == "__main__":
             "models": models,
             "variables": variables,
             "partition": partition,
+            "size_resources": size_resources,
+            "partitions": partitions,
+            "trained_registry_dir": trained_registry_dir,
         },
     )
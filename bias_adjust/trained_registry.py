@@ -0,0 +1,155 @@
+"""Registry of trained bias adjustment datasets, shared across runs.
+
+Training only depends on the historical model data, the reference data and the
+training code, so a trained dataset can be reused by any run with the same inputs.
+Each trained dataset is stored once in the registry, under a fingerprint of:
+    - the historical model store and the reference store: their consolidated metadata
+      and the name and size of every file in them. Chunks are compressed, so their
+      sizes change with their contents, while a store rebuilt from the same data by
+      a later run (e.g. one adding a scenario) still matches
+    - the training worker script (the method) and a hash of its contents, so a local
+      edit is a new method, the xclim version of the Conda environment and the git
+      HEAD of the cmip6-utils clone
+
+    <registry_dir>/<fingerprint, first 16 characters>/
+        <trained store>
+        fingerprint.json  # the inputs of the fingerprint, for reference
+
+and linked into the trained_datasets directory of each run that uses it.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+
+from utils import utils
+
+
+def get_store_digest(ssh, store):
+    """Get a digest of a Zarr store from its consolidated metadata and the name and
+    size of its files, without reading any data.
+    """
+    cmd = (
+        f"test -d {store} && "
+        f"{{ cat {store}/.zmetadata 2>/dev/null || cat {store}/zarr.json; "
+        f"find -L {store} -type f -printf '%P %s\\n' | sort; }} | sha256sum"
+    )
+    exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
+    if exit_status != 0:
+        raise Exception(f"Error fingerprinting {store}: {stderr}")
+
+    return stdout.split()[0]
+
+
+def get_training_versions(ssh, conda_env_name, repo_path, worker_script):
+    """Get the versions of the training code: the worker script and the hash of its
+    contents, the xclim version of the Conda environment and the git HEAD of the
+    cmip6-utils clone.
+    """
+    exit_status, stdout, stderr = utils.exec_command(ssh, f"sha256sum {worker_script}")
+    if exit_status != 0:
+        raise Exception(f"Error hashing {worker_script}: {stderr}")
+    method_sha256 = stdout.split()[0]
+
+    exit_status, stdout, stderr = utils.exec_command(
+        ssh,
+        f"conda activate {conda_env_name}; "
+        f"python -c 'import xclim; print(xclim.__version__)'",
+    )
+    if exit_status != 0:
+        raise Exception(f"Error getting the xclim version: {stderr}")
+    xclim_version = stdout.strip().splitlines()[-1]
+
+    exit_status, stdout, stderr = utils.exec_command(
+        ssh, f"git -C {repo_path} rev-parse HEAD"
+    )
+    if exit_status != 0:
+        raise Exception(f"Error getting the git HEAD of {repo_path}: {stderr}")
+
+    return {
+        "method": Path(worker_script).name,
+        "method_sha256": method_sha256,
+        "xclim": xclim_version,
+        "cmip6_utils": stdout.strip(),
+    }
+
+
+def get_fingerprint(ssh, sim_store, ref_store, versions, digests=None):
+    """Get the fingerprint of a training job and the inputs it was built from.
+
+    digests is an optional dict of store digests, filled in as stores are digested,
+    so a store shared by several jobs (the reference store of a variable is used by
+    every model) is only digested once when the same dict is passed to each call.
+
+    Returns:
+    - tuple of the fingerprint and a dict of its inputs
+    """
+    if digests is None:
+        digests = {}
+    for store in (sim_store, ref_store):
+        if str(store) not in digests:
+            digests[str(store)] = get_store_digest(ssh, store)
+
+    inputs = {
+        "sim_store": str(sim_store),
+        "sim_digest": digests[str(sim_store)],
+        "ref_store": str(ref_store),
+        "ref_digest": digests[str(ref_store)],
+    } | versions
+    # the paths are recorded for reference only, identical data elsewhere matches
+    key = {k: v for k, v in inputs.items() if k not in ("sim_store", "ref_store")}
+    fingerprint = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    return fingerprint, inputs
+
+
+def get_entry_dir(registry_dir, fingerprint):
+    return Path(registry_dir).joinpath(fingerprint[:16])
+
+
+def link_entry(ssh, entry_dir, store_name, output_dir):
+    """Link a registered trained store into output_dir, if the registry has it.
+    Otherwise, a link left in output_dir to an entry with other inputs is removed, so
+    that training does not write into that entry.
+
+    Returns:
+    - True if the store was linked, False if it is not in the registry
+    """
+    entry_store = Path(entry_dir).joinpath(store_name)
+    store = Path(output_dir).joinpath(store_name)
+    # a store trained in place by an earlier run is replaced by the link
+    cmd = (
+        f"if test -d {entry_store}; then "
+        f"{{ test -L {store} || rm -rf {store}; }} && ln -sfn {entry_store} {store}; "
+        f"else rm -f {store} 2>/dev/null; exit 1; fi"
+    )
+    exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
+
+    return exit_status == 0
+
+
+def register_store(ssh, entry_dir, store_name, output_dir, inputs):
+    """Move a newly trained store from output_dir into the registry, record its
+    fingerprint inputs, and link it back into output_dir.
+    """
+    entry_dir = Path(entry_dir)
+    store = Path(output_dir).joinpath(store_name)
+    entry_store = entry_dir.joinpath(store_name)
+    record = inputs | {"registered": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+
+    utils.create_directories(ssh, [entry_dir])
+    # move under a temporary name first, so a partial move never looks registered
+    cmd = (
+        f"rm -rf {entry_store}.tmp && mv {store} {entry_store}.tmp && "
+        f"rm -rf {entry_store} && mv {entry_store}.tmp {entry_store} && "
+        f"ln -sfn {entry_store} {store}"
+    )
+    exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
+    if exit_status != 0:
+        raise Exception(f"Error registering {store} in {entry_dir}: {stderr}")
+    utils.write_remote_file(
+        ssh,
+        entry_dir.joinpath("fingerprint.json"),
+        json.dumps(record, indent=2) + "\n",
+    )
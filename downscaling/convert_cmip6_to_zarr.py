@@ -8,7 +8,8 @@ from prefect import flow, task
 from prefect.logging import get_run_logger
 import paramiko
 from pathlib import Path
-from utils import utils, cmip6
+from utils import utils, cmip6, zarr_chunks
+from downscaling import rechunk_tasks
 
 # Define your SSH parameters
 ssh_host = "chinook04.rcs.alaska.edu"
@@ -40,6 +41,7 @@ def run_convert_cmip6_netcdf_to_zarr(
     scenarios,
     variables,
     slurm_dir,
+    chunks_dict=None,
 ):
     """This function will ssh to the remote server and run the slurm launcher script"""
     logger = get_run_logger()
@@ -57,6 +59,8 @@ def run_convert_cmip6_netcdf_to_zarr(
         f"--variables '{variables}' "
         f"--slurm_dir {slurm_dir}"
     )
+    if chunks_dict:
+        cmd += f" --chunks_dict {chunks_dict}"
 
     exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
     if exit_status != 0:
@@ -79,6 +83,84 @@ def run_convert_cmip6_netcdf_to_zarr(
     return job_ids
 
 
+def plan_cmip6_zarr_chunks(
+    ssh, conda_env_name, netcdf_dir, variables, scenarios, consumer, target_chunk_mb
+):
+    """Plan the chunks of the CMIP6 Zarr stores of each scenario from the regridded
+    files of one model. All variables are regridded to the same grid and written as
+    float32, but the historical and projected periods differ in length, so there is a
+    plan per scenario, used for every store of that scenario.
+
+    Returns:
+    - dict of (dataset_info, chunks) tuples per scenario
+    """
+    var_id = variables.split()[0]
+    plans = {}
+    for scenario in scenarios.split():
+        exit_status, stdout, stderr = utils.exec_command(
+            ssh, f"ls -d {netcdf_dir}/*/{scenario}/day/{var_id} | head -n 1"
+        )
+        if exit_status != 0 or not stdout.strip():
+            print(f"No regridded {var_id} data found for {scenario} in {netcdf_dir}")
+            continue
+
+        dataset_info = zarr_chunks.inspect_remote_dataset(
+            ssh, conda_env_name, f"{stdout.strip()}/*.nc"
+        )
+        chunks = zarr_chunks.plan_zarr_chunks(
+            dataset_info["dims"],
+            dataset_info["sizes"],
+            dataset_info["itemsize"],
+            consumer,
+            target_chunk_mb,
+        )
+        plans[scenario] = dataset_info, chunks
+
+    if not plans:
+        raise Exception(f"No regridded {var_id} data found in {netcdf_dir}")
+
+    return plans
+
+
+def group_scenarios_by_chunks(plans):
+    """Group the scenarios that share the same chunks, so that each group can be
+    converted by a single job, e.g. {"ssp126 ssp245": {"time": 31390, ...}}.
+    """
+    groups = {}
+    for scenario, (_, chunks) in plans.items():
+        key = tuple(chunks.items())
+        groups.setdefault(key, []).append(scenario)
+
+    return {" ".join(scenarios): dict(key) for key, scenarios in groups.items()}
+
+
+def get_cmip6_rechunk_tasks(ssh, netcdf_dir, output_dir, variables, models, scenarios):
+    """Get the (inputs, output_store) tasks of the streaming rechunk, one per variable,
+    model and scenario with regridded data in netcdf_dir.
+    """
+    exit_status, stdout, stderr = utils.exec_command(
+        ssh, f"ls -d {netcdf_dir}/*/*/day/*"
+    )
+    if exit_status != 0:
+        raise Exception(f"Error listing regridded data in {netcdf_dir}: {stderr}")
+
+    tasks = []
+    for var_dir in stdout.split():
+        var_dir = Path(var_dir)
+        var_id = var_dir.name
+        scenario = var_dir.parents[1].name
+        model = var_dir.parents[2].name
+        if (
+            var_id in variables.split()
+            and model in models.split()
+            and scenario in scenarios.split()
+        ):
+            store = Path(output_dir).joinpath(f"{var_id}_{model}_{scenario}.zarr")
+            tasks.append((f"{var_dir}/*.nc", store))
+
+    return tasks
+
+
 @flow(log_prints=True)
 def convert_cmip6_to_zarr(
     ssh_username,
@@ -93,7 +175,28 @@ def convert_cmip6_to_zarr(
     base_output_dir,
     run_name,
     partition,
+    consumer="training",
+    target_chunk_mb=zarr_chunks.default_target_chunk_mb,
+    streaming_rechunk=False,
+    memory_budget_gb=8,
+    pass_chunks_dict=False,
 ):
+    """Convert regridded CMIP6 NetCDF files to one Zarr store per variable, model and
+    scenario. The chunks of the stores of each scenario are planned for consumer
+    ("training", "adjustment" or "point_extraction") with a target size of
+    target_chunk_mb MB.
+
+    With streaming_rechunk, the stores are written by downscaling/rechunk_zarr.py
+    instead of the cmip6-utils conversion scripts, rechunking in two phases through an
+    intermediate store within memory_budget_gb GB per store. Otherwise the cmip6-utils
+    scripts use their own chunks, unless pass_chunks_dict is set and the planned
+    chunks are passed to them as --chunks_dict, which needs a version of
+    run_cmip6_netcdf_to_zarr.py that accepts it.
+
+    The layout of each store is recorded in a <store>.manifest.json next to it, from
+    the plan where the planned chunks were used, and from the metadata of the store
+    otherwise.
+    """
     variables = cmip6.validate_vars(variables, return_list=False)
     models = cmip6.validate_models(models, return_list=False)
     scenarios = cmip6.validate_scenarios(scenarios, return_list=False)
@@ -132,34 +235,105 @@ def convert_cmip6_to_zarr(
 
         utils.create_directories(ssh, [output_dir, slurm_dir])
 
-        kwargs = {
-            "ssh": ssh,
-            "launcher_script": launcher_script,
-            "conda_env_name": conda_env_name,
-            "partition": partition,
-            "worker_script": worker_script,
-            "netcdf_dir": netcdf_dir,
-            "output_dir": output_dir,
-            "slurm_dir": slurm_dir,
-            "models": models,
-            "scenarios": scenarios,
-            "variables": variables,
-        }
-        job_ids = run_convert_cmip6_netcdf_to_zarr(**kwargs)
-
-        # Find the sbatch script for retry logic
-        sbatch_script = slurm_dir.joinpath("convert_cmip6_netcdf_to_zarr.slurm")
-
-        # Use retry logic to handle intermittent 0:53 errors
-        final_job_ids = utils.wait_for_jobs_with_retry(
+        plans = plan_cmip6_zarr_chunks(
             ssh,
-            job_ids,
-            sbatch_script_path=sbatch_script if sbatch_script.exists() else None,
-            max_job_retries=3,
-            retry_delay=60,
-            exponential_backoff=True,
-            completion_message="Slurm jobs for Zarr conversion complete.",
+            conda_env_name,
+            netcdf_dir,
+            variables,
+            scenarios,
+            consumer,
+            target_chunk_mb,
+        )
+        for scenario, (_, chunks) in plans.items():
+            print(f"Chunking {scenario} CMIP6 Zarr stores for {consumer} as {chunks}")
+        chunked_as_planned = streaming_rechunk or pass_chunks_dict
+
+        if streaming_rechunk:
+            # one array job per group of scenarios with the same tile size
+            for group_scenarios, chunks in group_scenarios_by_chunks(plans).items():
+                tile_size, extra_args = rechunk_tasks.get_rechunk_args(chunks, consumer)
+                rechunk_tasks.run_rechunk_zarr(
+                    ssh,
+                    working_dir,
+                    job_name=f"cmip6_rechunk_{group_scenarios.split()[0]}",
+                    tasks=get_cmip6_rechunk_tasks(
+                        ssh, netcdf_dir, output_dir, variables, models, group_scenarios
+                    ),
+                    conda_env_name=conda_env_name,
+                    partition=partition,
+                    tile_size=tile_size,
+                    memory_budget_gb=memory_budget_gb,
+                    extra_args=extra_args,
+                )
+        else:
+            # the launcher takes one chunks_dict, so it is run once per group of
+            # scenarios with the same chunks when they are passed
+            if pass_chunks_dict:
+                groups = group_scenarios_by_chunks(plans)
+            else:
+                groups = {scenarios: None}
+
+            for group_scenarios, chunks in groups.items():
+                kwargs = {
+                    "ssh": ssh,
+                    "launcher_script": launcher_script,
+                    "conda_env_name": conda_env_name,
+                    "partition": partition,
+                    "worker_script": worker_script,
+                    "netcdf_dir": netcdf_dir,
+                    "output_dir": output_dir,
+                    "slurm_dir": slurm_dir,
+                    "models": models,
+                    "scenarios": group_scenarios,
+                    "variables": variables,
+                }
+                if chunks:
+                    kwargs["chunks_dict"] = zarr_chunks.format_chunks_dict(chunks)
+                job_ids = run_convert_cmip6_netcdf_to_zarr(**kwargs)
+
+                # Find the sbatch script for retry logic
+                sbatch_script = slurm_dir.joinpath("convert_cmip6_netcdf_to_zarr.slurm")
+
+                # Use retry logic to handle intermittent 0:53 errors
+                final_job_ids = utils.wait_for_jobs_with_retry(
+                    ssh,
+                    job_ids,
+                    sbatch_script_path=(
+                        sbatch_script if sbatch_script.exists() else None
+                    ),
+                    max_job_retries=3,
+                    retry_delay=60,
+                    exponential_backoff=True,
+                    completion_message="Slurm jobs for Zarr conversion complete.",
+                )
+
+        exit_status, stdout, stderr = utils.exec_command(
+            ssh, f"ls -d {output_dir}/*.zarr"
         )
+        expected_stores = {
+            f"{var_id}_{model}_{scenario}.zarr": (var_id, scenario)
+            for var_id in variables.split()
+            for model in models.split()
+            for scenario in plans
+        }
+        for store in stdout.split():
+            if Path(store).name not in expected_stores:
+                continue
+            var_id, scenario = expected_stores[Path(store).name]
+            dataset_info, chunks = plans[scenario]
+            dataset_info = {**dataset_info, "variable": var_id}
+            if chunked_as_planned:
+                manifest = zarr_chunks.build_chunk_manifest(
+                    store, dataset_info, consumer, chunks, target_chunk_mb
+                )
+            else:
+                # the cmip6-utils scripts chose the chunks, record what they wrote
+                sizes, chunks = zarr_chunks.read_store_layout(ssh, store, var_id)
+                dataset_info["sizes"] = sizes
+                manifest = zarr_chunks.build_chunk_manifest(
+                    store, dataset_info, None, chunks, None
+                )
+            zarr_chunks.write_chunk_manifest(ssh, store, manifest)
 
     finally:
         ssh.close()
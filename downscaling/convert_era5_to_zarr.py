@@ -7,7 +7,8 @@ from prefect import flow, task
 from prefect.logging import get_run_logger
 import paramiko
 from pathlib import Path
-from utils import utils
+from utils import utils, zarr_chunks
+from downscaling import rechunk_tasks
 
 # Define your SSH parameters
 ssh_host = "chinook04.rcs.alaska.edu"
@@ -15,6 +16,10 @@ ssh_port = 22
 
 out_dir_name = "era5_zarr"
 
+# historical period of the reference data, used by the streaming rechunk
+default_start_year = 1965
+default_end_year = 2014
+
 
 @task
 def run_convert_era5_netcdf_to_zarr(
@@ -64,6 +69,66 @@ def run_convert_era5_netcdf_to_zarr(
     return job_ids
 
 
+def run_era5_streaming_rechunk(
+    ssh,
+    conda_env_name,
+    partition,
+    netcdf_dir,
+    output_dir,
+    working_dir,
+    variables,
+    consumer,
+    target_chunk_mb,
+    memory_budget_gb,
+    start_year,
+    end_year,
+):
+    """Rechunk the ERA5 NetCDF files of each variable into <var>_era5.zarr with
+    downscaling/rechunk_zarr.py, in two phases within memory_budget_gb GB per store.
+    The chunks are planned from the first variable, all variables share the grid.
+    """
+    var_list = variables.split()
+    # the stores only cover start_year to end_year, leap days included
+    dataset_info = zarr_chunks.inspect_remote_dataset(
+        ssh,
+        conda_env_name,
+        f"{netcdf_dir}/{var_list[0]}/*.nc",
+        start_year=start_year,
+        end_year=end_year,
+    )
+    chunks = zarr_chunks.plan_zarr_chunks(
+        dataset_info["dims"],
+        dataset_info["sizes"],
+        dataset_info["itemsize"],
+        consumer,
+        target_chunk_mb,
+    )
+    print(f"Chunking ERA5 Zarr stores for {consumer} as {chunks}")
+
+    tile_size, extra_args = rechunk_tasks.get_rechunk_args(chunks, consumer)
+    rechunk_tasks.run_rechunk_zarr(
+        ssh,
+        working_dir,
+        job_name="era5_rechunk",
+        tasks=[
+            (f"{netcdf_dir}/{var_id}/*.nc", output_dir.joinpath(f"{var_id}_era5.zarr"))
+            for var_id in var_list
+        ],
+        conda_env_name=conda_env_name,
+        partition=partition,
+        tile_size=tile_size,
+        memory_budget_gb=memory_budget_gb,
+        extra_args=f"{extra_args} --start_year {start_year} --end_year {end_year}",
+    )
+
+    for var_id in var_list:
+        store = output_dir.joinpath(f"{var_id}_era5.zarr")
+        manifest = zarr_chunks.build_chunk_manifest(
+            store, dataset_info, consumer, chunks, target_chunk_mb
+        )
+        zarr_chunks.write_chunk_manifest(ssh, store, manifest)
+
+
 @flow(log_prints=True)
 def convert_era5_to_zarr(
     ssh_username,
@@ -77,7 +142,21 @@ def convert_era5_to_zarr(
     run_name,
     partition,
     resolution,
+    streaming_rechunk=False,
+    memory_budget_gb=8,
+    consumer="training",
+    target_chunk_mb=zarr_chunks.default_target_chunk_mb,
+    start_year=default_start_year,
+    end_year=default_end_year,
 ):
+    """Convert ERA5 NetCDF files to one Zarr store per variable.
+
+    With streaming_rechunk, the stores are written by downscaling/rechunk_zarr.py
+    instead of the cmip6-utils conversion scripts, rechunking start_year to end_year in
+    two phases through an intermediate store within memory_budget_gb GB per store. The
+    chunks are planned for consumer with a target size of target_chunk_mb MB and
+    recorded in a <store>.manifest.json next to each store.
+    """
     # Create an SSH client
     ssh = paramiko.SSHClient()
     ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -112,33 +191,49 @@ def convert_era5_to_zarr(
 
         utils.create_directories(ssh, [output_dir, slurm_dir])
 
-        kwargs = {
-            "ssh": ssh,
-            "launcher_script": launcher_script,
-            "conda_env_name": conda_env_name,
-            "worker_script": worker_script,
-            "netcdf_dir": netcdf_dir,
-            "variables": variables,
-            "output_dir": output_dir,
-            "slurm_dir": slurm_dir,
-            "partition": partition,
-            "resolution": str(resolution),
-        }
-        job_ids = run_convert_era5_netcdf_to_zarr(**kwargs)
-
-        # Find the sbatch script for retry logic
-        sbatch_script = slurm_dir.joinpath("convert_era5_netcdf_to_zarr.slurm")
-
-        # Use retry logic to handle intermittent 0:53 errors
-        final_job_ids = utils.wait_for_jobs_with_retry(
-            ssh,
-            job_ids,
-            sbatch_script_path=sbatch_script if sbatch_script.exists() else None,
-            max_job_retries=3,
-            retry_delay=60,
-            exponential_backoff=True,
-            completion_message="Slurm jobs for Zarr conversion complete.",
-        )
+        if streaming_rechunk:
+            run_era5_streaming_rechunk(
+                ssh,
+                conda_env_name,
+                partition,
+                netcdf_dir,
+                output_dir,
+                working_dir,
+                variables,
+                consumer,
+                target_chunk_mb,
+                memory_budget_gb,
+                start_year,
+                end_year,
+            )
+        else:
+            kwargs = {
+                "ssh": ssh,
+                "launcher_script": launcher_script,
+                "conda_env_name": conda_env_name,
+                "worker_script": worker_script,
+                "netcdf_dir": netcdf_dir,
+                "variables": variables,
+                "output_dir": output_dir,
+                "slurm_dir": slurm_dir,
+                "partition": partition,
+                "resolution": str(resolution),
+            }
+            job_ids = run_convert_era5_netcdf_to_zarr(**kwargs)
+
+            # Find the sbatch script for retry logic
+            sbatch_script = slurm_dir.joinpath("convert_era5_netcdf_to_zarr.slurm")
+
+            # Use retry logic to handle intermittent 0:53 errors
+            final_job_ids = utils.wait_for_jobs_with_retry(
+                ssh,
+                job_ids,
+                sbatch_script_path=sbatch_script if sbatch_script.exists() else None,
+                max_job_retries=3,
+                retry_delay=60,
+                exponential_backoff=True,
+                completion_message="Slurm jobs for Zarr conversion complete.",
+            )
 
     finally:
         ssh.close()
@@ -10,20 +10,36 @@ The flow consists of the following steps:
 4. Compute DTR from raw CMIP6 tasmax and tasmin (if dtr or tasmin requested).
 5. Generate batch files for DTR data (if dtr or tasmin requested).
 6. Create the intermediate target grid file for the first regridding step.
-7. Regrid CMIP6 data to the intermediate grid (bilinear).
-8. Create the second intermediate target grid file.
-9. Regrid from the intermediate grid toward the final resolution.
-10. Create the final target grid file from ERA5 template.
-11. Regrid to the final target grid (ERA5 resolution).
-12. Ensure ERA5 reference data is in scratch space (copy if not).
-13. Process DTR from the ERA5 data (if dtr or tasmin requested).
-14. Convert ERA5 data to Zarr format.
-15. Convert the regridded CMIP6 data to Zarr format.
-16. Train bias adjustment model using historical data only. Weights/adjustment factors are saved on a per-model, per-variable basis.
-17. Apply bias adjustment to the regridded CMIP6 data.
-18. Derive tasmin from adjusted tasmax minus adjusted dtr (if tasmin requested).
+7. Create the second intermediate target grid file.
+8. Create the final target grid file from ERA5 template.
+9. Generate regridding weights for every cascade stage, once per model grid
+   (cascade_mode="fused" only). Weights are cached in regrid_weights_dir and reused by
+   later runs.
+10. Regrid CMIP6 data to the intermediate grid (bilinear).
+11. Regrid from the intermediate grid toward the final resolution.
+12. Regrid to the final target grid (ERA5 resolution).
+13. Ensure ERA5 reference data is in scratch space (copy if not).
+14. Process DTR from the ERA5 data (if dtr or tasmin requested).
+15. Convert ERA5 data to Zarr format.
+16. Convert the regridded CMIP6 data to Zarr format.
+17. Train bias adjustment model using historical data only. Weights/adjustment factors are saved on a per-model, per-variable basis.
+18. Apply bias adjustment to the regridded CMIP6 data.
+19. Derive tasmin from adjusted tasmax minus adjusted dtr (if tasmin requested).
+
+With cascade_mode="fused", steps 10, 11 and 12 are replaced by a single Slurm array job
+that applies all three regrid stages in memory and only writes the final grid.
+With regrid_output_format="zarr" as well, the fused regrid writes the final grid as
+Zarr stores chunked for bias adjustment, and step 16 is skipped.
+With fuse_dtr=True as well, the fused regrid derives DTR from the tasmax and tasmin it
+already reads, and steps 4 and 5 are skipped.
+With zarr_streaming_rechunk=True, steps 15 and 16 rechunk the NetCDF data into Zarr
+in two phases through an intermediate store, within zarr_memory_budget_gb GB per store.
+
+To estimate the cost of a run before submitting it, run plan_downscale_cmip6 with the
+same parameters.
 """
 
+import hashlib
 from prefect import flow, task
 from prefect.logging import get_run_logger
 import paramiko
@@ -35,6 +51,7 @@ from pipelines.cmip6_dtr import process_dtr
 from pipelines.wrf_era5_dtr import process_era5_dtr
 from downscaling.convert_cmip6_to_zarr import convert_cmip6_to_zarr
 from downscaling.convert_era5_to_zarr import convert_era5_to_zarr
+from downscaling import rechunk_tasks
 from bias_adjust.train_bias_adjustment import train_bias_adjustment
 from bias_adjust.bias_adjustment import bias_adjustment
 from regridding import regridding_functions as rf
@@ -46,6 +63,22 @@ ssh_port = 22
 # name of folder in working_dir where downscaled data is written
 out_dir_name = "downscaled"
 
+# source land fraction (sftlf) file for each model, mirrors model_sftlf_lu in the
+# cmip6-utils regridding config
+model_sftlf_lu = {
+    "GFDL-ESM4": "/beegfs/CMIP6/arctic-cmip6/CMIP6/ScenarioMIP/NOAA-GFDL/GFDL-ESM4/ssp370/r1i1p1f1/fx/sftlf/gr1/v20180701/sftlf_fx_GFDL-ESM4_ssp370_r1i1p1f1_gr1.nc",
+    "CNRM-CM6-1-HR": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/CNRM-CERFACS/CNRM-CM6-1-HR/historical/r1i1p1f2/fx/sftlf/gr/v20191021/sftlf_fx_CNRM-CM6-1-HR_historical_r1i1p1f2_gr.nc",
+    "NorESM2-MM": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/NCC/NorESM2-MM/historical/r1i1p1f1/fx/sftlf/gn/v20191108/sftlf_fx_NorESM2-MM_historical_r1i1p1f1_gn.nc",
+    "TaiESM1": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/AS-RCEC/TaiESM1/historical/r1i1p1f1/fx/sftlf/gn/v20200624/sftlf_fx_TaiESM1_historical_r1i1p1f1_gn.nc",
+    "HadGEM3-GC31-MM": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/MOHC/HadGEM3-GC31-MM/piControl/r1i1p1f1/fx/sftlf/gn/v20200108/sftlf_fx_HadGEM3-GC31-MM_piControl_r1i1p1f1_gn.nc",
+    "HadGEM3-GC31-LL": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/MOHC/HadGEM3-GC31-LL/piControl/r1i1p1f1/fx/sftlf/gn/v20190709/sftlf_fx_HadGEM3-GC31-LL_piControl_r1i1p1f1_gn.nc",
+    "MIROC6": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/MIROC/MIROC6/historical/r1i1p1f1/fx/sftlf/gn/v20190311/sftlf_fx_MIROC6_historical_r1i1p1f1_gn.nc",
+    "EC-Earth3-Veg": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/EC-Earth-Consortium/EC-Earth3-Veg/historical/r1i1p1f1/fx/sftlf/gr/v20211207/sftlf_fx_EC-Earth3-Veg_historical_r1i1p1f1_gr.nc",
+    "CESM2": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/NCAR/CESM2/historical/r11i1p1f1/fx/sftlf/gn/v20190514/sftlf_fx_CESM2_historical_r11i1p1f1_gn.nc",
+    "MPI-ESM1-2-HR": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/MPI-M/MPI-ESM1-2-HR/historical/r1i1p1f1/fx/sftlf/gn/v20190710/sftlf_fx_MPI-ESM1-2-HR_historical_r1i1p1f1_gn.nc",
+    "MRI-ESM2-0": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/MRI/MRI-ESM2-0/historical/r1i1p1f1/fx/sftlf/gn/v20190603/sftlf_fx_MRI-ESM2-0_historical_r1i1p1f1_gn.nc",
+}
+
 
 def get_batch_file_variables(variables):
     """Get variables needed for batch file generation.
@@ -294,6 +327,58 @@ def ensure_reference_data_in_scratch(
     return ref_output_dir
 
 
+def get_grid_cache_file(grid_cache_dir, prefix, *inputs):
+    """Path of a grid artifact in the shared grid cache, named by a hash of the inputs
+    it is built from, so runs with the same inputs share one file.
+    """
+    key = hashlib.sha256(repr(inputs).encode()).hexdigest()[:16]
+    return Path(grid_cache_dir).joinpath(f"{prefix}_{key}.nc")
+
+
+def get_grid_build_inputs(ssh, src_file, build_script):
+    """Get the inputs of a grid artifact that its paths do not capture: the size and
+    mtime of the file it is built from, and the git HEAD of the repo of the script
+    that builds it, so a regenerated source file or a run on another branch builds a
+    new artifact instead of linking a stale one.
+
+    Returns:
+    - tuple of the size and mtime of src_file and the git HEAD
+    """
+    exit_status, stdout, stderr = utils.exec_command(
+        ssh,
+        f"stat -L -c '%s %Y' {src_file} && "
+        f"git -C {Path(build_script).parent} rev-parse HEAD",
+    )
+    if exit_status != 0:
+        raise Exception(
+            f"Error getting the build inputs of {src_file} and {build_script}: {stderr}"
+        )
+    size, mtime, head = stdout.split()
+
+    return int(size), int(mtime), head
+
+
+def get_grid_tmp_file(cached_file):
+    """Temporary name to build cached_file under, unique to the remote shell ($$), so
+    that runs building the same artifact at once do not write over each other.
+    """
+    return f"{cached_file.with_suffix('')}.$$.tmp.nc"
+
+
+def get_cached_build_cmd(build_cmd, tmp_file, cached_file, run_file):
+    """Wrap build_cmd, which writes tmp_file, so it only runs if cached_file has not
+    been built yet, then link run_file to cached_file. Building under a temporary name
+    keeps partial files out of the cache if the command fails.
+    """
+    return (
+        f"mkdir -p {cached_file.parent} && "
+        f"if [ ! -s {cached_file} ]; then "
+        f"{{ {build_cmd} && mv {tmp_file} {cached_file}; }} "
+        f"|| {{ rm -f {tmp_file}; false; }}; "
+        f"fi && ln -sfn {cached_file} {run_file}"
+    )
+
+
 @task
 def create_first_regrid_target_file(
     ssh_username,
@@ -304,27 +389,44 @@ def create_first_regrid_target_file(
     run_name,
     step,
     resolution,
+    grid_cache_dir,
 ):
     first_regrid_target_file = project_base_dir.joinpath(
         run_name, "first_regrid_target_file.nc"
     )
 
     logger = get_run_logger()
-    logger.info(f"Creating target grid file {first_regrid_target_file}")
 
     ssh = paramiko.SSHClient()
     ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
-    # /center1/CMIP6/kmredilla/cmip6_4km_downscaling/first_regrid_target_file.nc
-    cmd = f"conda activate cmip6-utils && \
-            python {cascade_grid_script} \
-            --src_file {coords_template_file} \
-            --out_file {first_regrid_target_file} \
-            --step {step} \
-            --resolution {resolution}"
     try:
         private_key = paramiko.RSAKey(filename=ssh_private_key_path)
         ssh.connect(ssh_host, ssh_port, ssh_username, pkey=private_key)
+
+        cached_file = get_grid_cache_file(
+            grid_cache_dir,
+            "intermediate_target_grid",
+            str(coords_template_file),
+            float(step),
+            float(resolution),
+            get_grid_build_inputs(ssh, coords_template_file, cascade_grid_script),
+        )
+        tmp_file = get_grid_tmp_file(cached_file)
+        logger.info(
+            f"Linking target grid file {first_regrid_target_file} to {cached_file}"
+        )
+
+        # the grid is only built if no earlier run has built it with the same inputs
+        build_cmd = f"conda activate cmip6-utils && \
+                python {cascade_grid_script} \
+                --src_file {coords_template_file} \
+                --out_file {tmp_file} \
+                --step {step} \
+                --resolution {resolution}"
+        cmd = get_cached_build_cmd(
+            build_cmd, tmp_file, cached_file, first_regrid_target_file
+        )
         exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
         if exit_status != 0:
             raise Exception(
@@ -350,27 +452,44 @@ def create_second_regrid_target_file(
     run_name,
     step,
     resolution,
+    grid_cache_dir,
 ):
     second_regrid_target_file = project_base_dir.joinpath(
         run_name, "second_regrid_target_file.nc"
     )
 
     logger = get_run_logger()
-    logger.info(f"Creating target grid file {second_regrid_target_file}")
 
     ssh = paramiko.SSHClient()
     ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
-    # /center1/CMIP6/kmredilla/cmip6_4km_downscaling/second_regrid_target_file.nc
-    cmd = f"conda activate cmip6-utils && \
-            python {cascade_grid_script} \
-            --src_file {coords_template_file} \
-            --out_file {second_regrid_target_file} \
-            --step {step} \
-            --resolution {resolution}"
     try:
         private_key = paramiko.RSAKey(filename=ssh_private_key_path)
         ssh.connect(ssh_host, ssh_port, ssh_username, pkey=private_key)
+
+        cached_file = get_grid_cache_file(
+            grid_cache_dir,
+            "intermediate_target_grid",
+            str(coords_template_file),
+            float(step),
+            float(resolution),
+            get_grid_build_inputs(ssh, coords_template_file, cascade_grid_script),
+        )
+        tmp_file = get_grid_tmp_file(cached_file)
+        logger.info(
+            f"Linking target grid file {second_regrid_target_file} to {cached_file}"
+        )
+
+        # the grid is only built if no earlier run has built it with the same inputs
+        build_cmd = f"conda activate cmip6-utils && \
+                python {cascade_grid_script} \
+                --src_file {coords_template_file} \
+                --out_file {tmp_file} \
+                --step {step} \
+                --resolution {resolution}"
+        cmd = get_cached_build_cmd(
+            build_cmd, tmp_file, cached_file, second_regrid_target_file
+        )
         exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
         if exit_status != 0:
             raise Exception(
@@ -394,30 +513,45 @@ def create_final_regrid_target_file(
     era5_template_file,
     project_base_dir,
     run_name,
+    grid_cache_dir,
     use_default_grid=False,
 ):
     final_regrid_target_file = project_base_dir.joinpath(
         run_name, "final_regrid_target_file.nc"
     )
-
     logger = get_run_logger()
-    logger.info(f"Creating final target grid file {final_regrid_target_file}")
 
     ssh = paramiko.SSHClient()
     ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
-    if use_default_grid:
-        # Default grid files are already processed target grids (no time dimension).
-        # Copy directly to the run directory rather than running make_final_target_grid_file.py.
-        cmd = f"cp {era5_template_file} {final_regrid_target_file}"
-    else:
-        cmd = f"conda activate cmip6-utils && \
-                python {make_final_grid_script} \
-                {era5_template_file} \
-                {final_regrid_target_file}"
     try:
         private_key = paramiko.RSAKey(filename=ssh_private_key_path)
         ssh.connect(ssh_host, ssh_port, ssh_username, pkey=private_key)
+
+        cached_file = get_grid_cache_file(
+            grid_cache_dir,
+            "final_target_grid",
+            str(era5_template_file),
+            bool(use_default_grid),
+            get_grid_build_inputs(ssh, era5_template_file, make_final_grid_script),
+        )
+        tmp_file = get_grid_tmp_file(cached_file)
+        logger.info(
+            f"Linking final target grid file {final_regrid_target_file} to {cached_file}"
+        )
+
+        if use_default_grid:
+            # Default grid files are already processed target grids (no time dimension).
+            # Copy directly to the cache rather than running make_final_target_grid_file.py.
+            build_cmd = f"cp {era5_template_file} {tmp_file}"
+        else:
+            build_cmd = f"conda activate cmip6-utils && \
+                    python {make_final_grid_script} \
+                    {era5_template_file} \
+                    {tmp_file}"
+        cmd = get_cached_build_cmd(
+            build_cmd, tmp_file, cached_file, final_regrid_target_file
+        )
         exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
         if exit_status != 0:
             raise Exception(
@@ -486,18 +620,27 @@ def create_model_specific_sftlf_files(
     run_name,
     stage_name,
     models,
+    grid_cache_dir,
+    conda_env_name="cmip6-utils",
+    partition="t2small",
 ):
     """Create model-specific sftlf files for all models at a given resolution.
 
     This creates one sftlf file per model, regridded to the target grid resolution,
     to preserve model-specific land characteristics through cascade regridding.
 
+    The files are kept in the shared grid cache, keyed by the model and the target
+    grid, and linked into the sftlf directory of the run. Files missing from the
+    cache are built in parallel, as one Slurm array job with a task per model.
+
     Parameters
     ----------
     stage_name : str
         Name of the stage (e.g., 'first', 'second', 'final')
     models : str
         Space-separated list of model names
+    grid_cache_dir : str
+        Shared directory of grid artifacts
 
     Returns
     -------
@@ -507,24 +650,11 @@ def create_model_specific_sftlf_files(
     logger = get_run_logger()
     logger.info(f"Creating model-specific sftlf files for {stage_name} regrid stage")
 
-    # Import model_sftlf_lu from cmip6-utils config
-    # We'll need to read this via SSH or pass it as parameter
-    model_sftlf_lu = {
-        "GFDL-ESM4": "/beegfs/CMIP6/arctic-cmip6/CMIP6/ScenarioMIP/NOAA-GFDL/GFDL-ESM4/ssp370/r1i1p1f1/fx/sftlf/gr1/v20180701/sftlf_fx_GFDL-ESM4_ssp370_r1i1p1f1_gr1.nc",
-        "CNRM-CM6-1-HR": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/CNRM-CERFACS/CNRM-CM6-1-HR/historical/r1i1p1f2/fx/sftlf/gr/v20191021/sftlf_fx_CNRM-CM6-1-HR_historical_r1i1p1f2_gr.nc",
-        "NorESM2-MM": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/NCC/NorESM2-MM/historical/r1i1p1f1/fx/sftlf/gn/v20191108/sftlf_fx_NorESM2-MM_historical_r1i1p1f1_gn.nc",
-        "TaiESM1": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/AS-RCEC/TaiESM1/historical/r1i1p1f1/fx/sftlf/gn/v20200624/sftlf_fx_TaiESM1_historical_r1i1p1f1_gn.nc",
-        "HadGEM3-GC31-MM": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/MOHC/HadGEM3-GC31-MM/piControl/r1i1p1f1/fx/sftlf/gn/v20200108/sftlf_fx_HadGEM3-GC31-MM_piControl_r1i1p1f1_gn.nc",
-        "HadGEM3-GC31-LL": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/MOHC/HadGEM3-GC31-LL/piControl/r1i1p1f1/fx/sftlf/gn/v20190709/sftlf_fx_HadGEM3-GC31-LL_piControl_r1i1p1f1_gn.nc",
-        "MIROC6": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/MIROC/MIROC6/historical/r1i1p1f1/fx/sftlf/gn/v20190311/sftlf_fx_MIROC6_historical_r1i1p1f1_gn.nc",
-        "EC-Earth3-Veg": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/EC-Earth-Consortium/EC-Earth3-Veg/historical/r1i1p1f1/fx/sftlf/gr/v20211207/sftlf_fx_EC-Earth3-Veg_historical_r1i1p1f1_gr.nc",
-        "CESM2": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/NCAR/CESM2/historical/r11i1p1f1/fx/sftlf/gn/v20190514/sftlf_fx_CESM2_historical_r11i1p1f1_gn.nc",
-        "MPI-ESM1-2-HR": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/MPI-M/MPI-ESM1-2-HR/historical/r1i1p1f1/fx/sftlf/gn/v20190710/sftlf_fx_MPI-ESM1-2-HR_historical_r1i1p1f1_gn.nc",
-        "MRI-ESM2-0": "/beegfs/CMIP6/arctic-cmip6/CMIP6/CMIP/MRI/MRI-ESM2-0/historical/r1i1p1f1/fx/sftlf/gn/v20190603/sftlf_fx_MRI-ESM2-0_historical_r1i1p1f1_gn.nc",
-    }
-
     model_list = models.split()
     sftlf_dir = project_base_dir.joinpath(run_name, f"{stage_name}_sftlf")
+    slurm_dir = project_base_dir.joinpath(run_name, "slurm", f"{stage_name}_sftlf")
+    task_file = slurm_dir.joinpath("sftlf_files.txt")
+    sbatch_script = slurm_dir.joinpath(f"{stage_name}_sftlf.slurm")
     model_sftlf_files = {}
 
     ssh = paramiko.SSHClient()
@@ -535,38 +665,104 @@ def create_model_specific_sftlf_files(
         ssh.connect(ssh_host, ssh_port, ssh_username, pkey=private_key)
 
         # Create sftlf directory
-        utils.create_directories(ssh, [sftlf_dir])
+        utils.create_directories(ssh, [sftlf_dir, grid_cache_dir])
+
+        # the target grid of the run is a link into the grid cache, so its resolved
+        # path identifies the grid across runs
+        exit_status, stdout, stderr = utils.exec_command(
+            ssh, f"readlink -f {target_grid_file}"
+        )
+        if exit_status != 0:
+            raise Exception(f"Error resolving {target_grid_file}. Error: {stderr}")
+        resolved_target_grid_file = stdout.strip()
 
+        cached_files = {}
         for model in model_list:
             if model not in model_sftlf_lu:
                 logger.warning(f"No sftlf file available for model {model}, skipping")
                 continue
 
-            source_sftlf = model_sftlf_lu[model]
-            output_sftlf = sftlf_dir.joinpath(
-                f"{stage_name}_regrid_target_sftlf_{model}.nc"
+            cached_files[model] = get_grid_cache_file(
+                grid_cache_dir,
+                f"sftlf_{model}",
+                model_sftlf_lu[model],
+                resolved_target_grid_file,
+                get_grid_build_inputs(ssh, model_sftlf_lu[model], regrid_sftlf_script),
             )
 
-            logger.info(f"Creating sftlf for {model}")
+        cmd = "; ".join(
+            f"[ -s {cached_file} ] || echo {model}"
+            for model, cached_file in cached_files.items()
+        )
+        exit_status, stdout, stderr = utils.exec_command(ssh, cmd or "true")
+        missing_models = stdout.split()
 
-            cmd = (
-                f"conda activate cmip6-utils && "
+        if missing_models:
+            logger.info(
+                f"Building sftlf files for {len(missing_models)} models: {' '.join(missing_models)}"
+            )
+            utils.create_directories(ssh, [slurm_dir.parent, slurm_dir])
+            utils.write_remote_file(
+                ssh,
+                task_file,
+                "".join(
+                    f"{model_sftlf_lu[model]} {cached_files[model]}\n"
+                    for model in missing_models
+                ),
+            )
+            # each task line is "<source sftlf> <cached output file>"
+            command = (
+                "set -- $task; "
                 f"python {regrid_sftlf_script} "
-                f"--source_sftlf {source_sftlf} "
-                f"--target_grid {target_grid_file} "
-                f"--output_sftlf {output_sftlf}"
+                '--source_sftlf "$1" '
+                f"--target_grid {resolved_target_grid_file} "
+                '--output_sftlf "${2%.nc}.$$.tmp.nc" '
+                '&& mv "${2%.nc}.$$.tmp.nc" "$2"'
+            )
+            utils.write_remote_file(
+                ssh,
+                sbatch_script,
+                utils.build_array_sbatch_script(
+                    job_name=f"{stage_name}_sftlf",
+                    partition=partition,
+                    slurm_dir=slurm_dir,
+                    task_file=task_file,
+                    n_tasks=len(missing_models),
+                    conda_env_name=conda_env_name,
+                    command=command,
+                    time="01:00:00",
+                ),
+            )
+
+            job_ids = utils.submit_sbatch(ssh, sbatch_script)
+            try:
+                utils.wait_for_jobs_with_retry(
+                    ssh,
+                    job_ids,
+                    sbatch_script_path=sbatch_script,
+                    max_job_retries=2,
+                    retry_delay=60,
+                    exponential_backoff=True,
+                    completion_message=f"Slurm jobs for {stage_name} sftlf files complete.",
+                )
+            except Exception as e:
+                # models whose sftlf could not be built are left unmasked, as before
+                logger.error(f"Failed to create some sftlf files: {e}")
+
+        for model, cached_file in cached_files.items():
+            output_sftlf = sftlf_dir.joinpath(
+                f"{stage_name}_regrid_target_sftlf_{model}.nc"
             )
 
-            exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
+            exit_status, stdout, stderr = utils.exec_command(
+                ssh, f"[ -s {cached_file} ] && ln -sfn {cached_file} {output_sftlf}"
+            )
             if exit_status != 0:
                 logger.error(f"Failed to create sftlf for {model}: {stderr}")
                 continue
 
-            if stdout:
-                logger.info(stdout)
-
             model_sftlf_files[model] = str(output_sftlf)
-            logger.info(f"✓ Created sftlf for {model}: {output_sftlf}")
+            logger.info(f"✓ Linked sftlf for {model}: {output_sftlf} -> {cached_file}")
 
     finally:
         ssh.close()
@@ -677,6 +873,336 @@ def another_cmip6_regrid(
     return output_dir
 
 
+def list_batch_files(ssh, batch_dir, variables):
+    """List the regridding batch files in batch_dir that hold any of variables, with
+    the name of the first CMIP6 file each one lists, e.g.
+    tasmax_day_CESM2_historical_r11i1p1f1_gn_19500101-19991231.nc
+    """
+    cmd = (
+        f"for fp in {batch_dir}/*.txt; do "
+        f'[ -s "$fp" ] && echo "$fp $(basename $(head -n 1 $fp))"; '
+        "done"
+    )
+    exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
+    if exit_status != 0:
+        raise Exception(f"Error listing batch files in {batch_dir}. Error: {stderr}")
+
+    var_list = variables.split()
+    batch_files = []
+    for line in stdout.splitlines():
+        batch_file, first_file = line.split()
+        if first_file.split("_")[0] in var_list:
+            batch_files.append((batch_file, first_file))
+
+    return batch_files
+
+
+def get_batch_file_tasks(ssh, batch_dir, variables):
+    """List the regridding batch files in batch_dir that hold any of variables."""
+    return [batch_file for batch_file, _ in list_batch_files(ssh, batch_dir, variables)]
+
+
+def get_weight_batch_file_tasks(ssh, batch_dir, variables):
+    """Pick one regridding batch file per distinct set of regridding weights.
+
+    Files of a model on the same grid label share a source grid, so they share
+    weights, unless they are land variables, whose weights also depend on the
+    model-specific land mask.
+    """
+    tasks = {}
+    for batch_file, first_file in list_batch_files(ssh, batch_dir, variables):
+        var_id, _, model, _, _, grid = first_file.split("_")[:6]
+        tasks.setdefault((model, grid, var_id in cmip6.land_vars), batch_file)
+
+    return list(tasks.values())
+
+
+def upload_regridding_scripts(ssh, scripts_dir):
+    """Upload the regridding worker scripts from this repo to scripts_dir. They are
+    uploaded together because cascade_regrid.py imports regrid_weights.py.
+    """
+    for script in ["cascade_regrid.py", "regrid_weights.py"]:
+        utils.upload_file(
+            ssh,
+            Path(__file__).parents[1].joinpath("regridding", script),
+            scripts_dir.joinpath(script),
+        )
+
+
+@flow
+def generate_regrid_weights(
+    ssh_username,
+    ssh_private_key_path,
+    conda_env_name,
+    partition,
+    working_dir,
+    batch_dir,
+    target_grid_files,
+    sftlf_files,
+    interp_method,
+    variables,
+    weights_dir,
+    max_parallel_tasks=None,
+):
+    """Build the regridding weights for every cascade stage once, ahead of regridding.
+
+    Runs regridding/regrid_weights.py from this repo as one Slurm array job with a
+    task per distinct model grid (and land mask, for land variables). Weights are
+    written to weights_dir keyed by the grids, interpolation method and mask, so
+    they are reused by later runs, and the regridding workers only apply them.
+
+    Only the fused regrid (regridding/cascade_regrid.py) reads this cache. Its
+    workers would also fill the cache themselves, but every array task of a model
+    starts at once, so without this step each of them computes the same weights.
+    The staged regrid runs the cmip6-utils regrid scripts, which have no weights
+    option and still compute their weights in every task.
+
+    Parameters
+    ----------
+    target_grid_files : list
+        Target grid files for each cascade stage, in order
+    sftlf_files : list
+        Land fraction files for each cascade stage, in order, with {model} in place
+        of the model name
+    weights_dir : str
+        Shared directory of regridding weights
+    """
+    logger = get_run_logger()
+    logger.info(f"Generating regridding weights in {weights_dir}")
+
+    working_dir = Path(working_dir)
+    slurm_dir = working_dir.joinpath("slurm", "regrid_weights")
+    scripts_dir = working_dir.joinpath("scripts")
+    worker_script = scripts_dir.joinpath("regrid_weights.py")
+    task_file = slurm_dir.joinpath("batch_files.txt")
+    sbatch_script = slurm_dir.joinpath("regrid_weights.slurm")
+
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    try:
+        private_key = paramiko.RSAKey(filename=ssh_private_key_path)
+        ssh.connect(ssh_host, ssh_port, ssh_username, pkey=private_key)
+
+        utils.create_directories(
+            ssh, [slurm_dir.parent, slurm_dir, scripts_dir, weights_dir]
+        )
+        upload_regridding_scripts(ssh, scripts_dir)
+
+        batch_files = get_weight_batch_file_tasks(ssh, batch_dir, variables)
+        if not batch_files:
+            raise Exception(f"No batch files found in {batch_dir} for {variables}")
+        utils.write_remote_file(ssh, task_file, "\n".join(batch_files) + "\n")
+
+        mask_variables = " ".join(cmip6.land_vars)
+        command = (
+            f'python {worker_script} --batch_file "$task" '
+            f"--target_grid_files {' '.join(str(fp) for fp in target_grid_files)} "
+            f"--sftlf_files {' '.join(str(fp) for fp in sftlf_files)} "
+            f"--interp_method {interp_method} "
+            f"--mask_variables '{mask_variables}' "
+            f"--weights_dir {weights_dir}"
+        )
+        utils.write_remote_file(
+            ssh,
+            sbatch_script,
+            utils.build_array_sbatch_script(
+                job_name="regrid_weights",
+                partition=partition,
+                slurm_dir=slurm_dir,
+                task_file=task_file,
+                n_tasks=len(batch_files),
+                conda_env_name=conda_env_name,
+                command=command,
+                max_parallel_tasks=max_parallel_tasks,
+                time="04:00:00",
+            ),
+        )
+
+        job_ids = utils.submit_sbatch(ssh, sbatch_script)
+        logger.info(
+            f"Regridding weight job submitted for {len(batch_files)} model grids! (job ID: {job_ids[0]})"
+        )
+
+        # Use retry logic to handle intermittent 0:53 errors
+        utils.wait_for_jobs_with_retry(
+            ssh,
+            job_ids,
+            sbatch_script_path=sbatch_script,
+            max_job_retries=3,
+            retry_delay=60,
+            exponential_backoff=True,
+            completion_message="Slurm jobs for regridding weights complete.",
+        )
+
+    finally:
+        ssh.close()
+
+    return weights_dir
+
+
+@flow
+def fused_cmip6_regrid(
+    ssh_username,
+    ssh_private_key_path,
+    conda_env_name,
+    partition,
+    working_dir,
+    batch_dir,
+    target_grid_files,
+    sftlf_files,
+    interp_method,
+    variables,
+    out_dir_name="final_regrid",
+    weights_dir=None,
+    output_format="netcdf",
+    tile_size=32,
+    max_parallel_tasks=None,
+    derive_dtr=False,
+):
+    """Regrid raw CMIP6 data through all cascade stages in a single pass.
+
+    Runs regridding/cascade_regrid.py from this repo as one Slurm array job with a
+    task per batch file. Each task applies every stage in memory and only writes the
+    final grid, so there are no intermediate first_regrid/second_regrid directories.
+
+    With output_format="zarr", the final grid is written as Zarr instead of NetCDF:
+    one time-chunked store per year, which a second array job (rechunk_zarr.py) joins
+    into one consolidated <var>_<model>_<scenario>.zarr store per variable, model and
+    scenario in out_dir_name, chunked for bias adjustment (full time series in each
+    chunk, spatial tiles of tile_size cells). This replaces convert_cmip6_to_zarr.
+
+    Parameters
+    ----------
+    target_grid_files : list
+        Target grid files for each cascade stage, in order
+    sftlf_files : list
+        Land fraction files for each cascade stage, in order, with {model} in place
+        of the model name. Used to mask ocean cells of land variables after each stage.
+    weights_dir : str, optional
+        Shared cache of regridding weights built by generate_regrid_weights
+    output_format : str
+        "netcdf" or "zarr"
+    derive_dtr : bool
+        Derive dtr from the tasmax files and the matching tasmin files of the batch
+        files in the tasks for tasmax, instead of regridding a separate DTR archive
+    """
+    logger = get_run_logger()
+    logger.info(
+        f"Regridding CMIP6 data in a single pass through {len(target_grid_files)} cascade stages"
+    )
+
+    working_dir = Path(working_dir)
+    slurm_dir = working_dir.joinpath("slurm", "fused_regrid")
+    scripts_dir = working_dir.joinpath("scripts")
+    output_dir = working_dir.joinpath(out_dir_name)
+    # zarr output is written per year first, then rechunked into output_dir
+    regrid_dir = (
+        working_dir.joinpath("fused_zarr_tmp")
+        if output_format == "zarr"
+        else output_dir
+    )
+    worker_script = scripts_dir.joinpath("cascade_regrid.py")
+    task_file = slurm_dir.joinpath("batch_files.txt")
+    sbatch_script = slurm_dir.joinpath("fused_regrid.slurm")
+
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    try:
+        private_key = paramiko.RSAKey(filename=ssh_private_key_path)
+        ssh.connect(ssh_host, ssh_port, ssh_username, pkey=private_key)
+
+        utils.create_directories(
+            ssh, [slurm_dir.parent, slurm_dir, scripts_dir, output_dir, regrid_dir]
+        )
+        upload_regridding_scripts(ssh, scripts_dir)
+
+        batch_files = get_batch_file_tasks(ssh, batch_dir, variables)
+        if not batch_files:
+            raise Exception(f"No batch files found in {batch_dir} for {variables}")
+        utils.write_remote_file(ssh, task_file, "\n".join(batch_files) + "\n")
+
+        mask_variables = " ".join(cmip6.land_vars)
+        command = (
+            f'python {worker_script} --batch_file "$task" '
+            f"--target_grid_files {' '.join(str(fp) for fp in target_grid_files)} "
+            f"--sftlf_files {' '.join(str(fp) for fp in sftlf_files)} "
+            f"--interp_method {interp_method} "
+            f"--mask_variables '{mask_variables}' "
+            f"--output_dir {regrid_dir} "
+            f"--output_format {output_format} "
+            f"--tile_size {tile_size}"
+        )
+        if weights_dir:
+            command += f" --weights_dir {weights_dir}"
+        if derive_dtr:
+            command += " --derive_dtr"
+        utils.write_remote_file(
+            ssh,
+            sbatch_script,
+            utils.build_array_sbatch_script(
+                job_name="fused_regrid",
+                partition=partition,
+                slurm_dir=slurm_dir,
+                task_file=task_file,
+                n_tasks=len(batch_files),
+                conda_env_name=conda_env_name,
+                command=command,
+                max_parallel_tasks=max_parallel_tasks,
+            ),
+        )
+
+        job_ids = utils.submit_sbatch(ssh, sbatch_script)
+        logger.info(
+            f"Fused CMIP6 regridding job submitted for {len(batch_files)} batch files! (job ID: {job_ids[0]})"
+        )
+
+        # Use retry logic to handle intermittent 0:53 errors
+        utils.wait_for_jobs_with_retry(
+            ssh,
+            job_ids,
+            sbatch_script_path=sbatch_script,
+            max_job_retries=3,
+            retry_delay=60,
+            exponential_backoff=True,
+            completion_message="Slurm jobs for fused cascade regridding complete.",
+        )
+
+        if output_format == "zarr":
+            exit_status, stdout, stderr = utils.exec_command(
+                ssh, f"ls -d {regrid_dir}/*/ | xargs -n 1 basename"
+            )
+            if exit_status != 0:
+                raise Exception(f"Error listing {regrid_dir}. Error: {stderr}")
+            store_names = stdout.split()
+
+            rechunk_tasks.run_rechunk_zarr(
+                ssh,
+                working_dir,
+                job_name="fused_rechunk",
+                tasks=[
+                    (
+                        regrid_dir.joinpath(store_name, "*.zarr"),
+                        output_dir.joinpath(f"{store_name}.zarr"),
+                    )
+                    for store_name in store_names
+                ],
+                conda_env_name=conda_env_name,
+                partition=partition,
+                tile_size=tile_size,
+                max_parallel_tasks=max_parallel_tasks,
+            )
+
+            # the per-year stores are only an intermediate step
+            utils.exec_command(ssh, f"rm -rf {regrid_dir}")
+
+    finally:
+        ssh.close()
+
+    return output_dir
+
+
 @task
 def create_remote_directories(ssh_username, ssh_private_key_path, directories):
     """Create directories on the remote server. This will be the working directory and slurm directory."""
@@ -796,9 +1322,32 @@ def downscale_cmip6(
     second_regrid_linspace_step,
     resolution,
     final_grid_template_file="",
+    cascade_mode="staged",
+    regrid_weights_dir="",
+    grid_cache_dir="",
+    regrid_output_format="netcdf",
+    zarr_streaming_rechunk=False,
+    zarr_memory_budget_gb=8,
+    size_training_resources=False,
+    training_partitions="",
+    trained_registry_dir="",
+    fuse_dtr=False,
 ):
     logger = get_run_logger()
 
+    if cascade_mode not in ("staged", "fused"):
+        raise ValueError(
+            f"Unknown cascade_mode {cascade_mode}, expected 'staged' or 'fused'"
+        )
+    if regrid_output_format not in ("netcdf", "zarr"):
+        raise ValueError(
+            f"Unknown regrid_output_format {regrid_output_format}, expected 'netcdf' or 'zarr'"
+        )
+    if regrid_output_format == "zarr" and cascade_mode != "fused":
+        raise ValueError('regrid_output_format="zarr" requires cascade_mode="fused"')
+    if fuse_dtr and cascade_mode != "fused":
+        raise ValueError('fuse_dtr=True requires cascade_mode="fused"')
+
     reference_dir = Path(reference_dir)
     cmip6_dir = Path(cmip6_dir)
     project_base_dir = Path(project_base_dir)
@@ -819,6 +1368,14 @@ def downscale_cmip6(
             f"No final_grid_template_file specified; using default: {final_grid_template_file}"
         )
 
+    # regridding weights only depend on the grids, so they are shared by every run
+    if not regrid_weights_dir:
+        regrid_weights_dir = project_base_dir.joinpath("regrid_weights")
+
+    # target grid and sftlf files only depend on their inputs, so they are shared too
+    if not grid_cache_dir:
+        grid_cache_dir = project_base_dir.joinpath("grid_cache")
+
     flow_steps_list = flow_steps.split()
 
     # this creates the maing working directory
@@ -926,7 +1483,8 @@ def downscale_cmip6(
 
     # Check if DTR processing is needed
     var_list = cmip6.validate_vars(variables, return_list=True)
-    needs_dtr = "dtr" in var_list
+    # with fuse_dtr, DTR is derived by the fused regrid, no DTR archive is written
+    needs_dtr = "dtr" in var_list and not fuse_dtr
     needs_era5_dtr = "dtr" in var_list or "tasmin" in var_list
 
     ### CMIP6 DTR processing
@@ -986,7 +1544,7 @@ def downscale_cmip6(
             logger=logger,
         )
 
-    ### Regridding 1: Regrid CMIP6 data to intermediate grid
+    ### Cascade target grids: create the target grid files for every regrid stage
     # first, run the task to create the intermediate target grid file
     cascade_grid_script = project_base_dir.joinpath(
         repo_name, "downscaling", "make_intermediate_target_grid_file.py"
@@ -1001,6 +1559,7 @@ def downscale_cmip6(
         "run_name": run_name,
         "step": first_regrid_linspace_step,
         "resolution": resolution,
+        "grid_cache_dir": grid_cache_dir,
     }
 
     if flow_steps == "all" or "create_first_regrid_target_file" in flow_steps_list:
@@ -1027,37 +1586,14 @@ def downscale_cmip6(
             run_name=run_name,
             stage_name="first",
             models=models,
+            grid_cache_dir=grid_cache_dir,
+            conda_env_name=conda_env_name,
+            partition=partition,
         )
     else:
         first_model_sftlf_files = {}  # Will be discovered from directory
 
-    first_regrid_out_dir_name = "first_regrid"
-    first_regrid_kwargs = base_kwargs.copy()
-    regrid_variables = get_regrid_variables(variables)
-
-    # if variable is snw, use conservative interpolation, otherwise bilinear
-    interp_method = "conservative" if "snw" in regrid_variables else "bilinear"
-    logger.info(f"Using interpolation method '{interp_method}' for regridding.")
-    
-    first_regrid_kwargs.update(
-        {
-            "cmip6_dir": cmip6_dir,
-            "target_grid_file": first_cascade_target_file,
-            "interp_method": interp_method,
-            "out_dir_name": first_regrid_out_dir_name,
-            "freqs": "day",
-            "rasdafy": False,
-            "no_clobber": False,
-            "variables": regrid_variables,
-        }
-    )
-
-    if flow_steps == "all" or "first_cmip6_regrid" in flow_steps_list:
-        first_regrid_dir = regrid_cmip6(**first_regrid_kwargs)
-    else:
-        first_regrid_dir = f"{project_base_dir}/{run_name}/{first_regrid_out_dir_name}"
-
-    second_regrid_kwargs = {
+    second_grid_kwargs = {
         "ssh_username": ssh_username,
         "ssh_private_key_path": ssh_private_key_path,
         "cascade_grid_script": cascade_grid_script,
@@ -1066,11 +1602,12 @@ def downscale_cmip6(
         "run_name": run_name,
         "step": second_regrid_linspace_step,
         "resolution": resolution,
+        "grid_cache_dir": grid_cache_dir,
     }
 
     if flow_steps == "all" or "create_second_regrid_target_file" in flow_steps_list:
         second_cascade_target_file = create_second_regrid_target_file(
-            **second_regrid_kwargs
+            **second_grid_kwargs
         )
     else:
         second_cascade_target_file = (
@@ -1088,39 +1625,13 @@ def downscale_cmip6(
             run_name=run_name,
             stage_name="second",
             models=models,
+            grid_cache_dir=grid_cache_dir,
+            conda_env_name=conda_env_name,
+            partition=partition,
         )
     else:
         second_model_sftlf_files = {}
 
-    regrid_again_script = project_base_dir.joinpath(
-        repo_name, "regridding", "run_regrid_again.py"
-    )
-    regrid_script = project_base_dir.joinpath(repo_name, "regridding", "regrid.py")
-
-    second_regrid_out_dir_name = "second_regrid"
-    second_regrid_kwargs = {
-        "ssh_username": ssh_username,
-        "ssh_private_key_path": ssh_private_key_path,
-        "conda_env_name": conda_env_name,
-        "partition": partition,
-        "launcher_script": regrid_again_script,
-        "regrid_script": regrid_script,
-        "interp_method": interp_method,
-        "target_grid_file": second_cascade_target_file,
-        "working_dir": working_dir,
-        "regridded_dir": first_regrid_dir,
-        "out_dir_name": second_regrid_out_dir_name,
-        "stage": "second",
-        "sftlf_dir": project_base_dir.joinpath(run_name, "second_sftlf"),
-    }
-
-    if flow_steps == "all" or "second_cmip6_regrid" in flow_steps_list:
-        second_regrid_dir = another_cmip6_regrid(**second_regrid_kwargs)
-    else:
-        second_regrid_dir = (
-            f"{project_base_dir}/{run_name}/{second_regrid_out_dir_name}"
-        )
-
     # Create final target grid file from ERA5 template
     make_final_grid_script = project_base_dir.joinpath(
         repo_name, "downscaling", "make_final_target_grid_file.py"
@@ -1134,6 +1645,7 @@ def downscale_cmip6(
         "project_base_dir": project_base_dir,
         "run_name": run_name,
         "use_default_grid": use_default_grid,
+        "grid_cache_dir": grid_cache_dir,
     }
 
     if flow_steps == "all" or "create_final_regrid_target_file" in flow_steps_list:
@@ -1154,10 +1666,108 @@ def downscale_cmip6(
             run_name=run_name,
             stage_name="final",
             models=models,
+            grid_cache_dir=grid_cache_dir,
+            conda_env_name=conda_env_name,
+            partition=partition,
         )
     else:
         final_model_sftlf_files = {}
 
+    regrid_variables = get_regrid_variables(variables)
+
+    # if variable is snw, use conservative interpolation, otherwise bilinear
+    interp_method = "conservative" if "snw" in regrid_variables else "bilinear"
+    logger.info(f"Using interpolation method '{interp_method}' for regridding.")
+    
+    cascade_target_files = [
+        first_cascade_target_file,
+        second_cascade_target_file,
+        final_cascade_target_file,
+    ]
+    cascade_sftlf_files = [
+        working_dir.joinpath(
+            f"{stage}_sftlf", f"{stage}_regrid_target_sftlf_{{model}}.nc"
+        )
+        for stage in ["first", "second", "final"]
+    ]
+
+    ### Regridding weights: computed once per model grid and stage, shared across runs
+    regrid_weights_kwargs = {
+        "ssh_username": ssh_username,
+        "ssh_private_key_path": ssh_private_key_path,
+        "conda_env_name": conda_env_name,
+        "partition": partition,
+        "working_dir": working_dir,
+        "batch_dir": batch_files_dir,
+        "target_grid_files": cascade_target_files,
+        "sftlf_files": cascade_sftlf_files,
+        "interp_method": interp_method,
+        "variables": regrid_variables,
+        "weights_dir": regrid_weights_dir,
+    }
+
+    # only the fused regrid reads cached weights. The staged regrid is unchanged:
+    # the cmip6-utils scripts it runs have no weights option and compute their own
+    if cascade_mode == "fused" and (
+        flow_steps == "all" or "generate_regrid_weights" in flow_steps_list
+    ):
+        generate_regrid_weights(**regrid_weights_kwargs)
+
+    ### Regridding 1: Regrid CMIP6 data to intermediate grid
+    first_regrid_out_dir_name = "first_regrid"
+    first_regrid_kwargs = base_kwargs.copy()
+    first_regrid_kwargs.update(
+        {
+            "cmip6_dir": cmip6_dir,
+            "target_grid_file": first_cascade_target_file,
+            "interp_method": interp_method,
+            "out_dir_name": first_regrid_out_dir_name,
+            "freqs": "day",
+            "rasdafy": False,
+            "no_clobber": False,
+            "variables": regrid_variables,
+        }
+    )
+
+    # in fused mode all stages are applied by fused_cmip6_regrid below
+    if cascade_mode == "staged" and (
+        flow_steps == "all" or "first_cmip6_regrid" in flow_steps_list
+    ):
+        first_regrid_dir = regrid_cmip6(**first_regrid_kwargs)
+    else:
+        first_regrid_dir = f"{project_base_dir}/{run_name}/{first_regrid_out_dir_name}"
+
+    regrid_again_script = project_base_dir.joinpath(
+        repo_name, "regridding", "run_regrid_again.py"
+    )
+    regrid_script = project_base_dir.joinpath(repo_name, "regridding", "regrid.py")
+
+    second_regrid_out_dir_name = "second_regrid"
+    second_regrid_kwargs = {
+        "ssh_username": ssh_username,
+        "ssh_private_key_path": ssh_private_key_path,
+        "conda_env_name": conda_env_name,
+        "partition": partition,
+        "launcher_script": regrid_again_script,
+        "regrid_script": regrid_script,
+        "interp_method": interp_method,
+        "target_grid_file": second_cascade_target_file,
+        "working_dir": working_dir,
+        "regridded_dir": first_regrid_dir,
+        "out_dir_name": second_regrid_out_dir_name,
+        "stage": "second",
+        "sftlf_dir": project_base_dir.joinpath(run_name, "second_sftlf"),
+    }
+
+    if cascade_mode == "staged" and (
+        flow_steps == "all" or "second_cmip6_regrid" in flow_steps_list
+    ):
+        second_regrid_dir = another_cmip6_regrid(**second_regrid_kwargs)
+    else:
+        second_regrid_dir = (
+            f"{project_base_dir}/{run_name}/{second_regrid_out_dir_name}"
+        )
+
     final_regrid_out_dir_name = "final_regrid"
     final_regrid_kwargs = {
         "ssh_username": ssh_username,
@@ -1175,8 +1785,39 @@ def downscale_cmip6(
         "sftlf_dir": project_base_dir.joinpath(run_name, "final_sftlf"),
     }
 
-    if flow_steps == "all" or "final_cmip6_regrid" in flow_steps_list:
+    fused_regrid_kwargs = {
+        "ssh_username": ssh_username,
+        "ssh_private_key_path": ssh_private_key_path,
+        "conda_env_name": conda_env_name,
+        "partition": partition,
+        "working_dir": working_dir,
+        "batch_dir": batch_files_dir,
+        "target_grid_files": cascade_target_files,
+        "sftlf_files": cascade_sftlf_files,
+        "interp_method": interp_method,
+        "variables": regrid_variables,
+        "out_dir_name": final_regrid_out_dir_name,
+        "weights_dir": regrid_weights_dir,
+        "output_format": regrid_output_format,
+    }
+    if fuse_dtr and "dtr" in var_list:
+        # dtr is derived from tasmax and tasmin by the tasks for tasmax
+        fused_regrid_kwargs["variables"] = " ".join(
+            v for v in regrid_variables.split() if v != "dtr"
+        )
+        fused_regrid_kwargs["derive_dtr"] = True
+    if regrid_output_format == "zarr":
+        # the fused regrid writes the Zarr stores for bias adjustment directly
+        fused_regrid_kwargs["out_dir_name"] = "cmip6_zarr"
+
+    if cascade_mode == "staged" and (
+        flow_steps == "all" or "final_cmip6_regrid" in flow_steps_list
+    ):
         final_regrid_dir = another_cmip6_regrid(**final_regrid_kwargs)
+    elif cascade_mode == "fused" and (
+        flow_steps == "all" or "fused_cmip6_regrid" in flow_steps_list
+    ):
+        final_regrid_dir = fused_cmip6_regrid(**fused_regrid_kwargs)
     else:
         final_regrid_dir = f"{project_base_dir}/{run_name}/final_regrid"
 
@@ -1230,6 +1871,8 @@ def downscale_cmip6(
         variables=era5_vars,
         netcdf_dir=reference_dir,
         resolution=resolution,
+        streaming_rechunk=zarr_streaming_rechunk,
+        memory_budget_gb=zarr_memory_budget_gb,
     )
     del convert_era5_to_zarr_kwargs["models"]
     del convert_era5_to_zarr_kwargs["scenarios"]
@@ -1245,9 +1888,14 @@ def downscale_cmip6(
     convert_cmip6_to_zarr_kwargs["variables"] = conversion_vars
     convert_cmip6_to_zarr_kwargs.update(
         netcdf_dir=final_regrid_dir,
+        streaming_rechunk=zarr_streaming_rechunk,
+        memory_budget_gb=zarr_memory_budget_gb,
     )
 
-    if flow_steps == "all" or "convert_cmip6_to_zarr" in flow_steps_list:
+    # with Zarr regrid output the stores are already in cmip6_zarr
+    if regrid_output_format == "netcdf" and (
+        flow_steps == "all" or "convert_cmip6_to_zarr" in flow_steps_list
+    ):
         cmip6_zarr_dir = convert_cmip6_to_zarr(**convert_cmip6_to_zarr_kwargs)
     else:
         cmip6_zarr_dir = f"{project_base_dir}/{run_name}/cmip6_zarr"
@@ -1261,6 +1909,9 @@ def downscale_cmip6(
         {
             "sim_dir": cmip6_zarr_dir,
             "ref_dir": ref_zarr_dir,
+            "size_resources": size_training_resources,
+            "partitions": training_partitions,
+            "trained_registry_dir": trained_registry_dir,
         }
     )
 
@@ -1324,6 +1975,29 @@ if __name__ == "__main__":
     first_regrid_linspace_step = 0.5
     second_regrid_linspace_step = 0.25
     resolution = 4
+    # "staged" writes every cascade regrid stage to disk with separate Slurm jobs,
+    # "fused" applies all stages in memory and only writes the final grid
+    cascade_mode = "staged"
+    # shared cache of regridding weights, empty → <project_base_dir>/regrid_weights
+    regrid_weights_dir = ""
+    # shared cache of target grid and sftlf files, empty → <project_base_dir>/grid_cache
+    grid_cache_dir = ""
+    # "zarr" (cascade_mode="fused" only) writes the Zarr stores for bias adjustment
+    # directly from the fused regrid, and skips convert_cmip6_to_zarr
+    regrid_output_format = "netcdf"
+    # rechunk NetCDF data into Zarr in two phases through an intermediate store, with
+    # at most zarr_memory_budget_gb GB of memory per store (convert_*_to_zarr steps)
+    zarr_streaming_rechunk = False
+    zarr_memory_budget_gb = 8
+    # size each training job from its Zarr stores and the usage history of earlier
+    # jobs, and spread them over training_partitions (empty → partition)
+    size_training_resources = False
+    training_partitions = ""
+    # shared registry of trained datasets, empty → <project_base_dir>/trained_registry
+    trained_registry_dir = ""
+    # derive DTR inside the fused regrid from tasmax and tasmin, instead of writing
+    # and regridding a separate CMIP6 DTR archive (cascade_mode="fused" only)
+    fuse_dtr = False
 
     # If not "all", specify any of these flow steps as a space-separated string:
     # - create_remote_directories
@@ -1331,11 +2005,13 @@ if __name__ == "__main__":
     # - generate_batch_files
     # - process_dtr
     # - create_first_regrid_target_file
-    # - first_cmip6_regrid
     # - create_second_regrid_target_file
-    # - second_cmip6_regrid
     # - create_final_regrid_target_file
+    # - generate_regrid_weights
+    # - first_cmip6_regrid
+    # - second_cmip6_regrid
     # - final_cmip6_regrid
+    # - fused_cmip6_regrid (cascade_mode="fused" only, replaces the three regrid steps)
     # - process_era5_dtr
     # - ensure_reference_data_in_scratch
     # - convert_era5_to_zarr
@@ -1366,6 +2042,16 @@ if __name__ == "__main__":
         "first_regrid_linspace_step": first_regrid_linspace_step,
         "second_regrid_linspace_step": second_regrid_linspace_step,
         "resolution": resolution,
+        "cascade_mode": cascade_mode,
+        "regrid_weights_dir": regrid_weights_dir,
+        "grid_cache_dir": grid_cache_dir,
+        "regrid_output_format": regrid_output_format,
+        "zarr_streaming_rechunk": zarr_streaming_rechunk,
+        "zarr_memory_budget_gb": zarr_memory_budget_gb,
+        "size_training_resources": size_training_resources,
+        "training_partitions": training_partitions,
+        "trained_registry_dir": trained_registry_dir,
+        "fuse_dtr": fuse_dtr,
     }
     downscale_cmip6.serve(
         name="downscale-cmip6",
@@ -0,0 +1,818 @@
+"""Flow for planning a downscale_cmip6 run: a dry run that estimates the cost of each
+stage before anything is submitted.
+
+Notes:
+The flow takes the same data and regridding parameters as downscale_cmip6, and only
+reads from the remote. It walks the raw CMIP6 inventory and the ERA5 reference data
+for the requested variables, models and scenarios, and estimates for every stage that
+the run would execute:
+    - the number of Slurm tasks and input files
+    - the volume read and written, in GB
+    - the core-hours and wall time
+    - the storage used by the run directory after the stage, and its peak
+
+Volumes are estimated from the size of the raw files on disk, scaled by the number of
+grid cells of each target grid relative to the native grid of each model. The grid
+sizes come from the target grid files (the cached intermediate grids if an earlier run
+built them, otherwise the final grid extent at the linspace step) and the ERA5 grid.
+
+The cost of a stage is its volume times a throughput coefficient, in CPU seconds per
+GB of output on disk (per GB of uncompressed input for training, as recorded by
+bias_adjust.resource_sizing). Coefficients start from rough defaults, and are learned
+from past runs:
+    - calibration_runs: working directories of past runs. The Slurm job IDs of every
+      stage are read from the log file names in <run>/slurm, their CPU time from
+      sacct, and their output volume from du. The results are recorded in the
+      stage_runs table of the resource history, so each run only needs calibrating once
+    - the jobs table of the resource history, for training jobs sized by
+      train_bias_adjustment
+
+Wall time assumes the tasks of a stage run max_cores cores at a time at most, and does
+not include time spent in the Slurm queue.
+"""
+
+import json
+import math
+import re
+from datetime import datetime
+from pathlib import Path
+
+import paramiko
+from prefect import flow
+from prefect.artifacts import create_table_artifact
+
+from utils import utils
+from utils import cmip6
+from bias_adjust import resource_sizing
+from bias_adjust.train_bias_adjustment import resource_stage as train_resource_stage
+from downscaling.convert_era5_to_zarr import default_start_year, default_end_year
+from downscaling.downscale_cmip6 import (
+    get_batch_file_variables,
+    get_grid_build_inputs,
+    get_grid_cache_file,
+    get_processing_variables,
+    get_regrid_variables,
+    get_zarr_conversion_variables,
+)
+
+# Define your SSH parameters
+ssh_host = "chinook04.rcs.alaska.edu"
+ssh_port = 22
+
+# CPU seconds per GB of output on disk (per GB of uncompressed input for training),
+# used until a stage has been calibrated, and the cores used by each task
+default_coefficients = {
+    "process_dtr": (60, 1),
+    "first_regrid": (120, 1),
+    "second_regrid": (120, 1),
+    "final_regrid": (120, 1),
+    "fused_regrid": (200, 1),
+    "fused_rechunk": (60, 1),
+    "process_era5_dtr": (60, 1),
+    "convert_era5_to_zarr": (60, 1),
+    "convert_cmip6_to_zarr": (60, 1),
+    "train_bias_adjustment": (300, 1),
+    "bias_adjustment": (300, 1),
+    "derive_cmip6_tasmin": (30, 1),
+}
+
+# Where the Slurm logs of each stage are written, as prefixes of their path relative to
+# <run>/slurm, and the output directories of each stage relative to the run. The first
+# output directory that is not empty is used. Training is learned from the resource
+# history instead.
+stage_sources = {
+    "process_dtr": (["process_cmip6_dtr"], ["cmip6_dtr"]),
+    "first_regrid": (["first_regrid"], ["first_regrid"]),
+    "second_regrid": (["second_regrid"], ["second_regrid"]),
+    "final_regrid": (["final_regrid"], ["final_regrid"]),
+    "fused_regrid": (["fused_regrid"], ["final_regrid", "cmip6_zarr"]),
+    "fused_rechunk": (["fused_rechunk"], ["cmip6_zarr"]),
+    "process_era5_dtr": (["process_era5_dtr", "era5_dtr"], ["ref_netcdf/dtr"]),
+    "convert_era5_to_zarr": (["era5_rechunk", "convert_era5"], ["era5_zarr"]),
+    "convert_cmip6_to_zarr": (["cmip6_rechunk", "convert_cmip6"], ["cmip6_zarr"]),
+    "bias_adjustment": (["bias_adjust", "adjust"], ["adjusted"]),
+    "derive_cmip6_tasmin": (["derive_tasmin"], ["adjusted/tasmin_*"]),
+}
+
+# Slurm log names end with the job ID, and the array task ID for array jobs,
+# e.g. fused_regrid_123456_7.out
+log_job_id_pattern = re.compile(r"_(\d+)(?:_\d+)?\.out$")
+
+# ERA5 variable missing from the reference data
+no_files = {"files": 0, "bytes": 0, "range_files": 0, "range_bytes": 0}
+
+# Inline python run on the remote to walk the raw CMIP6 inventory and the ERA5
+# reference data, and read the size of each grid, without loading any data.
+# For each variable, model and scenario, the member and grid with the most files and
+# the latest version are used, as one set of files is regridded per model.
+inventory_script = """
+import glob, json, math, os, re, sys
+from datetime import datetime
+import xarray as xr
+args = json.loads(sys.argv[1])
+
+def get_grid(fp):
+    with xr.open_dataset(fp, decode_times=False) as ds:
+        if "lat" in ds.variables and "lon" in ds.variables:
+            dims = set(ds["lat"].dims) | set(ds["lon"].dims)
+            grid = {"lat": [float(ds["lat"].min()), float(ds["lat"].max())], "lon": [float(ds["lon"].min()), float(ds["lon"].max())]}
+        else:
+            var = [v for v in ds.data_vars.values() if v.ndim >= 2][0]
+            dims = [dim for dim in var.dims if dim != "time"]
+            grid = {}
+        grid["cells"] = math.prod(ds.sizes[dim] for dim in dims)
+    return grid
+
+def get_days(dates):
+    start, end = [datetime.strptime(date[:8], "%Y%m%d") for date in dates.split("-")]
+    return (end - start).days + 1
+
+cmip6 = []
+native_grids = {}
+for var_id in args["variables"]:
+    sets = {}
+    for fp in glob.glob(os.path.join(args["cmip6_dir"], "*", "*", "*", "*", "*", "day", var_id, "*", "*", var_id + "_day_*.nc")):
+        parts = os.path.basename(fp)[:-3].split("_")
+        if len(parts) != 7 or parts[2] not in args["models"] or parts[3] not in args["scenarios"]:
+            continue
+        key = (parts[2], parts[3])
+        sets.setdefault(key, {}).setdefault((parts[4], parts[5], fp.split("/")[-2]), []).append(fp)
+    for (model, scenario), file_sets in sorted(sets.items()):
+        (member, grid, version), files = max(file_sets.items(), key=lambda item: (len(item[1]), item[0][2]))
+        if (model, grid) not in native_grids:
+            native_grids[(model, grid)] = get_grid(files[0])["cells"]
+        cmip6.append({"variable": var_id, "model": model, "scenario": scenario, "files": len(files), "bytes": sum(os.path.getsize(fp) for fp in files), "days": sum(get_days(os.path.basename(fp)[:-3].split("_")[6]) for fp in files), "cells": native_grids[(model, grid)]})
+
+def get_year(fp):
+    match = re.search("_([0-9]{4})_", os.path.basename(fp))
+    return int(match.group(1)) if match else None
+
+era5 = {}
+for var_id in args["era5_variables"]:
+    files = sorted(glob.glob(os.path.join(args["reference_dir"], var_id, "*.nc")))
+    in_range = [fp for fp in files if get_year(fp) and args["start_year"] <= get_year(fp) <= args["end_year"]]
+    era5[var_id] = {"files": len(files), "bytes": sum(os.path.getsize(fp) for fp in files), "range_files": len(in_range), "range_bytes": sum(os.path.getsize(fp) for fp in in_range)}
+
+grids = {fp: get_grid(fp) if os.path.exists(fp) else None for fp in args["grid_files"]}
+print(json.dumps({"cmip6": cmip6, "era5": era5, "grids": grids}))
+"""
+
+
+def get_inventory(ssh, conda_env_name, inventory_args):
+    """Run the inventory script on the remote.
+
+    Returns:
+    - dict with the cmip6 file sets, the era5 variables and the grids
+    """
+    cmd = (
+        f"conda activate {conda_env_name}; "
+        f"python -c '{inventory_script}' '{json.dumps(inventory_args)}'"
+    )
+    exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
+    if exit_status != 0:
+        raise Exception(f"Error walking the CMIP6 inventory. Error: {stderr}")
+
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def get_intermediate_cells(grid, final_grid, step):
+    """Number of cells of an intermediate grid, from its grid file if it has been built,
+    or from the lat/lon extent of the final grid at the linspace step otherwise.
+    """
+    if grid:
+        return grid["cells"]
+    if not final_grid or "lat" not in final_grid:
+        raise ValueError(
+            "Neither the intermediate grid file nor the lat/lon extent of the final "
+            "grid is available to estimate the size of the intermediate grid"
+        )
+    (lat_min, lat_max), (lon_min, lon_max) = final_grid["lat"], final_grid["lon"]
+    step = float(step)
+    return (math.ceil((lat_max - lat_min) / step) + 1) * (
+        math.ceil((lon_max - lon_min) / step) + 1
+    )
+
+
+def scale_bytes(file_sets, cells):
+    """Bytes on disk of file sets once regridded to a grid of cells cells."""
+    return sum(fs["bytes"] * cells / fs["cells"] for fs in file_sets)
+
+
+def get_era5_variables(variables):
+    """ERA5 variables converted to Zarr, as in downscale_cmip6."""
+    var_list = cmip6.validate_vars(variables, return_list=True)
+    era5_var_list = cmip6.cmip6_to_era5_variables(
+        get_processing_variables(variables)
+    ).split()
+    if any(v in var_list for v in ["dtr", "tasmax", "tasmin"]):
+        if "t2min" not in era5_var_list:
+            era5_var_list.append("t2min")
+    return era5_var_list
+
+
+def get_stage_volumes(
+    inventory,
+    grid_cells,
+    variables,
+    cascade_mode,
+    regrid_output_format,
+    fuse_dtr,
+    start_year=default_start_year,
+    end_year=default_end_year,
+):
+    """Estimate the tasks, files and volumes of every stage a run would execute.
+
+    Parameters:
+    - inventory: Output of get_inventory
+    - grid_cells: dict of the number of cells of the first, second and final grids
+    - variables, cascade_mode, regrid_output_format, fuse_dtr: as in downscale_cmip6
+    - start_year, end_year: Years of ERA5 data converted to Zarr
+
+    Returns:
+    - list of dicts with stage, tasks, files, in_bytes, out_bytes (written and kept
+        until the end of the run) and freed_bytes (removed at the end of the stage)
+    """
+    var_list = cmip6.validate_vars(variables, return_list=True)
+    regrid_vars = get_regrid_variables(variables).split()
+    conversion_vars = get_zarr_conversion_variables(variables).split()
+    processing_vars = get_processing_variables(variables).split()
+    final_cells = grid_cells["final"]
+
+    file_sets = {
+        (fs["variable"], fs["model"], fs["scenario"]): fs for fs in inventory["cmip6"]
+    }
+    # DTR has the grid and size of tasmax, for every model and scenario with both
+    dtr_sets = [
+        fs | {"variable": "dtr"}
+        for (var_id, model, scenario), fs in file_sets.items()
+        if var_id == "tasmax" and ("tasmin", model, scenario) in file_sets
+    ]
+    regrid_sets = [fs for fs in inventory["cmip6"] if fs["variable"] in regrid_vars]
+    if "dtr" in regrid_vars:
+        regrid_sets += dtr_sets
+
+    def sets_of(var_ids):
+        return [fs for fs in regrid_sets if fs["variable"] in var_ids]
+
+    def stage(name, tasks, files, in_bytes, out_bytes, freed_bytes=0):
+        return {
+            "stage": name,
+            "tasks": tasks,
+            "files": files,
+            "in_bytes": in_bytes,
+            "out_bytes": out_bytes,
+            "freed_bytes": freed_bytes,
+        }
+
+    stages = []
+    if "dtr" in var_list and not fuse_dtr:
+        sources = [
+            file_sets[(var_id, fs["model"], fs["scenario"])]
+            for fs in dtr_sets
+            for var_id in ("tasmax", "tasmin")
+        ]
+        stages.append(
+            stage(
+                "process_dtr",
+                len(dtr_sets),
+                sum(fs["files"] for fs in sources),
+                sum(fs["bytes"] for fs in sources),
+                sum(fs["bytes"] for fs in dtr_sets),
+            )
+        )
+
+    n_files = sum(fs["files"] for fs in regrid_sets)
+    final_bytes = scale_bytes(regrid_sets, final_cells)
+    if cascade_mode == "staged":
+        in_bytes = sum(fs["bytes"] for fs in regrid_sets)
+        for name in ["first", "second", "final"]:
+            out_bytes = scale_bytes(regrid_sets, grid_cells[name])
+            stages.append(
+                stage(f"{name}_regrid", len(regrid_sets), n_files, in_bytes, out_bytes)
+            )
+            in_bytes = out_bytes
+    else:
+        # with fuse_dtr, tasmin is read for DTR even when it is not regridded itself
+        sources = regrid_sets
+        if fuse_dtr and "dtr" in regrid_vars:
+            sources = [fs for fs in regrid_sets if fs["variable"] != "dtr"] + [
+                file_sets[("tasmin", fs["model"], fs["scenario"])]
+                for fs in dtr_sets
+                if "tasmin" not in regrid_vars
+            ]
+        fused = stage(
+            "fused_regrid",
+            len(
+                [fs for fs in regrid_sets if not (fuse_dtr and fs["variable"] == "dtr")]
+            ),
+            sum(fs["files"] for fs in sources),
+            sum(fs["bytes"] for fs in sources),
+            final_bytes,
+        )
+        stages.append(fused)
+        if regrid_output_format == "zarr":
+            # the yearly stores are rechunked into cmip6_zarr and removed
+            stages.append(
+                stage(
+                    "fused_rechunk",
+                    len(sets_of(conversion_vars)),
+                    0,
+                    final_bytes,
+                    scale_bytes(sets_of(conversion_vars), final_cells),
+                    freed_bytes=final_bytes,
+                )
+            )
+
+    era5_vars = get_era5_variables(variables)
+    era5 = dict(inventory["era5"])
+    if "dtr" in era5_vars:
+        # ERA5 DTR is derived from t2max and t2min into ref_netcdf/dtr, and has the
+        # files and size of t2max
+        sources = [era5[var_id] for var_id in ("t2max", "t2min") if var_id in era5]
+        era5["dtr"] = era5.get("t2max", no_files)
+        stages.append(
+            stage(
+                "process_era5_dtr",
+                1,
+                sum(fs["files"] for fs in sources),
+                sum(fs["bytes"] for fs in sources),
+                era5["dtr"]["bytes"],
+            )
+        )
+    era5_sets = [era5.get(var_id, no_files) for var_id in era5_vars]
+    era5_bytes = sum(fs["range_bytes"] for fs in era5_sets)
+    stages.append(
+        stage(
+            "convert_era5_to_zarr",
+            len(era5_sets),
+            sum(fs["range_files"] for fs in era5_sets),
+            era5_bytes,
+            era5_bytes,
+        )
+    )
+
+    if regrid_output_format == "netcdf":
+        zarr_sets = sets_of(conversion_vars)
+        zarr_bytes = scale_bytes(zarr_sets, final_cells)
+        stages.append(
+            stage(
+                "convert_cmip6_to_zarr",
+                len(zarr_sets),
+                sum(fs["files"] for fs in zarr_sets),
+                zarr_bytes,
+                zarr_bytes,
+            )
+        )
+
+    # training reads the full historical store and the ERA5 store of each model and
+    # variable, counted uncompressed (float32) as in bias_adjust.resource_sizing
+    era5_days = (end_year - start_year + 1) * 365
+    train_sets = [
+        fs for fs in sets_of(processing_vars) if fs["scenario"] == "historical"
+    ]
+    stages.append(
+        stage(
+            "train_bias_adjustment",
+            len(train_sets),
+            0,
+            sum((fs["days"] + era5_days) * final_cells * 4 for fs in train_sets),
+            0,
+        )
+    )
+
+    adjust_sets = sets_of(processing_vars)
+    adjust_bytes = scale_bytes(adjust_sets, final_cells)
+    stages.append(
+        stage("bias_adjustment", len(adjust_sets), 0, adjust_bytes, adjust_bytes)
+    )
+
+    if "tasmin" in var_list:
+        tasmax_sets = sets_of(["tasmax"])
+        tasmin_bytes = scale_bytes(tasmax_sets, final_cells)
+        stages.append(
+            stage(
+                "derive_cmip6_tasmin",
+                len(tasmax_sets),
+                0,
+                2 * tasmin_bytes,
+                tasmin_bytes,
+            )
+        )
+
+    return stages
+
+
+def get_stage_job_ids(ssh, run_dir):
+    """Get the Slurm job IDs of each stage of a past run from its log file names."""
+    slurm_dir = Path(run_dir).joinpath("slurm")
+    exit_status, stdout, stderr = utils.exec_command(
+        ssh, f"find {slurm_dir} -name '*.out' -printf '%P\\n'"
+    )
+    if exit_status != 0:
+        raise Exception(f"Error listing the Slurm logs of {run_dir}: {stderr}")
+
+    job_ids = {}
+    for log in stdout.split():
+        match = log_job_id_pattern.search(log)
+        if not match:
+            continue
+        for stage, (log_prefixes, _) in stage_sources.items():
+            if any(log.startswith(prefix) for prefix in log_prefixes):
+                job_ids.setdefault(stage, set()).add(match.group(1))
+                break
+
+    return job_ids
+
+
+def get_stage_usage(ssh, job_ids):
+    """Get the CPU seconds, number of tasks, longest task (seconds) and mean cores per
+    task of the completed allocations of jobs from sacct.
+    """
+    exit_status, stdout, stderr = utils.exec_command(
+        ssh,
+        f"sacct -j {','.join(sorted(job_ids))} -X "
+        f"--format=JobID,State,CPUTimeRAW,ElapsedRaw,AllocCPUS -P -n",
+    )
+    if exit_status != 0:
+        return None
+
+    rows = [
+        line.split("|")
+        for line in stdout.strip().splitlines()
+        if line.split("|")[1] == "COMPLETED"
+    ]
+    if not rows:
+        return None
+
+    return {
+        "tasks": len(rows),
+        "cpu_seconds": sum(int(row[2]) for row in rows),
+        "max_elapsed_sec": max(int(row[3]) for row in rows),
+        "cpus": sum(int(row[4]) for row in rows) / len(rows),
+    }
+
+
+def get_output_bytes(ssh, run_dir, output_dirs):
+    """Size on disk of the first output directory of a stage that is not empty."""
+    for output_dir in output_dirs:
+        exit_status, stdout, stderr = utils.exec_command(
+            ssh, f"du -sbc {Path(run_dir).joinpath(output_dir)} 2>/dev/null | tail -1"
+        )
+        output_bytes = int(stdout.split()[0]) if stdout.strip() else 0
+        if output_bytes > 0:
+            return output_bytes
+
+    return 0
+
+
+def calibrate_run(ssh, conn, run_dir):
+    """Record the CPU time and output volume of every stage of a past run in the
+    stage_runs table of the history, replacing any earlier record of the run.
+    """
+    recorded = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        conn.execute("DELETE FROM stage_runs WHERE run_dir = ?", (str(run_dir),))
+    for stage, job_ids in get_stage_job_ids(ssh, run_dir).items():
+        usage = get_stage_usage(ssh, job_ids)
+        if usage is None:
+            print(f"No completed jobs found in sacct for {stage} of {run_dir}")
+            continue
+        output_bytes = get_output_bytes(ssh, run_dir, stage_sources[stage][1])
+        with conn:
+            conn.execute(
+                "INSERT INTO stage_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(run_dir),
+                    recorded,
+                    stage,
+                    len(job_ids),
+                    usage["tasks"],
+                    usage["cpu_seconds"],
+                    usage["max_elapsed_sec"],
+                    usage["cpus"],
+                    output_bytes,
+                ),
+            )
+        print(
+            f"{run_dir} {stage}: {len(job_ids)} jobs, {usage['tasks']} tasks, "
+            f"{usage['cpu_seconds'] / 3600:.1f} core-hours, "
+            f"{output_bytes / 1024**3:.1f} GB written"
+        )
+
+
+def get_stage_coefficients(conn, stage):
+    """Get the CPU seconds per GB and the cores per task of a stage, learned from the
+    history, or the defaults without history.
+
+    Returns:
+    - tuple of the CPU seconds per GB, cores per task and where they come from
+    """
+    cpu_sec_per_gb, cpus = default_coefficients[stage]
+    if stage == train_resource_stage:
+        # training jobs are recorded per job by train_bias_adjustment
+        elapsed_sec_per_gb = conn.execute(
+            """
+            SELECT SUM(elapsed_min * 60) * 1073741824.0 / SUM(input_bytes)
+            FROM jobs WHERE stage = ? AND state = 'COMPLETED' AND input_bytes > 0
+            """,
+            (stage,),
+        ).fetchone()[0]
+        if elapsed_sec_per_gb:
+            return elapsed_sec_per_gb * cpus, cpus, "history"
+        return cpu_sec_per_gb, cpus, "default"
+
+    learned_sec_per_gb, learned_cpus = conn.execute(
+        """
+        SELECT SUM(cpu_seconds) * 1073741824.0 / SUM(output_bytes),
+            SUM(cpus * tasks) / SUM(tasks)
+        FROM stage_runs WHERE stage = ? AND output_bytes > 0 AND tasks > 0
+        """,
+        (stage,),
+    ).fetchone()
+    if learned_sec_per_gb:
+        return learned_sec_per_gb, learned_cpus, "history"
+    return cpu_sec_per_gb, cpus, "default"
+
+
+def estimate_costs(stages, conn, max_cores):
+    """Estimate the core-hours, wall time and storage of each stage.
+
+    Returns:
+    - list of dicts, one row per stage, and a totals row
+    """
+    rows = []
+    storage_bytes = 0
+    peak_bytes = 0
+    for stage in stages:
+        cpu_sec_per_gb, cpus, source = get_stage_coefficients(conn, stage["stage"])
+        basis_bytes = (
+            stage["in_bytes"]
+            if stage["stage"] == train_resource_stage
+            else stage["out_bytes"]
+        )
+        core_hours = basis_bytes / 1024**3 * cpu_sec_per_gb / 3600
+        cores = min(max(1, stage["tasks"]) * cpus, max_cores)
+        # the inputs are kept while the outputs are written
+        storage_bytes += stage["out_bytes"]
+        peak_bytes = max(peak_bytes, storage_bytes)
+        storage_bytes -= stage["freed_bytes"]
+        rows.append(
+            {
+                "stage": stage["stage"],
+                "tasks": stage["tasks"],
+                "files": stage["files"],
+                "gb_in": round(stage["in_bytes"] / 1024**3, 1),
+                "gb_out": round(stage["out_bytes"] / 1024**3, 1),
+                "core_hours": round(core_hours, 1),
+                "wall_hours": round(core_hours / cores, 1),
+                "storage_gb": round(storage_bytes / 1024**3, 1),
+                "coefficients": source,
+            }
+        )
+
+    rows.append(
+        {
+            "stage": "total",
+            "tasks": sum(row["tasks"] for row in rows),
+            "files": sum(row["files"] for row in rows),
+            "gb_in": round(sum(row["gb_in"] for row in rows), 1),
+            "gb_out": round(sum(row["gb_out"] for row in rows), 1),
+            "core_hours": round(sum(row["core_hours"] for row in rows), 1),
+            "wall_hours": round(sum(row["wall_hours"] for row in rows), 1),
+            "storage_gb": round(peak_bytes / 1024**3, 1),
+            "coefficients": "peak storage",
+        }
+    )
+
+    return rows
+
+
+def format_plan(rows):
+    """Format the rows of a plan as a fixed width table."""
+    columns = list(rows[0])
+    widths = [
+        max(len(column), *(len(str(row[column])) for row in rows)) for column in columns
+    ]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths))]
+    lines.append("  ".join("-" * w for w in widths))
+    for row in rows:
+        lines.append("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+
+    return "\n".join(lines)
+
+
+@flow(log_prints=True)
+def plan_downscale_cmip6(
+    ssh_username,
+    ssh_private_key_path,
+    repo_name,  # cmip6-utils
+    conda_env_name,
+    cmip6_dir,  # e.g. /beegfs/CMIP6/arctic-cmip6/CMIP6
+    reference_dir,  # e.g. /beegfs/CMIP6/arctic-cmip6/era5/daily_era5_4km_3338
+    project_base_dir,  # e.g. /beegfs/CMIP6/your-user-name/downscaling
+    variables,
+    models,
+    scenarios,
+    cascade_grid_coords_file,
+    first_regrid_linspace_step,
+    second_regrid_linspace_step,
+    resolution,
+    final_grid_template_file="",
+    cascade_mode="staged",
+    grid_cache_dir="",
+    regrid_output_format="netcdf",
+    fuse_dtr=False,
+    calibration_runs="",
+    history_db=resource_sizing.default_history_db,
+    max_cores=240,
+):
+    if cascade_mode not in ("staged", "fused"):
+        raise ValueError(
+            f"Unknown cascade_mode {cascade_mode}, expected 'staged' or 'fused'"
+        )
+    if regrid_output_format not in ("netcdf", "zarr"):
+        raise ValueError(
+            f"Unknown regrid_output_format {regrid_output_format}, expected 'netcdf' or 'zarr'"
+        )
+    if regrid_output_format == "zarr" and cascade_mode != "fused":
+        raise ValueError('regrid_output_format="zarr" requires cascade_mode="fused"')
+    if fuse_dtr and cascade_mode != "fused":
+        raise ValueError('fuse_dtr=True requires cascade_mode="fused"')
+
+    project_base_dir = Path(project_base_dir)
+    if not final_grid_template_file:
+        final_grid_template_file = str(
+            project_base_dir
+            / repo_name
+            / "downscaling"
+            / "default_target_grid_files"
+            / f"era5_{resolution}km_default_target_grid.nc"
+        )
+    if not grid_cache_dir:
+        grid_cache_dir = project_base_dir.joinpath("grid_cache")
+    cascade_grid_script = project_base_dir.joinpath(
+        repo_name, "downscaling", "make_intermediate_target_grid_file.py"
+    )
+
+    if models == "all":
+        models = " ".join(cmip6.all_models)
+    if scenarios == "all":
+        scenarios = " ".join(cmip6.all_scenarios)
+
+    era5_vars = get_era5_variables(variables)
+    if "dtr" in era5_vars:
+        era5_vars += ["t2max", "t2min"]
+    inventory_args = {
+        "cmip6_dir": str(cmip6_dir),
+        "variables": get_batch_file_variables(variables).split(),
+        "models": models.split(),
+        "scenarios": scenarios.split(),
+        "reference_dir": str(reference_dir),
+        "era5_variables": sorted(set(era5_vars)),
+        "start_year": default_start_year,
+        "end_year": default_end_year,
+    }
+
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    conn = resource_sizing.open_history_db(history_db)
+
+    try:
+        private_key = paramiko.RSAKey(filename=ssh_private_key_path)
+        ssh.connect(ssh_host, ssh_port, ssh_username, pkey=private_key)
+
+        for run_dir in calibration_runs.split():
+            calibrate_run(ssh, conn, run_dir)
+
+        # the intermediate grids are in the cache under the same key as the flow
+        # builds them with, if an earlier run has built them
+        try:
+            build_inputs = get_grid_build_inputs(
+                ssh, cascade_grid_coords_file, cascade_grid_script
+            )
+            intermediate_grid_files = {
+                name: str(
+                    get_grid_cache_file(
+                        grid_cache_dir,
+                        "intermediate_target_grid",
+                        str(cascade_grid_coords_file),
+                        float(step),
+                        float(resolution),
+                        build_inputs,
+                    )
+                )
+                for name, step in [
+                    ("first", first_regrid_linspace_step),
+                    ("second", second_regrid_linspace_step),
+                ]
+            }
+        except Exception as e:
+            print(f"Intermediate grids will be estimated, cache key unavailable: {e}")
+            intermediate_grid_files = {}
+        inventory_args["grid_files"] = [
+            final_grid_template_file,
+            *intermediate_grid_files.values(),
+        ]
+
+        inventory = get_inventory(ssh, conda_env_name, inventory_args)
+    finally:
+        ssh.close()
+
+    try:
+        grids = inventory["grids"]
+        final_grid = grids[final_grid_template_file]
+        if final_grid is None:
+            raise ValueError(
+                f"Final grid file {final_grid_template_file} not found, clone "
+                f"{repo_name} in {project_base_dir} or set final_grid_template_file"
+            )
+        grid_cells = {"final": final_grid["cells"]}
+        for name, step in [
+            ("first", first_regrid_linspace_step),
+            ("second", second_regrid_linspace_step),
+        ]:
+            grid_cells[name] = get_intermediate_cells(
+                grids.get(intermediate_grid_files.get(name)), final_grid, step
+            )
+
+        print(
+            f"Found {sum(fs['files'] for fs in inventory['cmip6'])} CMIP6 files "
+            f"in {len(inventory['cmip6'])} sets of variable/model/scenario. "
+            f"Grid cells: {grid_cells}"
+        )
+        stages = get_stage_volumes(
+            inventory,
+            grid_cells,
+            variables,
+            cascade_mode,
+            regrid_output_format,
+            fuse_dtr,
+        )
+        rows = estimate_costs(stages, conn, max_cores)
+    finally:
+        conn.close()
+
+    print(format_plan(rows))
+    create_table_artifact(
+        rows,
+        key="downscale-cmip6-plan",
+        description="Estimated cost of each stage of downscale_cmip6",
+    )
+
+    return rows
+
+
+if __name__ == "__main__":
+    ssh_username = "snapdata"
+    ssh_private_key_path = "/home/snapdata/.ssh/id_rsa"
+    repo_name = "cmip6-utils"
+    conda_env_name = "cmip6-utils"
+    cmip6_dir = "/beegfs/CMIP6/arctic-cmip6/CMIP6"
+    reference_dir = "/beegfs/CMIP6/arctic-cmip6/era5/daily_era5_4km_3338"
+    project_base_dir = "/beegfs/CMIP6/arctic-cmip6/downscaling"
+    variables = "tasmax dtr pr"
+    models = "all"
+    scenarios = "all"
+    cascade_grid_coords_file = "/beegfs/CMIP6/arctic-cmip6/CMIP6/ScenarioMIP/NCAR/CESM2/ssp370/r11i1p1f1/day/tas/gn/v20200528/tas_day_CESM2_ssp370_r11i1p1f1_gn_20150101-20241231.nc"
+    final_grid_template_file = ""  # empty → use resolution-based default from repo
+    first_regrid_linspace_step = 0.5
+    second_regrid_linspace_step = 0.25
+    resolution = 4
+    cascade_mode = "staged"
+    grid_cache_dir = ""
+    regrid_output_format = "netcdf"
+    fuse_dtr = False
+    # working directories of past runs to learn stage throughput from, space-separated
+    calibration_runs = ""
+    history_db = resource_sizing.default_history_db
+    # cores the tasks of a stage can use at once
+    max_cores = 240
+
+    plan_downscale_cmip6.serve(
+        name="plan-downscale-cmip6",
+        tags=["Downscaling"],
+        parameters={
+            "ssh_username": ssh_username,
+            "ssh_private_key_path": ssh_private_key_path,
+            "repo_name": repo_name,
+            "conda_env_name": conda_env_name,
+            "cmip6_dir": cmip6_dir,
+            "reference_dir": reference_dir,
+            "project_base_dir": project_base_dir,
+            "variables": variables,
+            "models": models,
+            "scenarios": scenarios,
+            "cascade_grid_coords_file": cascade_grid_coords_file,
+            "final_grid_template_file": final_grid_template_file,
+            "first_regrid_linspace_step": first_regrid_linspace_step,
+            "second_regrid_linspace_step": second_regrid_linspace_step,
+            "resolution": resolution,
+            "cascade_mode": cascade_mode,
+            "grid_cache_dir": grid_cache_dir,
+            "regrid_output_format": regrid_output_format,
+            "fuse_dtr": fuse_dtr,
+            "calibration_runs": calibration_runs,
+            "history_db": history_db,
+            "max_cores": max_cores,
+        },
+    )
@@ -0,0 +1,118 @@
+"""Helpers for running downscaling/rechunk_zarr.py on Chinook as a Slurm array job."""
+
+import math
+from pathlib import Path
+
+from utils import utils
+
+
+def get_rechunk_args(chunks, consumer):
+    """Get the tile_size and extra arguments of rechunk_zarr.py for chunks planned by
+    utils.zarr_chunks.plan_zarr_chunks, e.g. {"time": 3650, "y": 84, "x": 84}.
+
+    Only the adjustment consumer has fixed time chunks, the others get the full time
+    series of each store, whatever its length.
+    """
+    time_dim, *spatial_dims = chunks
+    tile_size = min(chunks[dim] for dim in spatial_dims)
+    extra_args = ""
+    if consumer == "adjustment":
+        extra_args = f"--time_chunk {chunks[time_dim]}"
+
+    return tile_size, extra_args
+
+
+def run_rechunk_zarr(
+    ssh,
+    working_dir,
+    job_name,
+    tasks,
+    conda_env_name,
+    partition,
+    tile_size,
+    max_parallel_tasks=None,
+    memory_budget_gb=None,
+    extra_args="",
+):
+    """Rechunk sets of time-chunked inputs into Zarr stores chunked for bias adjustment.
+
+    Uploads rechunk_zarr.py to <working_dir>/scripts and runs it as one Slurm array job
+    with a task per output store, then waits for it with retries.
+
+    Parameters:
+    - ssh: Paramiko SSHClient object, "connected"
+    - working_dir: Remote working directory of the run
+    - job_name: Name of the Slurm job, logs go to <working_dir>/slurm/<job_name>
+    - tasks: List of (inputs, output_store) tuples, where inputs is a glob pattern
+        matching the Zarr stores or NetCDF files of one output store
+    - conda_env_name: Name of the Conda environment to activate
+    - partition: Slurm partition to submit to
+    - tile_size: Size of the spatial chunks of the output stores
+    - max_parallel_tasks: Maximum number of array tasks to run at once (optional)
+    - memory_budget_gb: If given, rechunk in two phases through an intermediate store
+        within this much memory, which is also the memory requested for each task
+    - extra_args: Additional arguments for rechunk_zarr.py, e.g. "--time_chunk 3650"
+
+    Returns:
+    - List of Slurm job IDs, including retries
+    """
+    working_dir = Path(working_dir)
+    slurm_dir = working_dir.joinpath("slurm", job_name)
+    scripts_dir = working_dir.joinpath("scripts")
+    worker_script = scripts_dir.joinpath("rechunk_zarr.py")
+    task_file = slurm_dir.joinpath("stores.txt")
+    sbatch_script = slurm_dir.joinpath(f"{job_name}.slurm")
+
+    utils.create_directories(ssh, [slurm_dir.parent, slurm_dir, scripts_dir])
+    utils.upload_file(
+        ssh, Path(__file__).parent.joinpath("rechunk_zarr.py"), worker_script
+    )
+    utils.write_remote_file(
+        ssh,
+        task_file,
+        "".join(f"{inputs} {output_store}\n" for inputs, output_store in tasks),
+    )
+
+    # each task line is "<inputs glob> <output store>", the glob is expanded by the worker
+    command = (
+        "set -f -- $task; "
+        f'python {worker_script} --inputs "$1" --output_store "$2" '
+        f"--tile_size {tile_size}"
+    )
+    if extra_args:
+        command += f" {extra_args}"
+    mem = None
+    if memory_budget_gb:
+        command += f" --memory_budget_gb {memory_budget_gb}"
+        mem = f"{math.ceil(memory_budget_gb)}G"
+    utils.write_remote_file(
+        ssh,
+        sbatch_script,
+        utils.build_array_sbatch_script(
+            job_name=job_name,
+            partition=partition,
+            slurm_dir=slurm_dir,
+            task_file=task_file,
+            n_tasks=len(tasks),
+            conda_env_name=conda_env_name,
+            command=command,
+            max_parallel_tasks=max_parallel_tasks,
+            mem=mem,
+        ),
+    )
+
+    job_ids = utils.submit_sbatch(ssh, sbatch_script)
+    print(
+        f"Zarr rechunking job submitted for {len(tasks)} stores! (job ID: {job_ids[0]})"
+    )
+
+    # Use retry logic to handle intermittent 0:53 errors
+    return utils.wait_for_jobs_with_retry(
+        ssh,
+        job_ids,
+        sbatch_script_path=sbatch_script,
+        max_job_retries=3,
+        retry_delay=60,
+        exponential_backoff=True,
+        completion_message=f"Slurm jobs for {job_name} complete.",
+    )
@@ -0,0 +1,278 @@
+"""Worker script for rechunking gridded daily data into a Zarr store for bias adjustment.
+
+This script is not run by Prefect directly. Flows upload it to the remote working
+directory and run it as a Slurm array job, one array task per output store.
+
+The input is a set of Zarr stores or NetCDF files (e.g. one per year) that together
+cover the full time series, chunked in time. The output is a single consolidated Zarr
+store with the whole time series (or --time_chunk days) in each chunk and spatial
+tiles of tile_size cells, which is the access pattern of the bias adjustment.
+
+By default the output store is written one spatial tile at a time, straight from the
+inputs. This suits inputs that are already tiled like the output, such as the yearly
+stores written by the fused regrid.
+
+With --memory_budget_gb, the rechunk streams through an intermediate store in two
+phases, so that no more than the budget is held in memory at once:
+    1. blocks of time (the time chunk of the inputs) and whole rows of cells are
+       copied to an intermediate store, chunked in time blocks and large spatial
+       tiles of k * tile_size cells
+    2. each large tile is read from the intermediate store with its full time series
+       and written to the output, which covers k * k output chunks per read
+k is the largest value for which the full time series of a large tile fits in the
+budget. This turns the all-to-all shuffle from time-chunked to space-chunked data into
+reads and writes of whole chunks, and scales to finer grids without bigger nodes.
+
+In both modes the writes line up with the chunks of the store being written, so each
+data chunk is written exactly once. The output store is written under a temporary name
+and renamed when done.
+
+Example usage:
+    python rechunk_zarr.py \
+        --inputs "/path/to/era5/t2max/t2max_*_era5_4km_3338.nc" \
+        --output_store /path/to/run/era5_zarr/t2max_era5.zarr \
+        --tile_size 32 \
+        --memory_budget_gb 8 \
+        --start_year 1965 --end_year 2014
+"""
+
+import argparse
+import glob
+import itertools
+import logging
+import math
+import shutil
+from pathlib import Path
+
+import xarray as xr
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+# full daily time series of a 32 x 32 tile is ~130 MB of float32 for 1950-2100
+default_tile_size = 32
+
+# share of the memory budget used for data, the rest is left for copies made by
+# xarray/zarr while encoding and compressing
+budget_fraction = 0.5
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--inputs",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Input Zarr stores or NetCDF files, or glob patterns matching them",
+    )
+    parser.add_argument("--output_store", type=str, required=True)
+    parser.add_argument("--tile_size", type=int, default=default_tile_size)
+    parser.add_argument(
+        "--time_chunk",
+        type=int,
+        default=-1,
+        help="Time chunk of the output store, -1 for the full time series",
+    )
+    parser.add_argument(
+        "--memory_budget_gb",
+        type=float,
+        default=None,
+        help="Rechunk in two phases through an intermediate store within this budget",
+    )
+    parser.add_argument(
+        "--intermediate_store",
+        type=str,
+        default=None,
+        help="Intermediate store for the two phase rechunk, <output_store>.intermediate by default",
+    )
+    parser.add_argument("--start_year", type=int, default=None)
+    parser.add_argument("--end_year", type=int, default=None)
+
+    return parser.parse_args()
+
+
+def expand_inputs(inputs):
+    paths = []
+    for pattern in inputs:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return paths
+
+
+def open_inputs(paths):
+    engine = "zarr" if paths[0].rstrip("/").endswith(".zarr") else "netcdf4"
+    ds = xr.open_mfdataset(
+        paths,
+        engine=engine,
+        combine="by_coords",
+        data_vars="minimal",
+        coords="minimal",
+        compat="override",
+    )
+    # bounds and auxiliary variables (time_bnds, lat_bnds) of the regridded CMIP6
+    # files would add their bnds dimension to the tiles, only the data is rechunked
+    ds = ds[[get_main_variable(ds)]]
+    clear_chunk_encoding(ds)
+
+    return ds
+
+
+def get_main_variable(ds):
+    """The data variable with a time dimension and the most dimensions."""
+    return max(
+        (name for name, var in ds.data_vars.items() if "time" in var.dims),
+        key=lambda name: ds[name].ndim,
+    )
+
+
+def clear_chunk_encoding(ds):
+    # chunking of the inputs would otherwise be carried over to the output store
+    for var in ds.variables.values():
+        var.encoding.pop("chunks", None)
+        var.encoding.pop("preferred_chunks", None)
+
+
+def get_spatial_dims(ds):
+    """Dimensions of the main data variable other than time, e.g. (y, x) or (lat, lon)."""
+    return [dim for dim in ds[get_main_variable(ds)].dims if dim != "time"]
+
+
+def init_store(ds, store, chunks):
+    """Write the metadata and coordinates of a store, the data is filled in by blocks."""
+    store = Path(store)
+    if store.exists():
+        shutil.rmtree(store)
+    ds.chunk(chunks).to_zarr(store, compute=False, consolidated=True)
+
+
+def copy_blocks(ds, store, blocks):
+    """Copy ds to store one block at a time, where blocks maps dimensions to block
+    sizes. Dimensions not in blocks are copied in full with every block.
+    """
+    block_vars = [
+        name for name, var in ds.variables.items() if set(var.dims) & set(blocks)
+    ]
+    starts = [range(0, ds.sizes[dim], size) for dim, size in blocks.items()]
+    n_blocks = math.prod(len(dim_starts) for dim_starts in starts)
+
+    for i, block_starts in enumerate(itertools.product(*starts)):
+        region = {dim: slice(None) for dim in ds.dims}
+        for (dim, size), start in zip(blocks.items(), block_starts):
+            region[dim] = slice(start, min(start + size, ds.sizes[dim]))
+
+        block = ds[block_vars].isel(region).load()
+        block = block.drop_vars(
+            [name for name in block.variables if name not in block_vars]
+        )
+        # the encoding was set when the metadata was written
+        for var in block.variables.values():
+            var.encoding = {}
+        block.to_zarr(store, region=region)
+
+        if (i + 1) % 100 == 0 or i + 1 == n_blocks:
+            logging.info(f"Wrote {i + 1} of {n_blocks} blocks to {store}")
+
+
+def get_itemsize(ds):
+    return max(var.dtype.itemsize for var in ds.data_vars.values())
+
+
+def rechunk(ds, output_store, tile_size, time_chunk=-1):
+    """Rechunk straight from the inputs, one output tile at a time."""
+    spatial_dims = get_spatial_dims(ds)
+    tmp_store = Path(f"{output_store}.tmp")
+
+    init_store(
+        ds, tmp_store, {"time": time_chunk} | {dim: tile_size for dim in spatial_dims}
+    )
+    copy_blocks(ds, tmp_store, {dim: tile_size for dim in spatial_dims})
+
+    return tmp_store
+
+
+def streaming_rechunk(
+    ds, output_store, tile_size, memory_budget_gb, intermediate_store, time_chunk=-1
+):
+    """Rechunk in two phases through an intermediate store, within a memory budget."""
+    spatial_dims = get_spatial_dims(ds)
+    ny, nx = (ds.sizes[dim] for dim in spatial_dims)
+    n_time = ds.sizes["time"]
+    itemsize = get_itemsize(ds)
+    budget = memory_budget_gb * 1024**3 * budget_fraction
+
+    # phase 2 holds the full time series of one large tile
+    large_tile = math.isqrt(int(budget / (n_time * itemsize)))
+    k = large_tile // tile_size
+    if k < 1:
+        raise ValueError(
+            f"The full time series of a {tile_size} x {tile_size} tile does not fit in "
+            f"{memory_budget_gb} GB, use a smaller tile_size or a larger budget"
+        )
+    large_tile = min(k * tile_size, max(ny, nx))
+
+    # phase 1 holds one time block of as many whole rows of large tiles as fit
+    time_block = ds.chunks["time"][0] if ds.chunks else 365
+    row_bytes = time_block * large_tile * nx * itemsize
+    rows = large_tile * max(1, int(budget // row_bytes))
+    logging.info(
+        f"Rechunking through {intermediate_store} in blocks of {time_block} days x "
+        f"{rows} rows, then tiles of {large_tile} x {large_tile} cells"
+    )
+
+    init_store(
+        ds,
+        intermediate_store,
+        {"time": time_block} | {dim: large_tile for dim in spatial_dims},
+    )
+    copy_blocks(ds, intermediate_store, {"time": time_block, spatial_dims[0]: rows})
+
+    intermediate = xr.open_zarr(intermediate_store)
+    clear_chunk_encoding(intermediate)
+
+    tmp_store = Path(f"{output_store}.tmp")
+    init_store(
+        intermediate,
+        tmp_store,
+        {"time": time_chunk} | {dim: tile_size for dim in spatial_dims},
+    )
+    copy_blocks(intermediate, tmp_store, {dim: large_tile for dim in spatial_dims})
+
+    shutil.rmtree(intermediate_store)
+
+    return tmp_store
+
+
+def main():
+    args = parse_args()
+
+    paths = expand_inputs(args.inputs)
+    logging.info(f"Rechunking {len(paths)} inputs to {args.output_store}")
+    ds = open_inputs(paths)
+    if args.start_year or args.end_year:
+        ds = ds.sel(
+            time=slice(
+                str(args.start_year) if args.start_year else None,
+                str(args.end_year) if args.end_year else None,
+            )
+        )
+
+    if args.memory_budget_gb:
+        tmp_store = streaming_rechunk(
+            ds,
+            args.output_store,
+            args.tile_size,
+            args.memory_budget_gb,
+            args.intermediate_store or f"{args.output_store}.intermediate",
+            args.time_chunk,
+        )
+    else:
+        tmp_store = rechunk(ds, args.output_store, args.tile_size, args.time_chunk)
+
+    output_store = Path(args.output_store)
+    if output_store.exists():
+        shutil.rmtree(output_store)
+    tmp_store.rename(output_store)
+    logging.info(f"Wrote {args.output_store}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import os
 from prefect import flow
 from prefect.blocks.system import Secret
 import hsia_tasks
@@ -11,6 +12,8 @@ def hsia(
     source_tar_file,
     tif_directory,
     conda_env,
+    max_workers=8,
+    source_directory=None,
 ):
 
     try:
@@ -20,38 +23,40 @@ def hsia(
 
         hsia_tasks.check_for_nfs_mount("/workspace/Shared")
 
-        hsia_tasks.copy_data_from_nfs_mount(source_tar_file, f"{working_directory}")
+        # With a directory-plus-manifest archive only the new years are
+        # generated and copied, so the existing archive is never pulled down
+        if source_directory is None:
+            hsia_tasks.copy_data_from_nfs_mount(source_tar_file, f"{working_directory}")
 
-        hsia_tasks.untar_file(
-            f"{working_directory}rasdaman_hsia_arctic_production_tifs.tgz",
-            f"{working_directory}/rasdaman_hsia_arctic_production_tifs",
-        )
-
-        # Year can be a list
-        if type(years) == list:
-            for year in years:
-                hsia_tasks.download_new_nsidc_data(year)
-                hsia_tasks.generate_annual_sea_ice_geotiffs(
-                    year,
-                    tif_directory,
-                )
+            hsia_tasks.untar_file(
+                f"{working_directory}rasdaman_hsia_arctic_production_tifs.tgz",
+                f"{working_directory}/rasdaman_hsia_arctic_production_tifs",
+            )
         else:
-            # Only a single year was requested
-            year = years
-
-            hsia_tasks.download_new_nsidc_data(year)
+            os.makedirs(tif_directory, exist_ok=True)
 
-            hsia_tasks.generate_annual_sea_ice_geotiffs(year, tif_directory, conda_env)
+        # Year can be a list; all requested years are downloaded and
+        # converted concurrently
+        hsia_tasks.download_new_nsidc_data(years, max_workers)
 
-        hsia_tasks.tar_directory(
-            tif_directory,
-            f"{tif_directory}.tgz",
+        hsia_tasks.generate_annual_sea_ice_geotiffs(
+            years, tif_directory, conda_env, max_workers
         )
 
-        hsia_tasks.copy_tarfile_to_storage_server(
-            f"{tif_directory}.tgz",
-            source_tar_file,
-        )
+        if source_directory is None:
+            hsia_tasks.tar_directory(
+                tif_directory,
+                f"{tif_directory}.tgz",
+            )
+
+            hsia_tasks.copy_tarfile_to_storage_server(
+                f"{tif_directory}.tgz",
+                source_tar_file,
+            )
+        else:
+            hsia_tasks.copy_new_tifs_to_storage_server(
+                tif_directory, years, source_directory
+            )
 
     except Exception as e:
         print(f"Error: {e}")
@@ -69,5 +74,7 @@ if __name__ == "__main__":
             "source_tar_file": "/workspace/Shared/Tech_Projects/Sea_Ice_Atlas/final_products/rasdaman_hsia_arctic_production_tifs.tgz",
             "tif_directory": "/opt/rasdaman/user_data/snapdata/hsia_updates/rasdaman_hsia_arctic_production_tifs",
             "conda_env": "hsia_updates",
+            "max_workers": 8,
+            "source_directory": None,
         },
     )
@@ -4,9 +4,16 @@ import netrc
 import subprocess
 import tarfile
 import calendar
+import glob
+import json
+import requests
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse
 from prefect import task
-from seaice.seaice import netcdf_to_geotiff
+from seaice.seaice import netcdf_to_geotiff, get_warp_index
+
+earthdata_host = "urs.earthdata.nasa.gov"
 
 
 @task
@@ -134,46 +141,111 @@ def check_for_netrc_file(netrc_home, netrc_contents):
     )
 
 
+# Helper: NSIDC platform flag used in the monthly file names
+def nsidc_flag(year):
+    return "F17" if int(year) <= 2024 else "am2"
+
+
+# Helper: local path of a downloaded NSIDC monthly NetCDF file
+def nsidc_raw_file(year, month):
+    return f"/tmp/nsidc_raw/{year}/sic_psn25_{year}{month:02d}_{nsidc_flag(year)}_v06r00.nc"
+
+
+class EarthdataSession(requests.Session):
+    """
+    Session that keeps its credentials across the redirect to the Earthdata
+    login host, which requests would otherwise strip on a change of host.
+    """
+
+    def rebuild_auth(self, prepared_request, response):
+        headers = prepared_request.headers
+        if "Authorization" in headers:
+            original = urlparse(response.request.url).hostname
+            redirect = urlparse(prepared_request.url).hostname
+            if (
+                original != redirect
+                and redirect != earthdata_host
+                and original != earthdata_host
+            ):
+                del headers["Authorization"]
+
+
+def download_nsidc_file(session, year, month):
+    url = "https://noaadata.apps.nsidc.org/NOAA/G02202_V6/north/monthly/sic_psn25_{}{:02d}_{}_v06r00.nc".format(
+        year, month, nsidc_flag(year)
+    )
+    out_file = nsidc_raw_file(year, month)
+    if os.path.exists(out_file):
+        return out_file
+
+    with session.get(url, stream=True, timeout=300) as response:
+        if response.status_code == 404:
+            print(f"No NSIDC data for {calendar.month_name[month]} of {year}")
+            return None
+        response.raise_for_status()
+        # Write to a temporary name so a failed download is never mistaken for a complete one
+        with open(f"{out_file}.part", "wb") as f:
+            shutil.copyfileobj(response.raw, f, 1024 * 1024)
+    os.rename(f"{out_file}.part", out_file)
+    return out_file
+
+
 @task
-def download_new_nsidc_data(year):
-    # Change the year to match the year we want to download
-    out_dir = f"/tmp/nsidc_raw/{year}"
+def download_new_nsidc_data(years, max_workers=8):
+    # Year can be a list
+    years = years if type(years) == list else [years]
+
     info = netrc.netrc()
-    username, account, password = info.authenticators(
-        urlparse("https://urs.earthdata.nasa.gov").hostname
-    )
+    username, account, password = info.authenticators(earthdata_host)
 
-    if not os.path.exists(out_dir):
-        os.makedirs(out_dir)
+    for year in years:
+        os.makedirs(f"/tmp/nsidc_raw/{year}", exist_ok=True)
 
-    for month in ["{:02d}".format(month + 1) for month in range(12)]:
-        commanda = 'wget --load-cookies ~/.urs_cookies --save-cookies ~/.urs_cookies --keep-session-cookies --no-check-certificate --auth-no-challenge=on -r --reject "index.html*" -np -nd -e robots=off --user {} --password "{}" -P {} '.format(
-            username, password, out_dir
-        )
-        flag = "F17" if int(year) <= 2024 else "am2"
+    # One pooled, authenticated session shared by every download
+    session = EarthdataSession()
+    session.auth = (username, password)
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
 
-        commandb = "https://noaadata.apps.nsidc.org/NOAA/G02202_V6/north/monthly/sic_psn25_{}{}_{}_v06r00.nc".format(
-            str(year), month, flag
-        )
-        os.system(commanda + commandb)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(download_nsidc_file, session, year, month)
+            for year in years
+            for month in range(1, 13)
+        ]
+        downloaded = [future.result() for future in futures]
+
+    print(f"Downloaded {len([f for f in downloaded if f])} NSIDC files for {years}")
+
+
+def convert_month(year, month, output_directory, conda_env):
+    input_netcdf = nsidc_raw_file(year, month)
+    output_tiff = f"{output_directory}/seaice_conc_sic_mean_pct_monthly_panarctic_{year}_{month:02d}.tif"
+    try:
+        netcdf_to_geotiff(input_netcdf, output_tiff, conda_env)
+    except:
+        print(f"Error converting {calendar.month_name[month]} of {year} to a GeoTIFF")
 
 
 @task
-def generate_annual_sea_ice_geotiffs(year, output_directory, conda_env="hydrology"):
-    # Generate annual Sea Ice GeoTIFFs
-    for month in range(1, 13):
-        flag = "F17" if int(year) <= 2024 else "am2"
-        input_netcdf = (
-            f"/tmp/nsidc_raw/{year}/sic_psn25_{year}{month:02d}_{flag}_v06r00.nc"
-        )
-        output_tiff = f"{output_directory}/seaice_conc_sic_mean_pct_monthly_panarctic_{year}_{month:02d}.tif"
-        try:
-            netcdf_to_geotiff(input_netcdf, output_tiff, conda_env)
-        except:
-            print(
-                f"Error converting {calendar.month_name[month]} of {year} to a GeoTIFF"
-            )
-            continue
+def generate_annual_sea_ice_geotiffs(
+    years, output_directory, conda_env="hydrology", max_workers=None
+):
+    # Generate annual Sea Ice GeoTIFFs for one year or a list of years,
+    # converting every month in a process pool
+    years = years if type(years) == list else [years]
+
+    # Build the cached reprojection index once before the workers start
+    get_warp_index()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(convert_month, year, month, output_directory, conda_env)
+            for year in years
+            for month in range(1, 13)
+        ]
+        for future in futures:
+            future.result()
 
 
 @task
@@ -198,3 +270,52 @@ def copy_tarfile_to_storage_server(tar_file, target_directory):
         )
     except subprocess.CalledProcessError as e:
         print(f"Error copying file: {e}")
+
+
+@task
+def copy_new_tifs_to_storage_server(tif_directory, years, target_directory):
+    """
+    Append-only update of the directory-plus-manifest archive on the storage
+    server: only the GeoTIFFs for the requested years are copied, and they are
+    registered in the manifest.json that lists every file in the archive.
+    target_directory is read through the local NFS mount and written via scp.
+    """
+    years = years if type(years) == list else [years]
+
+    new_files = sorted(
+        tif
+        for year in years
+        for tif in glob.glob(
+            f"{tif_directory}/seaice_conc_sic_mean_pct_monthly_panarctic_{year}_*.tif"
+        )
+    )
+    if not new_files:
+        raise Exception(f"No GeoTIFFs for {years} found in {tif_directory}")
+
+    # Start from the existing manifest, or register what is already there
+    manifest_file = os.path.join(target_directory, "manifest.json")
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    else:
+        manifest = {
+            os.path.basename(tif): {"size": os.path.getsize(tif)}
+            for tif in glob.glob(os.path.join(target_directory, "*.tif"))
+        }
+
+    for tif in new_files:
+        manifest[os.path.basename(tif)] = {"size": os.path.getsize(tif)}
+
+    local_manifest = os.path.join(tif_directory, "manifest.json")
+    with open(local_manifest, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    print(f"Copying {len(new_files)} new GeoTIFFs to NFS server via scp...")
+    # The manifest goes last so it only ever lists files that were copied
+    for files in [new_files, [local_manifest]]:
+        subprocess.run(
+            ["scp", *files, f"poseidon.snap.uaf.edu:{target_directory}"], check=True
+        )
+    print(
+        f"Registered {len(new_files)} GeoTIFFs for {years} in poseidon.snap.uaf.edu:{manifest_file}"
+    )
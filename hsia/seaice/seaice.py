@@ -1,16 +1,84 @@
 import xarray as xr
 import numpy as np
 import rasterio
+import rasterio.shutil
 from rasterio.transform import from_origin
-from rasterio.warp import calculate_default_transform, reproject, Resampling
+from rasterio.warp import transform as transform_coords
 import os
 
+# NSIDC 25km polar stereographic source grid
+source_pixel_size = 25000.0
+source_origin = (-3850000.0, 5850000.0)
+source_shape = (448, 304)
+source_crs = rasterio.CRS.from_proj4(
+    "+proj=stere +lat_0=90 +lat_ts=70 +lon_0=-45 +x_0=0 +y_0=0 +a=6378273 +b=6356889.449 +units=m +no_defs"
+)
+
+# EPSG:3572 target grid expected by the Rasdaman coverage
+target_crs = rasterio.CRS.from_epsg(3572)
+target_bounds = (-4862550.515, -4894840.007, 4870398.248, 4889334.803)
+target_pixel_size = 17075.348707767432643
+target_shape = (
+    round((target_bounds[3] - target_bounds[1]) / target_pixel_size),
+    round((target_bounds[2] - target_bounds[0]) / target_pixel_size),
+)
+target_transform = from_origin(
+    target_bounds[0], target_bounds[3], target_pixel_size, target_pixel_size
+)
+
+default_warp_index_file = os.path.join(
+    os.path.dirname(__file__), "warp_index_psn25_to_epsg3572.npy"
+)
+
+
+def get_warp_index(warp_index_file=default_warp_index_file):
+    """
+    Return the nearest-neighbour mapping from the target grid to the source grid
+    as an array of flat source pixel indices (-1 where the target pixel falls
+    outside the source grid). The source and target grids never change, so the
+    mapping is computed once and cached as a .npy file.
+    """
+    if os.path.exists(warp_index_file):
+        return np.load(warp_index_file)
+
+    rows, cols = np.indices(target_shape)
+    xs, ys = rasterio.transform.xy(target_transform, rows.ravel(), cols.ravel())
+    source_xs, source_ys = transform_coords(target_crs, source_crs, xs, ys)
+
+    source_cols = np.floor(
+        (np.asarray(source_xs) - source_origin[0]) / source_pixel_size
+    ).astype(np.int64)
+    source_rows = np.floor(
+        (source_origin[1] - np.asarray(source_ys)) / source_pixel_size
+    ).astype(np.int64)
+
+    inside = (
+        (source_rows >= 0)
+        & (source_rows < source_shape[0])
+        & (source_cols >= 0)
+        & (source_cols < source_shape[1])
+    )
+    warp_index = np.full(source_rows.shape, -1, dtype=np.int32)
+    warp_index[inside] = source_rows[inside] * source_shape[1] + source_cols[inside]
+    warp_index = warp_index.reshape(target_shape)
+
+    # Write to a temporary name so parallel conversions never read a partial file
+    temp_file = f"{warp_index_file}.{os.getpid()}.npy"
+    np.save(temp_file, warp_index)
+    os.replace(temp_file, warp_index_file)
 
-def netcdf_to_geotiff(input_netcdf, output_tiff, conda_env="hydrology"):
-    dataset = xr.open_dataset(input_netcdf)
+    return warp_index
 
-    variable = dataset["cdr_seaice_conc_monthly"].isel(time=0).values
-    qa_flag = dataset["cdr_seaice_conc_monthly_qa_flag"].isel(time=0).values
+
+def netcdf_to_geotiff(
+    input_netcdf,
+    output_tiff,
+    conda_env="hydrology",
+    warp_index_file=default_warp_index_file,
+):
+    with xr.open_dataset(input_netcdf) as dataset:
+        variable = dataset["cdr_seaice_conc_monthly"].isel(time=0).values
+        qa_flag = dataset["cdr_seaice_conc_monthly_qa_flag"].isel(time=0).values
 
     rescaled_data = np.zeros_like(variable, dtype=np.float32)
 
@@ -33,69 +101,27 @@ def netcdf_to_geotiff(input_netcdf, output_tiff, conda_env="hydrology"):
 
     rescaled_data = rescaled_data.astype(np.uint8)
 
-    # 25km grid
-    pixel_size = 25000.0
-    geotransform = (-3850000.0, pixel_size, 0.0, 5850000.0, 0.0, -pixel_size)
-
-    source_crs = rasterio.CRS.from_proj4(
-        "+proj=stere +lat_0=90 +lat_ts=70 +lon_0=-45 +x_0=0 +y_0=0 +a=6378273 +b=6356889.449 +units=m +no_defs"
-    )
-    target_crs = rasterio.CRS.from_proj4(
-        "+proj=laea +lat_0=90 +lon_0=180 +x_0=0 +y_0=0 +datum=WGS84 +units=m +no_defs"
-    )
+    # Nearest neighbour reprojection straight to EPSG:3572 with a precomputed
+    # index. Use nearest neighbour to preserve categorical values (land=254, etc.)
+    # The destination is initialized to 0 (ocean), and source no data pixels
+    # (255) are not copied, to prevent edge expansion.
+    warp_index = get_warp_index(warp_index_file)
+    warped = rescaled_data.ravel()[np.where(warp_index >= 0, warp_index, 0)]
+    warped[(warp_index < 0) | (warped == 255)] = 0
 
     with rasterio.MemoryFile() as memfile:
         with memfile.open(
             driver="GTiff",
-            height=rescaled_data.shape[0],
-            width=rescaled_data.shape[1],
+            height=target_shape[0],
+            width=target_shape[1],
             count=1,
             dtype="uint8",
-            crs=source_crs,
-            transform=from_origin(
-                geotransform[0], geotransform[3], pixel_size, pixel_size
-            ),
-        ) as src:
-            src.write(rescaled_data, 1)
-            transform, width, height = calculate_default_transform(
-                src.crs, target_crs, src.width, src.height, *src.bounds
-            )
-            profile = src.profile.copy()
-            profile.update(
-                {
-                    "crs": target_crs,
-                    "transform": transform,
-                    "width": width,
-                    "height": height,
-                    "compress": "lzw",
-                }
-            )
-
-            with rasterio.open("temp.tif", "w", **profile) as dst:
-                reproject(
-                    source=rasterio.band(src, 1),
-                    destination=rasterio.band(dst, 1),
-                    src_transform=src.transform,
-                    src_crs=src.crs,
-                    dst_transform=transform,
-                    dst_crs=target_crs,
-                    resampling=Resampling.nearest,
-                )
-
-    # Use gdalwarp to overwrite the file with the correct coordinates
-    # We found that using rasterio for the warp resulted in incorrect coordinates
-    # which caused the data to not properly ingest into the coverage.
-    # Use nearest neighbor resampling to preserve categorical values (land=254, etc.)
-    # Initialize destination to 0 (ocean) and use nodata=255 to prevent edge expansion
-    os.system(
-        f"gdalwarp -overwrite -q -multi -r near -ot Byte "
-        "-srcnodata 255 -dstnodata 255 "
-        "-wo INIT_DEST=0 "
-        "-t_srs EPSG:3572 -te_srs EPSG:3572 "
-        "-te -4862550.515 -4894840.007 4870398.248 4889334.803 "
-        "-tr 17075.348707767432643 -17075.348707767432643 "
-        f"'temp.tif' '{output_tiff}'"
-    )
+            crs=target_crs,
+            transform=target_transform,
+            nodata=255,
+        ) as dst:
+            dst.write(warped, 1)
+            rasterio.shutil.copy(dst, output_tiff, driver="COG", compress="lzw")
 
     # Verify the output file exists and print a message
     if os.path.exists(output_tiff):
@@ -11,6 +11,7 @@ def air_freezing_index_Fdays(
     source_directory="/opt/rasdaman-storage/coverage_data/air_freezing_index_Fdays/",
     zip_file="air_freezing_index.zip",
     python_script="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/arctic_eds/degree_days/air_freezing_index_Fdays/merge.py",
+    force=False,
 ):
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
@@ -23,7 +24,9 @@ def air_freezing_index_Fdays(
             python_script, source_directory, "air_freezing_index"
         )
 
-    ingest_tasks.run_ingest(ingest_directory)
+    coverage_id = ingest_tasks.run_ingest(ingest_directory, force=force)
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
@@ -7,10 +7,13 @@ def alfresco_vegetation_type_percentage(
     branch_name="main",
     working_directory="/opt/rasdaman/user_data/snapdata/",
     ingest_directory="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/iem/alfresco/vegetation_type_pct/",
+    force=False,
 ):
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
-    ingest_tasks.run_ingest(ingest_directory)
+    coverage_id = ingest_tasks.run_ingest(ingest_directory, force=force)
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
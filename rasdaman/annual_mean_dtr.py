@@ -7,11 +7,14 @@ def annual_mean_dtr(
     branch_name,
     working_directory,
     ingest_directory,
+    force=False,
 ):
 
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
-    ingest_tasks.run_ingest(ingest_directory)
+    coverage_id = ingest_tasks.run_ingest(ingest_directory, force=force)
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
@@ -7,11 +7,16 @@ def annual_precip_totals_mm(
     branch_name="main",
     working_directory="/opt/rasdaman/user_data/snapdata/",
     ingest_directory="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/arctic_eds/annual_mean_pr/",
+    force=False,
 ):
 
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
-    ingest_tasks.run_ingest(ingest_directory, "hook_ingest.json")
+    coverage_id = ingest_tasks.run_ingest(
+        ingest_directory, "hook_ingest.json", force=force
+    )
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
@@ -7,17 +7,23 @@ def ardac_chukchi_daily_slie(
     branch_name="main",
     working_directory="/opt/rasdaman/user_data/snapdata/",
     ingest_directory="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/ardac/landfast_sea_ice_chukchi_daily/",
+    force=False,
 ):
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
     # why two ingests? one for WMS, and one for WCS only
-    ingest_tasks.run_ingest(
-        ingest_directory, ingest_file="ingest.json", conda_env="hydrology"
+    coverage_id = ingest_tasks.run_ingest(
+        ingest_directory, ingest_file="ingest.json", conda_env="hydrology", force=force
     )
-    ingest_tasks.run_ingest(
-        ingest_directory, ingest_file="ingest_wcs_only.json", conda_env="hydrology"
+    wcs_coverage_id = ingest_tasks.run_ingest(
+        ingest_directory,
+        ingest_file="ingest_wcs_only.json",
+        conda_env="hydrology",
+        force=force,
     )
 
+    return [coverage_id, wcs_coverage_id]
+
 
 if __name__ == "__main__":
     ardac_chukchi_daily_slie.serve(
@@ -0,0 +1,199 @@
+import sqlite3
+import time
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+from prefect import task
+from prefect.artifacts import create_table_artifact
+
+from ingest_tasks import rasdaman_ows_url
+
+# History of benchmark results across ingests, used to spot tiling regressions
+benchmark_db = "/opt/rasdaman/user_data/snapdata/ingest_benchmarks.sqlite"
+
+# Axis labels used for the spatial axes of our coverages. Every other axis
+# (time, model, scenario, etc.) is treated as a non-spatial axis.
+spatial_axes = {"X", "Y", "E", "N", "x", "y", "Lat", "Long", "lat", "lon"}
+
+
+def get_coverage_envelope(coverage_id):
+    """
+    Return a list of (axis label, lower bound, upper bound) for a coverage
+    from its DescribeCoverage envelope. Bounds are kept as the raw tokens
+    Rasdaman returns, e.g. numbers or quoted timestamps.
+    """
+    url = (
+        f"{rasdaman_ows_url}?service=WCS&version=2.1.0"
+        f"&request=DescribeCoverage&coverageId={coverage_id}"
+    )
+    with urllib.request.urlopen(url, timeout=120) as response:
+        root = ET.fromstring(response.read())
+
+    envelope = root.find(".//{http://www.opengis.net/gml/3.2}Envelope")
+    if envelope is None:
+        raise Exception(f"No envelope found for coverage {coverage_id}")
+
+    labels = envelope.get("axisLabels").split()
+    lower = envelope.find("{http://www.opengis.net/gml/3.2}lowerCorner").text.split()
+    upper = envelope.find("{http://www.opengis.net/gml/3.2}upperCorner").text.split()
+    return list(zip(labels, lower, upper))
+
+
+# Helper: quote non-numeric coordinates, like timestamps, for WCPS subsets
+def format_coordinate(value):
+    try:
+        float(value)
+        return value
+    except ValueError:
+        return value if value.startswith('"') else f'"{value}"'
+
+
+def build_benchmark_queries(coverage_id, envelope):
+    """
+    Build the fixed set of representative WCPS queries for a coverage:
+        point_time_series - all values at the center point
+        map_slice - the full spatial extent at the first value of every other axis
+        area_mean - the mean over the central quarter of the spatial extent at
+            the first value of every other axis
+    """
+    center = {}
+    area = {}
+    first = {}
+    for label, lower, upper in envelope:
+        if label in spatial_axes:
+            low, high = float(lower), float(upper)
+            middle = (low + high) / 2
+            center[label] = f"{label}({middle})"
+            area[label] = (
+                f"{label}({middle - (high - low) / 4}:{middle + (high - low) / 4})"
+            )
+        else:
+            first[label] = f"{label}({format_coordinate(lower)})"
+
+    point_subset = ", ".join(center.values())
+    map_subset = ", ".join(first.values())
+    area_subset = ", ".join(list(area.values()) + list(first.values()))
+
+    queries = {
+        "point_time_series": f'for $c in ({coverage_id}) return encode($c[{point_subset}], "application/json")',
+        "map_slice": f'for $c in ({coverage_id}) return encode($c[{map_subset}], "image/tiff")',
+        "area_mean": f"for $c in ({coverage_id}) return avg($c[{area_subset}])",
+    }
+    # A coverage without non-spatial axes has no map slice to take
+    if not first:
+        queries["map_slice"] = (
+            f'for $c in ({coverage_id}) return encode($c, "image/tiff")'
+        )
+    return queries
+
+
+def run_wcps_query(query):
+    url = (
+        f"{rasdaman_ows_url}?service=WCS&version=2.0.1&request=ProcessCoverages"
+        f"&query={urllib.parse.quote(query)}"
+    )
+    start_time = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=600) as response:
+        size_in_bytes = len(response.read())
+    return time.perf_counter() - start_time, size_in_bytes
+
+
+def open_benchmark_db():
+    conn = sqlite3.connect(benchmark_db)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS benchmarks (
+            coverage_id TEXT,
+            run_time TEXT,
+            query_name TEXT,
+            latency REAL,
+            bytes INTEGER
+        )
+        """)
+    return conn
+
+
+@task(name="Benchmark Coverage")
+def benchmark_coverage(coverage_id, regression_threshold=1.5):
+    """
+    Run the representative WCPS queries against a freshly ingested coverage,
+    record latency and bytes returned, and compare them with the previous
+    benchmark of the same coverage. The results are published as a table
+    artifact, with queries that got slower than regression_threshold times
+    the previous latency flagged.
+
+    Returns the list of result rows.
+    """
+    envelope = get_coverage_envelope(coverage_id)
+    queries = build_benchmark_queries(coverage_id, envelope)
+
+    conn = open_benchmark_db()
+    try:
+        previous = {}
+        for query_name, latency, size_in_bytes in conn.execute(
+            """
+            SELECT query_name, latency, bytes FROM benchmarks
+            WHERE coverage_id = ? AND run_time = (
+                SELECT MAX(run_time) FROM benchmarks WHERE coverage_id = ?
+            )
+            """,
+            (coverage_id, coverage_id),
+        ):
+            previous[query_name] = (latency, size_in_bytes)
+
+        run_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
+        for query_name, query in queries.items():
+            try:
+                latency, size_in_bytes = run_wcps_query(query)
+            except Exception as e:
+                print(f"Benchmark query {query_name} failed for {coverage_id}: {e}")
+                rows.append({"query": query_name, "error": str(e)})
+                continue
+
+            with conn:
+                conn.execute(
+                    "INSERT INTO benchmarks VALUES (?, ?, ?, ?, ?)",
+                    (coverage_id, run_time, query_name, latency, size_in_bytes),
+                )
+
+            row = {
+                "query": query_name,
+                "latency (s)": round(latency, 3),
+                "bytes": size_in_bytes,
+            }
+            if query_name in previous:
+                previous_latency, previous_bytes = previous[query_name]
+                change = latency / previous_latency if previous_latency else 1
+                row["previous latency (s)"] = round(previous_latency, 3)
+                row["previous bytes"] = previous_bytes
+                row["change"] = f"{change:.2f}x"
+                row["regression"] = change > regression_threshold
+                if row["regression"]:
+                    print(
+                        f"Latency regression for {query_name} on {coverage_id}: {change:.2f}x"
+                    )
+            rows.append(row)
+    finally:
+        conn.close()
+
+    create_table_artifact(
+        rows,
+        key=f"benchmark-{coverage_id}".lower().replace("_", "-"),
+        description=f"Post-ingest query benchmark for `{coverage_id}`",
+    )
+
+    return rows
+
+
+def try_benchmark_coverages(coverage_ids):
+    """
+    Benchmark each coverage, logging failures instead of raising them, so that a
+    benchmark error never fails an otherwise successful ingest.
+    """
+    for coverage_id in coverage_ids:
+        try:
+            benchmark_coverage(coverage_id)
+        except Exception as e:
+            print(f"Could not benchmark {coverage_id}: {e}")
@@ -7,11 +7,16 @@ def crrel_gipl_outputs(
     branch_name="main",
     working_directory="/opt/rasdaman/user_data/snapdata/",
     ingest_directory="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/ardac/gipl/",
+    force=False,
 ):
 
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
-    ingest_tasks.run_ingest(ingest_directory, "ingest_with_nc.json")
+    coverage_id = ingest_tasks.run_ingest(
+        ingest_directory, "ingest_with_nc.json", force=force
+    )
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
@@ -9,6 +9,7 @@ def degree_days_below_zero(
     ingest_directory,
     source_directory,
     destination_directory,
+    force=False,
 ):
 
     ingest_tasks.clone_github_repository(branch_name, working_directory)
@@ -17,7 +18,11 @@ def degree_days_below_zero(
 
     ingest_tasks.copy_data_from_nfs_mount(source_directory, destination_directory)
 
-    ingest_tasks.run_ingest(ingest_directory, "hook_ingest.json")
+    coverage_id = ingest_tasks.run_ingest(
+        ingest_directory, "hook_ingest.json", force=force
+    )
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
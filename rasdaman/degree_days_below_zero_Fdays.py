@@ -11,6 +11,7 @@ def degree_days_below_zero_Fdays(
     source_directory="/opt/rasdaman-storage/coverage_data/degree_days_below_zero_Fdays/",
     zip_file="degree_days_below_zero.zip",
     python_script="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/arctic_eds/degree_days/degree_days_below_zero_Fdays/merge.py",
+    force=False,
 ):
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
@@ -23,7 +24,9 @@ def degree_days_below_zero_Fdays(
             python_script, source_directory, "degree_days_below_zero"
         )
 
-    ingest_tasks.run_ingest(ingest_directory)
+    coverage_id = ingest_tasks.run_ingest(ingest_directory, force=force)
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
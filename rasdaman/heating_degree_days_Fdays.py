@@ -11,6 +11,7 @@ def heating_degree_days_Fdays(
     source_directory="/opt/rasdaman-storage/coverage_data/heating_degree_days_Fdays/",
     zip_file="heating_degree_days.zip",
     python_script="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/arctic_eds/degree_days/heating_degree_days_Fdays/merge.py",
+    force=False,
 ):
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
@@ -23,7 +24,9 @@ def heating_degree_days_Fdays(
             python_script, ingest_directory, "heating_degree_days"
         )
 
-    ingest_tasks.run_ingest(ingest_directory)
+    coverage_id = ingest_tasks.run_ingest(ingest_directory, force=force)
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
@@ -8,10 +8,15 @@ def hsia_arctic_production(
     branch_name="main",
     working_directory="/opt/rasdaman/user_data/snapdata/",
     ingest_directory="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/hsiaa/",
+    force=False,
 ):
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
-    ingest_tasks.run_ingest(ingest_directory, "hsia_ingest_arctic.json")
+    coverage_id = ingest_tasks.run_ingest(
+        ingest_directory, "hsia_ingest_arctic.json", force=force
+    )
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
@@ -7,10 +7,15 @@ def hydrology(
     branch_name="main",
     working_directory="/opt/rasdaman/user_data/snapdata/",
     ingest_directory="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/ardac/hydrology/",
+    force=False,
 ):
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
-    ingest_tasks.run_ingest(ingest_directory, conda_env="hydrology")
+    coverage_id = ingest_tasks.run_ingest(
+        ingest_directory, conda_env="hydrology", force=force
+    )
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
@@ -7,10 +7,15 @@ def iem_ar5_2km_taspr_seasonal(
     branch_name="main",
     working_directory="/opt/rasdaman/user_data/snapdata/",
     ingest_directory="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/iem/tas_pr_2km/",
+    force=False,
 ):
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
-    ingest_tasks.run_ingest(ingest_directory, ingest_file="ar5_seasonal_ingest.json")
+    coverage_id = ingest_tasks.run_ingest(
+        ingest_directory, ingest_file="ar5_seasonal_ingest.json", force=force
+    )
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
@@ -1,10 +1,28 @@
 import os
+import glob
+import hashlib
+import json
 import tarfile
 import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
 from prefect import task
 import subprocess
 import zipfile
 
+# (branch, destination_directory) pairs already cloned or pulled by this process,
+# so flows run together by reingest_all_coverages share a single checkout
+cloned_repositories = set()
+
+# Record of what each coverage was last ingested from, used by run_ingest to
+# skip ingests when neither the recipe, the source data nor rasdaman-ingest changed
+ingest_ledger_file = "/opt/rasdaman/user_data/snapdata/ingest_ledger.json"
+ingest_ledger_lock = threading.Lock()
+
+rasdaman_ows_url = "https://zeus.snap.uaf.edu/rasdaman/ows"
+
 
 @task(name="Check for NFS Mount")
 def check_for_nfs_mount(nfs_directory="/CKAN_Data"):
@@ -74,10 +92,30 @@ def unzip_files(data_directory, zip_file):
     print(f"Unzipped {zip_file} to {extraction_dir}")
 
 
+def open_gzip_stream(tar_file):
+    """
+    Decompress a .gz file in a separate process, using pigz if it is installed
+    so reading, decompressing and checksumming run on their own threads.
+    Returns the process, whose stdout is the decompressed stream.
+    """
+    decompressor = "pigz" if shutil.which("pigz") else "gzip"
+    return subprocess.Popen(
+        [decompressor, "-dc", tar_file],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=1024 * 1024,
+    )
+
+
 @task(name="Untar File")
 def untar_file(tar_file, data_directory, flatten=False, rename=None):
     """
-    Extract a .tar.gz file to a specified directory.
+    Extract a .tar.gz file to a specified directory in a single streaming pass.
+
+    The archive can be read straight from the NFS mount: it is decompressed in
+    a separate process and each member is written with a buffered copy as it
+    is reached. Members that already exist in the output with the same size
+    are skipped, so an interrupted extraction resumes where it left off.
 
     Parameters
     ----------
@@ -89,61 +127,72 @@ def untar_file(tar_file, data_directory, flatten=False, rename=None):
         If True, ignore directory structure in the archive and extract all files directly
         into a single directory. Default is False.
     rename : str, optional
-        If provided, rename the extracted directory to this name after extraction.
-        If target exists as a directory, it will be deleted first.
+        If provided with flatten, extract into a directory with this name in
+        data_directory instead of one named after the archive.
     """
     extraction_dir = os.path.join(
         data_directory, os.path.splitext(os.path.basename(tar_file))[0]
     )
-
-    if flatten:
-        temp_extract_dir = extraction_dir + "_tmp"
-    else:
-        temp_extract_dir = extraction_dir
-
-    with tarfile.open(tar_file, "r:gz") as tar:
-        tar_file_names = tar.getnames()
-
-    all_files_exist = True
-    for file_name in tar_file_names:
-        target_name = os.path.basename(file_name) if flatten else file_name
-        target_path = os.path.join(temp_extract_dir, target_name)
-        if not os.path.exists(target_path):
-            all_files_exist = False
-            break
-
-    if all_files_exist:
-        print(f"All files from {tar_file} already exist in {temp_extract_dir}. Skipping extraction.")
-        return
-
-    if not os.path.exists(temp_extract_dir):
-        os.makedirs(temp_extract_dir)
-
-    with tarfile.open(tar_file, "r:gz") as tar:
-        if flatten:
-            for member in tar.getmembers():
-                if member.isfile():
-                    file_obj = tar.extractfile(member)
-                    if file_obj is not None:
-                        out_path = os.path.join(temp_extract_dir, os.path.basename(member.name))
-                        with open(out_path, "wb") as out_file:
-                            out_file.write(file_obj.read())
-        else:
-            tar.extractall(temp_extract_dir)
-
-    # If rename is requested
     if flatten and rename:
-        final_path = os.path.join(data_directory, rename)
-        if os.path.exists(final_path):
-            shutil.rmtree(final_path)
-        os.rename(temp_extract_dir, final_path)
-        print(f"Extracted {tar_file} to {final_path} (flatten={flatten}, renamed)")
+        extraction_dir = os.path.join(data_directory, rename)
+
+    if not os.path.exists(tar_file):
+        raise Exception(f"Tar file {tar_file} does not exist")
+
+    os.makedirs(extraction_dir, exist_ok=True)
+
+    extracted = 0
+    skipped = 0
+    process = open_gzip_stream(tar_file)
+    try:
+        with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+            for member in tar:
+                if flatten and not member.isfile():
+                    continue
+
+                target_name = os.path.basename(member.name) if flatten else member.name
+                out_path = os.path.join(extraction_dir, target_name)
+
+                if not member.isfile():
+                    tar.extract(member, extraction_dir)
+                    continue
+
+                if (
+                    os.path.exists(out_path)
+                    and os.path.getsize(out_path) == member.size
+                ):
+                    skipped += 1
+                    continue
+
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                file_obj = tar.extractfile(member)
+                with open(out_path, "wb") as out_file:
+                    shutil.copyfileobj(file_obj, out_file, 16 * 1024 * 1024)
+                # keep the archive's mtime, so data extracted again after being
+                # removed fingerprints the same in the ingest ledger
+                os.utime(out_path, (member.mtime, member.mtime))
+                extracted += 1
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+
+    if returncode != 0:
+        raise Exception(
+            f"Error decompressing {tar_file}. Error: {process.stderr.read().decode()}"
+        )
+
+    print(
+        f"Extracted {extracted} files from {tar_file} to {extraction_dir} "
+        f"(flatten={flatten}, {skipped} already present)"
+    )
 
-    else:
-        print(f"Extracted {tar_file} to {temp_extract_dir} (flatten={flatten})")
 
 @task(name="Clone GitHub Repository")
 def clone_github_repository(branch, destination_directory):
+    if (branch, destination_directory) in cloned_repositories:
+        print(f"rasdaman-ingest already up to date on branch {branch}, skipping clone")
+        return
+
     if not os.path.exists(destination_directory):
         os.makedirs(destination_directory)
 
@@ -204,6 +253,8 @@ def clone_github_repository(branch, destination_directory):
                 f"Error cloning the GitHub repository. Error: {result.stderr}"
             )
 
+    cloned_repositories.add((branch, destination_directory))
+
 
 @task(name="Run Python Script")
 def run_python_script(python_script, ingest_directory, data_directory):
@@ -232,12 +283,107 @@ def delete_coverage(coverage_id):
     if result.returncode != 0:
         raise Exception(f"Error deleting the coverage. Error: {result.stderr}")
 
+    # The coverage is gone, so its next ingest must not be skipped
+    update_ingest_ledger(coverage_id, None)
+
     print("Coverage Deletion Output:")
     print(result.stdout)
 
 
+def load_ingest_ledger():
+    if not os.path.exists(ingest_ledger_file):
+        return {}
+    with open(ingest_ledger_file) as f:
+        return json.load(f)
+
+
+def update_ingest_ledger(coverage_id, fingerprint):
+    """
+    Record the fingerprint a coverage was ingested with, or forget the
+    coverage if fingerprint is None.
+    """
+    with ingest_ledger_lock:
+        ledger = load_ingest_ledger()
+        if fingerprint is None:
+            if ledger.pop(coverage_id, None) is None:
+                return
+        else:
+            ledger[coverage_id] = fingerprint
+        temp_file = f"{ingest_ledger_file}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(ledger, f, indent=2, sort_keys=True)
+        os.replace(temp_file, ingest_ledger_file)
+
+
+def get_ingest_fingerprint(ingest_directory, ingest_file):
+    """
+    Build the fingerprint of an ingest: a hash of the ingest recipe, the size
+    and mtime of every source file matched by the recipe's input paths, and the
+    current rasdaman-ingest commit.
+
+    Recipes with before_ingestion hooks generate their source files when they
+    are ingested, so their inputs cannot be fingerprinted beforehand. Their
+    fingerprint is None and they are always ingested.
+
+    Returns the coverage ID from the recipe and the fingerprint.
+    """
+    recipe_path = os.path.join(ingest_directory, ingest_file)
+    with open(recipe_path, "rb") as f:
+        recipe_bytes = f.read()
+    recipe = json.loads(recipe_bytes)
+
+    coverage_id = recipe.get("input", {}).get("coverage_id", recipe_path)
+
+    if any(hook.get("when") != "after_ingestion" for hook in recipe.get("hooks", [])):
+        print(
+            f"Warning: {coverage_id} has hooks that generate its source files, "
+            "so it is always ingested"
+        )
+        return coverage_id, None
+
+    source_files = {}
+    for pattern in recipe.get("input", {}).get("paths", []):
+        paths = glob.glob(os.path.join(ingest_directory, pattern), recursive=True)
+        # an empty match would fingerprint the same every time and never re-ingest
+        if not paths:
+            raise Exception(
+                f"No source files match {pattern} in {ingest_directory} for {coverage_id}"
+            )
+        for path in paths:
+            stat = os.stat(path)
+            source_files[path] = [stat.st_size, stat.st_mtime]
+
+    result = subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        cwd=ingest_directory,
+        capture_output=True,
+        text=True,
+    )
+    commit = result.stdout.strip() if result.returncode == 0 else None
+
+    fingerprint = {
+        "recipe_sha256": hashlib.sha256(recipe_bytes).hexdigest(),
+        "source_files": source_files,
+        "rasdaman_ingest_commit": commit,
+    }
+    return coverage_id, fingerprint
+
+
 @task(name="Run Rasdaman Ingest Script")
-def run_ingest(ingest_directory, ingest_file="ingest.json", conda_env=False):
+def run_ingest(
+    ingest_directory, ingest_file="ingest.json", conda_env=False, force=False
+):
+    coverage_id, fingerprint = get_ingest_fingerprint(ingest_directory, ingest_file)
+    if (
+        not force
+        and fingerprint is not None
+        and load_ingest_ledger().get(coverage_id) == fingerprint
+    ):
+        print(
+            f"Skipping ingest of {coverage_id}: recipe, source data and rasdaman-ingest are unchanged"
+        )
+        return coverage_id
+
     command = [
         "/usr/local/bin/add_coverage.sh",
         ingest_file,
@@ -257,5 +403,37 @@ def run_ingest(ingest_directory, ingest_file="ingest.json", conda_env=False):
     if result.returncode != 0:
         raise Exception(f"Error running the command. Error: {result.stderr}")
 
+    update_ingest_ledger(coverage_id, fingerprint)
+
     print("Command Output:")
     print(result.stdout)
+
+    return coverage_id
+
+
+@task(name="Wait for Coverage")
+def wait_for_coverage(coverage_id, timeout=600, poll_interval=5):
+    """
+    Poll the Rasdaman WCS endpoint until a DescribeCoverage request for the
+    coverage succeeds, or raise if it is not available within timeout seconds.
+    """
+    url = (
+        f"{rasdaman_ows_url}?service=WCS&version=2.1.0"
+        f"&request=DescribeCoverage&coverageId={coverage_id}"
+    )
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=60) as response:
+                body = response.read()
+            if b"ExceptionReport" not in body:
+                print(f"Coverage {coverage_id} is available")
+                return
+        except urllib.error.URLError:
+            pass
+
+        if time.monotonic() > deadline:
+            raise Exception(
+                f"Coverage {coverage_id} was not available after {timeout} seconds"
+            )
+        time.sleep(poll_interval)
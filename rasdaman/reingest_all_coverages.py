@@ -1,6 +1,10 @@
+import json
+import os
 import sys
-import types
-from prefect import flow
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from prefect import flow, Flow
+import benchmark_tasks
 import ingest_tasks
 
 # Import all the coverage flows
@@ -36,25 +40,144 @@ from tas_2km_projected import tas_2km_projected
 from wet_days_per_year import wet_days_per_year
 from wrf_downscaled_era5_4km import ingest_wrf_downscaled_era5_4km
 
+# Coverages whose source data and ingest are large enough to saturate the
+# Rasdaman server's disk on their own. Only max_heavy_ingests of them run at
+# the same time.
+heavy_coverages = [
+    "ingest_wrf_downscaled_era5_4km",
+    "cmip6_monthly",
+    "cmip6_indicators",
+    "tas_2km_historical",
+    "tas_2km_projected",
+    "iem_ar5_2km_taspr_seasonal",
+    "crrel_gipl_outputs",
+    "ardac_beaufort_daily_slie",
+    "ardac_chukchi_daily_slie",
+    "hsia_arctic_production",
+]
+
+# Coverage flows that benchmark their own coverages as they are ingested, and take
+# a benchmark parameter
+self_benchmarking_coverages = ["ingest_wrf_downscaled_era5_4km"]
+
+
+def load_completed_coverages(state_file):
+    if not os.path.exists(state_file):
+        return set()
+    with open(state_file) as f:
+        return set(json.load(f)["completed"])
+
+
+def save_completed_coverages(state_file, completed):
+    with open(state_file, "w") as f:
+        json.dump({"completed": sorted(completed)}, f, indent=2)
+
+
 @flow(log_prints=True)
-def reingest_all_coverages(branch_name, reingest_these_coverages, delete_coverages):
-    for coverage_name in reingest_these_coverages:
-        coverage_func = globals().get(coverage_name)
-        if callable(coverage_func):
-            if delete_coverages:
-                ingest_tasks.delete_coverage(coverage_name)
+def reingest_all_coverages(
+    branch_name,
+    reingest_these_coverages,
+    delete_coverages,
+    working_directory="/opt/rasdaman/user_data/snapdata/",
+    max_concurrent_ingests=None,
+    max_heavy_ingests=1,
+    resume=True,
+    force=False,
+    benchmark=True,
+):
+    """
+    Re-ingest a list of coverages, running up to max_concurrent_ingests of them
+    at once. rasdaman-ingest is cloned once up front and shared by every
+    coverage flow. Completed coverages are recorded in a state file in the
+    working directory, so a failed run picks up where it left off when resume
+    is True. The state file is removed once every coverage has succeeded.
+    Coverages whose recipe, source data and rasdaman-ingest commit are
+    unchanged since their last ingest are skipped unless force is True, or
+    the coverage was deleted with delete_coverages.
+    If benchmark is True, each re-ingested coverage is benchmarked afterwards.
+    """
+    if max_concurrent_ingests is None:
+        # Ingests are mostly I/O bound; leave headroom for Rasdaman itself
+        max_concurrent_ingests = max(1, (os.cpu_count() or 1) // 8)
+
+    state_file = os.path.join(working_directory, "reingest_state.json")
+    completed = load_completed_coverages(state_file) if resume else set()
+    if completed:
+        print(f"Resuming, skipping completed coverages: {sorted(completed)}")
+
+    ingest_tasks.clone_github_repository(branch_name, working_directory)
+
+    pending = [
+        name
+        for name in reingest_these_coverages
+        if name not in completed and callable(globals().get(name))
+    ]
+
+    state_lock = threading.Lock()
+
+    def reingest(coverage_name):
+        if delete_coverages:
+            ingest_tasks.delete_coverage(coverage_name)
+
+        # a deleted coverage must be ingested again, whatever the ledger says
+        flow_kwargs = {"branch_name": branch_name, "force": force or delete_coverages}
+        if coverage_name in self_benchmarking_coverages:
+            flow_kwargs["benchmark"] = benchmark
+        coverage_ids = globals().get(coverage_name)(**flow_kwargs)
+
+        # flows return the ids of the coverages they ingested, which may differ
+        # from the flow name
+        if benchmark and coverage_name not in self_benchmarking_coverages:
+            benchmark_tasks.try_benchmark_coverages(coverage_ids or [])
+
+        with state_lock:
+            completed.add(coverage_name)
+            save_completed_coverages(state_file, completed)
+
+    # Heavy coverages get their own slots and the rest share the remainder, so
+    # a backlog of heavy ingests never holds up the light ones
+    heavy_workers = max(1, min(max_heavy_ingests, max_concurrent_ingests))
+    heavy_executor = ThreadPoolExecutor(max_workers=heavy_workers)
+    if max_concurrent_ingests > heavy_workers:
+        light_executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_ingests - heavy_workers
+        )
+    else:
+        light_executor = heavy_executor
+
+    failed = {}
+    try:
+        futures = {}
+        for name in pending:
+            executor = heavy_executor if name in heavy_coverages else light_executor
+            futures[executor.submit(reingest, name)] = name
+
+        for future in as_completed(futures):
+            coverage_name = futures[future]
+            try:
+                future.result()
+                print(f"Re-ingested {coverage_name}")
+            except Exception as e:
+                failed[coverage_name] = str(e)
+                print(f"Failed to re-ingest {coverage_name}: {e}")
+    finally:
+        heavy_executor.shutdown()
+        light_executor.shutdown()
+
+    if failed:
+        raise Exception(
+            f"Failed to re-ingest {len(failed)} coverages, rerun to resume: {failed}"
+        )
 
-            coverage_func(branch_name=branch_name)
+    if os.path.exists(state_file):
+        os.remove(state_file)
 
 
 if __name__ == "__main__":
     import_names = [
         name
         for name, obj in globals().items()
-        if not name.startswith("__")
-        and not name.startswith("flow")
-        and not name.startswith("reingest_all_coverages")
-        and not isinstance(obj, types.ModuleType)
+        if isinstance(obj, Flow) and not name.startswith("reingest_all_coverages")
     ]
 
     # Output the dynamic list of module names
@@ -67,5 +190,11 @@ if __name__ == "__main__":
             "branch_name": "main",
             "reingest_these_coverages": import_names,
             "delete_coverages": False,
+            "working_directory": "/opt/rasdaman/user_data/snapdata/",
+            "max_concurrent_ingests": None,
+            "max_heavy_ingests": 1,
+            "resume": True,
+            "force": False,
+            "benchmark": True,
         },
     )
@@ -9,6 +9,7 @@ def thawing_index(
     ingest_directory,
     source_directory,
     destination_directory,
+    force=False,
 ):
     ingest_tasks.clone_github_repository(branch_name, working_directory)
 
@@ -16,7 +17,11 @@ def thawing_index(
 
     ingest_tasks.copy_data_from_nfs_mount(source_directory, destination_directory)
 
-    ingest_tasks.run_ingest(ingest_directory, "hook_ingest.json")
+    coverage_id = ingest_tasks.run_ingest(
+        ingest_directory, "hook_ingest.json", force=force
+    )
+
+    return [coverage_id]
 
 
 if __name__ == "__main__":
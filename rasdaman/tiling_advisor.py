@@ -0,0 +1,176 @@
+import glob
+import json
+import math
+import os
+import subprocess
+
+from prefect import task
+from prefect.artifacts import create_table_artifact
+
+# Rasdaman stores each tile as one blob, so tiles of a few MB balance the
+# number of tiles read per query against the bytes read per tile.
+default_tile_size = 4 * 1024 * 1024
+
+# Prints the dimensions, dtype and chunking of every data variable as JSON.
+# Run inside the conda environment that has xarray, like combine_netcdfs.py.
+inspect_script = """
+import json, sys
+import xarray as xr
+with xr.open_dataset(sys.argv[1]) as ds:
+    print(json.dumps({
+        name: {
+            "dims": list(var.dims),
+            "shape": list(var.shape),
+            "itemsize": var.dtype.itemsize,
+            "chunks": list(var.encoding.get("chunksizes") or []),
+        }
+        for name, var in ds.data_vars.items()
+    }))
+"""
+
+
+def inspect_netcdf(netcdf_file, conda_env="rasdaman"):
+    command = [
+        "bash",
+        "-c",
+        f'source /opt/miniconda3/bin/activate {conda_env} && python -c "$1" "$2"',
+        "bash",
+        inspect_script,
+        netcdf_file,
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def plan_tile_shape(shape, itemsize, access_pattern, tile_size, source_chunks=None):
+    """
+    Choose a tile shape for a (time, y, x) shaped variable.
+
+    access_pattern is one of:
+        "time_series" - point queries over the full time axis, so tiles are as
+            long in time as possible and small in space
+        "map" - single time slice maps, so tiles are one time step deep and as
+            large in space as possible
+        "balanced" - a mix of both, with roughly equal tile extents
+
+    Spatial tile extents are rounded to a multiple of the source chunking, if
+    any, so a tile never straddles part of a source chunk.
+    """
+    elements = max(1, tile_size // itemsize)
+    nt, ny, nx = shape[0], shape[-2], shape[-1]
+
+    if access_pattern == "time_series":
+        t = min(nt, elements)
+        side = max(1, math.isqrt(elements // t))
+    elif access_pattern == "map":
+        t = 1
+        side = max(1, math.isqrt(elements))
+    elif access_pattern == "balanced":
+        side = max(1, round(elements ** (1 / 3)))
+        t = min(nt, max(1, elements // (side * side)))
+    else:
+        raise ValueError(
+            f"Unknown access pattern {access_pattern}, expected time_series, map or balanced"
+        )
+
+    ty, tx = min(ny, side), min(nx, side)
+    if source_chunks:
+        chunk_y, chunk_x = source_chunks[-2], source_chunks[-1]
+        if chunk_y < ty:
+            ty = ty // chunk_y * chunk_y
+        if chunk_x < tx:
+            tx = tx // chunk_x * chunk_x
+
+    return [t, ty, tx]
+
+
+@task(name="Advise Ingest Tiling")
+def advise_tiling(
+    ingest_directory,
+    ingest_file="ingest.json",
+    access_pattern="balanced",
+    tile_size=default_tile_size,
+    index=None,
+    apply=False,
+    conda_env="rasdaman",
+):
+    """
+    Inspect the source NetCDF of an ingest recipe and recommend a tiling for
+    the expected access pattern, reporting the projected tile count and size
+    as a table artifact.
+
+    If apply is True, a copy of the recipe with the recommended "tiling"
+    option (and the index, if given) is written next to the original as
+    <recipe>_tuned.json, and its file name is returned so it can be passed to
+    run_ingest. Otherwise the original recipe file name is returned.
+    """
+    recipe_path = os.path.join(ingest_directory, ingest_file)
+    with open(recipe_path) as f:
+        recipe = json.load(f)
+
+    source_files = sorted(
+        path
+        for pattern in recipe.get("input", {}).get("paths", [])
+        for path in glob.glob(os.path.join(ingest_directory, pattern))
+    )
+    if not source_files:
+        raise Exception(f"No source files found for {recipe_path}")
+
+    variables = inspect_netcdf(source_files[0], conda_env)
+    # The largest data variable is the one that drives the tiling
+    name, variable = max(
+        variables.items(), key=lambda item: math.prod(item[1]["shape"])
+    )
+    shape = variable["shape"]
+    if len(shape) != 3:
+        raise Exception(
+            f"Expected a (time, y, x) variable in {source_files[0]}, got {name}{variable['dims']}"
+        )
+
+    # Files in a time series ingest are stacked along the time axis
+    shape = [shape[0] * len(source_files)] + shape[1:]
+
+    tile_shape = plan_tile_shape(
+        shape, variable["itemsize"], access_pattern, tile_size, variable["chunks"]
+    )
+    tile_bytes = math.prod(tile_shape) * variable["itemsize"]
+    tile_count = math.prod(math.ceil(n / t) for n, t in zip(shape, tile_shape))
+
+    extents = ", ".join(f"0:{t - 1}" for t in tile_shape)
+    tiling = f"ALIGNED [{extents}] TILE SIZE {tile_bytes}"
+    if index:
+        tiling += f" INDEX {index}"
+
+    options = recipe.get("recipe", {}).get("options", {})
+    create_table_artifact(
+        [
+            {
+                "recipe": ingest_file,
+                "variable": name,
+                "dims": " x ".join(variable["dims"]),
+                "shape": " x ".join(str(n) for n in shape),
+                "source chunks": " x ".join(str(n) for n in variable["chunks"])
+                or "contiguous",
+                "access pattern": access_pattern,
+                "current tiling": options.get("tiling", "default"),
+                "recommended tiling": tiling,
+                "tiles": tile_count,
+                "tile size (MB)": round(tile_bytes / (1024 * 1024), 2),
+            }
+        ],
+        description=f"Tiling advice for {ingest_file}",
+    )
+    print(
+        f"Recommended tiling for {ingest_file} ({access_pattern}): {tiling}, "
+        f"{tile_count} tiles of {tile_bytes / (1024 * 1024):.2f} MB"
+    )
+
+    if not apply:
+        return ingest_file
+
+    recipe.setdefault("recipe", {}).setdefault("options", {})["tiling"] = tiling
+    tuned_file = f"{os.path.splitext(ingest_file)[0]}_tuned.json"
+    with open(os.path.join(ingest_directory, tuned_file), "w") as f:
+        json.dump(recipe, f, indent=2)
+
+    return tuned_file
@@ -1,10 +1,13 @@
-import time
+import os
+import shutil
 import subprocess
 
 from prefect import flow, task
 from prefect.artifacts import create_link_artifact
 
+import benchmark_tasks
 import ingest_tasks
+import tiling_advisor
 
 # this flow can hit multiple ERA5 variables
 
@@ -37,14 +40,25 @@ def run_combine_netcdfs_script(ingest_directory: str, variable_name: str):
         print(f"STDERR:\n{result.stderr}")
 
 
+def get_directory_size(directory):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(directory)
+        for name in names
+    )
+
+
 @flow(log_prints=True)
 def ingest_wrf_downscaled_era5_4km(
     branch_name="main",
     working_directory="/opt/rasdaman/user_data/snapdata/",
     ingest_directory="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/ardac/daily_wrf_downscaled_era5/",
     source_directory="/workspace/Shared/Tech_Projects/daily_wrf_downscaled_era5_4km/",
-    destination_directory="/opt/rasdaman/user_data/snapdata/rasdaman-ingest/ardac/daily_wrf_downscaled_era5/",
     era5_variables=None,
+    scratch_budget_gb=500,
+    apply_tiling_advice=False,
+    force=False,
+    benchmark=True,
 ):
 
     ingest_tasks.clone_github_repository(branch_name, working_directory)
@@ -52,35 +66,87 @@ def ingest_wrf_downscaled_era5_4km(
     ingest_tasks.check_for_nfs_mount()
 
     # for each variable, we must
-    # copy the data from the backed up source, and untar it and flatten it
+    # stream the data from the backed up source, untarring and flattening it
     # then we need to combine the data into a single file
-    # run two ingest commands, one for the "normal" coverage and one for the WCS optimized coverage 
+    # run two ingest commands, one for the "normal" coverage and one for the WCS optimized coverage
     # name scheme: t2_min_ingest.json, t2_min__ingest_wcs_only.json
-    for variable in era5_variables:
-        dest_var_dir = f"{destination_directory}/{variable}"
-        source_var_dir = f"{source_directory}/{variable}"
-        var_ingest_recipe = f"{variable}_ingest.json"
-        var_ingest_recipe_wcs_only = f"{variable}_ingest_wcs_only.json"
-
-        ingest_tasks.copy_data_from_nfs_mount(source_var_dir, destination_directory)
-        ingest_tasks.untar_file(
-            f"{dest_var_dir}/{variable}_era5_4km_archive.tar.gz",
+    #
+    # The extraction of the next variable runs in the background while the
+    # current one is combined and ingested. It is only started early while the
+    # extracted data of every staged variable, plus the combined file of the current
+    # one and the next extraction, both estimated at the size of the current
+    # extraction, stays under scratch_budget_gb. The extracted data of each variable
+    # is removed once it is ingested.
+    extractions = {}
+    staged_bytes = {}
+    coverage_ids = []
+
+    def get_archive_path(variable):
+        return f"{source_directory}/{variable}/{variable}_era5_4km_archive.tar.gz"
+
+    def stage(variable):
+        extractions[variable] = ingest_tasks.untar_file.submit(
+            get_archive_path(variable),
             ingest_directory,
             flatten=True,
             rename=variable,
         )
 
+    # the extracted data is at least as large as the compressed archive
+    scratch_budget_bytes = scratch_budget_gb * 1024**3
+    first_archive_bytes = os.path.getsize(get_archive_path(era5_variables[0]))
+    if first_archive_bytes > scratch_budget_bytes:
+        raise Exception(
+            f"The {era5_variables[0]} archive alone is larger than the scratch budget "
+            f"of {scratch_budget_gb} GB"
+        )
+    free_bytes = shutil.disk_usage(ingest_directory).free
+    if free_bytes < scratch_budget_bytes:
+        print(
+            f"Warning: only {free_bytes / 1024**3:.0f} GB free in {ingest_directory}, "
+            f"less than the scratch budget of {scratch_budget_gb} GB"
+        )
+
+    stage(era5_variables[0])
+    for i, variable in enumerate(era5_variables):
+        next_variable = era5_variables[i + 1] if i + 1 < len(era5_variables) else None
+        var_ingest_recipe = f"{variable}_ingest.json"
+        var_ingest_recipe_wcs_only = f"{variable}_ingest_wcs_only.json"
+
+        extractions[variable].result()
+
+        extraction_dir = os.path.join(ingest_directory, variable)
+        staged_bytes[variable] = get_directory_size(extraction_dir)
+        # the combined file and the next extraction are about the size of this one
+        estimated_bytes = sum(staged_bytes.values()) + 2 * staged_bytes[variable]
+        if next_variable and estimated_bytes < scratch_budget_bytes:
+            stage(next_variable)
+
         run_combine_netcdfs_script(ingest_directory, variable)
 
-        ingest_tasks.run_ingest(ingest_directory, var_ingest_recipe)
+        # The regular coverage serves maps, the WCS only one point time series
+        var_ingest_recipe = tiling_advisor.advise_tiling(
+            ingest_directory, var_ingest_recipe, "map", apply=apply_tiling_advice
+        )
+        var_ingest_recipe_wcs_only = tiling_advisor.advise_tiling(
+            ingest_directory,
+            var_ingest_recipe_wcs_only,
+            "time_series",
+            apply=apply_tiling_advice,
+        )
 
-        ingest_tasks.run_ingest(ingest_directory, var_ingest_recipe_wcs_only)
+        coverage_id = ingest_tasks.run_ingest(
+            ingest_directory, var_ingest_recipe, force=force
+        )
+        wcs_coverage_id = ingest_tasks.run_ingest(
+            ingest_directory, var_ingest_recipe_wcs_only, force=force
+        )
 
         # for each ingest build a WMS link artifact
         wms_url = (
-            "https://zeus.snap.uaf.edu/rasdaman/ows"
+            f"{ingest_tasks.rasdaman_ows_url}"
             "?service=WMS&version=1.3.0&request=GetMap"
-            f"&layers=era5_4km_daily_{variable}"
+            f"&layers={coverage_id}"
             "&bbox=-1000000,600000,1000000,2500000"
             "&crs=EPSG:3338"
             '&time="2001-11-04T00:00:00.000Z"'
@@ -91,12 +157,24 @@ def ingest_wrf_downscaled_era5_4km(
         create_link_artifact(
             wms_url,
             link_text=f"WMS preview: {variable}",
-            description=(
-                "GetMap request for the " f"`era5_4km_daily_{variable}` coverage"
-            ),
+            description=f"GetMap request for the `{coverage_id}` coverage",
         )
 
-        time.sleep(10)
+        # Make sure both coverages are being served before moving on
+        ingest_tasks.wait_for_coverage(coverage_id)
+        ingest_tasks.wait_for_coverage(wcs_coverage_id)
+
+        coverage_ids.extend([coverage_id, wcs_coverage_id])
+        if benchmark:
+            benchmark_tasks.try_benchmark_coverages([coverage_id, wcs_coverage_id])
+
+        shutil.rmtree(extraction_dir)
+        del staged_bytes[variable]
+
+        if next_variable and next_variable not in extractions:
+            stage(next_variable)
+
+    return coverage_ids
 
 
 if __name__ == "__main__":
@@ -122,7 +200,10 @@ if __name__ == "__main__":
             "working_directory": "/opt/rasdaman/user_data/snapdata/",
             "ingest_directory": "/opt/rasdaman/user_data/snapdata/rasdaman-ingest/ardac/daily_wrf_downscaled_era5/",
             "source_directory": "/workspace/Shared/Tech_Projects/daily_wrf_downscaled_era5_4km/",
-            "destination_directory": "/opt/rasdaman/user_data/snapdata/rasdaman-ingest/ardac/daily_wrf_downscaled_era5",
             "era5_variables": era5_variables,
+            "scratch_budget_gb": 500,
+            "apply_tiling_advice": False,
+            "force": False,
+            "benchmark": True,
         },
     )
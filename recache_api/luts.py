@@ -15,4 +15,58 @@ ncr_cached_urls = {
     "/indicators/base/area/": "area",
 }
 
-eds_cached_url = "/eds/all/"
\ No newline at end of file
+eds_cached_url = "/eds/all/"
+
+# Rasdaman coverages read by each cached route, used to re-warm only the routes
+# affected by a re-ingest. Coverage names match the flow names used by
+# rasdaman/reingest_all_coverages.py.
+route_coverages = {
+    "/alfresco/flammability/local/": ["alfresco_relative_flammability_30yr"],
+    "/alfresco/veg_type/local/": ["alfresco_vegetation_type_percentage"],
+    "/beetles/point/": ["beetle_risk"],
+    "/elevation/point/": ["astergdem_min_max_avg"],
+    "/taspr/point/": [
+        "iem_cru_2km_taspr_seasonal_baseline_stats",
+        "iem_ar5_2km_taspr_seasonal",
+    ],
+    "/indicators/base/point/": ["ncar12km_indicators_era_summaries"],
+    "/ncr/permafrost/point/": ["crrel_gipl_outputs"],
+    "/eds/hydrology/point/": ["hydrology"],
+    "/alfresco/flammability/area/": ["alfresco_relative_flammability_30yr"],
+    "/alfresco/veg_type/area/": ["alfresco_vegetation_type_percentage"],
+    "/beetles/area/": ["beetle_risk"],
+    "/elevation/area/": ["astergdem_min_max_avg"],
+    "/taspr/area/": [
+        "iem_cru_2km_taspr_seasonal_baseline_stats",
+        "iem_ar5_2km_taspr_seasonal",
+    ],
+    "/indicators/base/area/": ["ncar12km_indicators_era_summaries"],
+    "/eds/all/": [
+        "air_freezing_index_Fdays",
+        "air_thawing_index_Fdays",
+        "alfresco_relative_flammability_30yr",
+        "alfresco_vegetation_type_percentage",
+        "annual_mean_snowfall",
+        "annual_mean_temp",
+        "annual_precip_totals_mm",
+        "astergdem_min_max_avg",
+        "beetle_risk",
+        "cmip6_indicators",
+        "cmip6_monthly",
+        "crrel_gipl_outputs",
+        "degree_days_below_zero_Fdays",
+        "design_freezing_index",
+        "design_thawing_index",
+        "dot_precip",
+        "heating_degree_days_Fdays",
+        "hydrology",
+        "iem_ar5_2km_taspr_seasonal",
+        "iem_cru_2km_taspr_seasonal_baseline_stats",
+        "jan_min_mean_max_temp",
+        "july_min_mean_max_temp",
+        "ncar12km_indicators_era_summaries",
+        "tas_2km_historical",
+        "tas_2km_projected",
+        "wet_days_per_year",
+    ],
+}
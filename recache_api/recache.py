@@ -3,8 +3,28 @@ import recache_tasks
 
 
 @flow(log_prints=True)
-def recache_api(cached_apps, cache_url):
-    recache_tasks.recache_api(cached_apps, cache_url)
+def recache_api(
+    cached_apps,
+    cache_url,
+    changed_coverages=None,
+    popular_places=None,
+    concurrency=8,
+    route_rate_limit=4,
+    max_retries=3,
+    results_db=recache_tasks.default_results_db,
+    regression_threshold=1.25,
+):
+    recache_tasks.recache_api(
+        cached_apps,
+        cache_url,
+        changed_coverages,
+        popular_places,
+        concurrency,
+        route_rate_limit,
+        max_retries,
+        results_db=results_db,
+        regression_threshold=regression_threshold,
+    )
 
 
 if __name__ == "__main__":
@@ -14,5 +34,10 @@ if __name__ == "__main__":
         parameters={
             "cached_apps": ["eds", "ncr"],
             "cache_url": "https://earthmaps.io",
+            "changed_coverages": None,
+            "popular_places": None,
+            "concurrency": 8,
+            "route_rate_limit": 4,
+            "max_retries": 3,
         },
     )
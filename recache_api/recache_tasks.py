@@ -1,10 +1,16 @@
+import asyncio
+import httpx
+import math
+import os
 import requests
+import sqlite3
 import time
+from datetime import datetime
 from prefect import task, get_run_logger
-from luts import eds_cached_url, ncr_cached_urls
+from prefect.artifacts import create_markdown_artifact
+from luts import eds_cached_url, ncr_cached_urls, route_coverages
 
-status_counts = {}
-error_urls = {}
+default_results_db = os.path.join(os.path.dirname(__file__), "recache_results.sqlite")
 
 
 # Helper: get the list of places to construct URLs for various endpoints,
@@ -31,25 +37,147 @@ def route_type_matches_place_type(route_type, place):
     return True
 
 
+def get_changed_routes(changed_coverages):
+    """Maps a list of changed Rasdaman coverages to the set of cached routes
+    that read from any of them.
+
+    Args:
+        changed_coverages - List of coverage names, e.g., ["beetle_risk"],
+            or None to recache every route
+
+    Returns:
+        A set of routes, or None if every route should be recached.
+
+    """
+    if changed_coverages is None:
+        return None
+
+    logger = get_run_logger()
+    known_coverages = set().union(*route_coverages.values())
+    for coverage in changed_coverages:
+        if coverage not in known_coverages:
+            logger.warning(f"No cached routes read from coverage {coverage}")
+
+    return {
+        route
+        for route, coverages in route_coverages.items()
+        if set(coverages) & set(changed_coverages)
+    }
+
+
+def prioritize_endpoints(endpoints, popular_places):
+    """Orders endpoints so that every route for the most popular places is
+    requested first. Places missing from popular_places keep their original
+    order after the popular ones.
+
+    Args:
+        endpoints - List of (route, place_id, url) tuples
+        popular_places - List of place IDs, most popular first, or None
+
+    Returns:
+        The reordered list of endpoints.
+
+    """
+    if not popular_places:
+        return endpoints
+
+    rank = {place_id: i for i, place_id in enumerate(popular_places)}
+    return sorted(endpoints, key=lambda endpoint: rank.get(endpoint[1], len(rank)))
+
+
+class RouteRateLimiter:
+    """Spaces out request start times per route so that no single route is hit
+    more than `rate` times per second, regardless of the overall concurrency.
+    A rate of 0 or None disables the limit."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_times = {}
+        self.locks = {}
+
+    async def wait(self, route):
+        if not self.interval:
+            return
+        lock = self.locks.setdefault(route, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            next_time = self.next_times.get(route, now)
+            if next_time > now:
+                await asyncio.sleep(next_time - now)
+            self.next_times[route] = max(now, next_time) + self.interval
+
+
 @task(name="Recache API")
-def recache_api(cached_apps, cache_url):
+def recache_api(
+    cached_apps,
+    cache_url,
+    changed_coverages=None,
+    popular_places=None,
+    concurrency=8,
+    route_rate_limit=4,
+    max_retries=3,
+    timeout=300,
+    results_db=default_results_db,
+    regression_threshold=1.25,
+):
     """Recaches the API endpoints for the given applications.
 
     Args:
         cached_apps - List of applications to recache, e.g., ["eds", "ncr"]
         cache_url - The base URL for the API cache, e.g., https://earthmaps.io
+        changed_coverages - Optional list of re-ingested coverages; if given,
+            only the routes that read from them are recached
+        popular_places - Optional list of place IDs, most popular first, whose
+            URLs are recached before all others
+        concurrency - Maximum number of requests in flight at once
+        route_rate_limit - Maximum requests per second started against any one route
+        max_retries - Number of times to retry a URL that fails with a 5XX or connection error
+        timeout - Seconds to wait for a single request before giving up
+        results_db - Path to the SQLite store of per-URL results across runs
+        regression_threshold - Flag routes whose p95 latency grew by more than
+            this factor since the previous run
 
     Returns:
-        Nothing. Prints the URLs being recached and their status code.
+        Nothing. Prints the URLs being recached and their status code, and
+        publishes a latency report artifact.
 
     """
-    if "eds" in cached_apps:
-        recache_eds(cache_url)
+    logger = get_run_logger()
+
+    routes = get_changed_routes(changed_coverages)
+    if routes is not None:
+        logger.info(f"Recaching routes affected by {changed_coverages}: {routes}")
+
+    endpoints = []
+    if "eds" in cached_apps and (routes is None or eds_cached_url in routes):
+        endpoints += get_eds_endpoints(cache_url)
 
     if "ncr" in cached_apps:
-        recache_ncr(cache_url)
+        endpoints += get_ncr_endpoints(cache_url, routes)
+
+    endpoints = prioritize_endpoints(endpoints, popular_places)
+
+    logger.info(
+        f"Recaching {len(endpoints)} URLs with concurrency {concurrency} and a limit of {route_rate_limit} requests per second per route"
+    )
+
+    started = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    results = asyncio.run(
+        crawl_endpoints(endpoints, concurrency, route_rate_limit, max_retries, timeout)
+    )
+
+    # Count status codes and collect any non-200 URLs
+    status_counts = {}
+    error_urls = {}
+    for result in results:
+        code = result["status"]
+        status_counts[code] = status_counts.get(code, 0) + 1
+        if code != 200:
+            error_urls.setdefault(code, []).append(result["url"])
+
+    run_id = save_results(results_db, started, cache_url, results)
+    create_latency_report(results_db, run_id, regression_threshold)
 
-    logger = get_run_logger()
     logger.info(f"Status code summary: {status_counts}")
     for code, urls in error_urls.items():
         logger.info(f"URLs with status {code}:")
@@ -60,33 +188,47 @@ def recache_api(cached_apps, cache_url):
                 logger.error(f"  {url}")
 
 
-def recache_eds(cache_url):
+def get_eds_endpoints(cache_url):
     # Fetch the list of places to cache: all Alaska communities
     places = get_places(cache_url + "/places/communities?tags=eds")
-    get_matching_endpoints(places, eds_cached_url, "community", cache_url)
+    return get_matching_endpoints(places, eds_cached_url, "community", cache_url)
+
 
+def get_ncr_endpoints(cache_url, routes=None):
+    # Only the routes affected by changed coverages, if any were given
+    ncr_routes = {
+        route: route_type
+        for route, route_type in ncr_cached_urls.items()
+        if routes is None or route in routes
+    }
+    if not ncr_routes:
+        return []
 
-def recache_ncr(cache_url):
     places_url = cache_url + "/places/all?tags=ncr"
     places = get_places(places_url)  # has both communities (points) and areas
 
     # Iterate over the list of URLs that need to be cached
-    for route, route_type in ncr_cached_urls.items():
-        get_matching_endpoints(places, route, route_type, cache_url)
+    endpoints = []
+    for route, route_type in ncr_routes.items():
+        endpoints += get_matching_endpoints(places, route, route_type, cache_url)
+    return endpoints
 
 
-# For a list of places, request every endpoint
+# For a list of places, build every endpoint URL
 # where the route type (community or area) matches the place type.
 # This is because some endpoints can only take areas or points.
 def get_matching_endpoints(places, route, route_type, cache_url):
+    endpoints = []
     for place in places:
         if route_type_matches_place_type(route_type, place):
-            get_endpoint(route, place, route_type, cache_url)
+            url = build_url(route, place, route_type, cache_url)
+            endpoints.append((route, place["id"], url))
+    return endpoints
 
 
-def get_endpoint(route, place, route_type, cache_url):
-    """Requests a specific endpoint of the API with parameters coming from
-    the JSON of communities or areas.
+def build_url(route, place, route_type, cache_url):
+    """Builds the URL for a specific endpoint of the API with parameters coming
+    from the JSON of communities or areas.
 
      Args:
          route - Current route ex. /taspr/area/
@@ -95,57 +237,314 @@ def get_endpoint(route, place, route_type, cache_url):
          cache_url - The base URL for the API cache, e.g., https://earthmaps.io
 
      Returns:
-         Nothing.
+         The URL to request.
 
     """
-    logger = get_run_logger()
-
-    # Build the URL to query based on type
     if route_type == "community":
-        url = cache_url + route + str(place["latitude"]) + "/" + str(place["longitude"])
-    else:
-        url = cache_url + route + str(place["id"])
+        return (
+            cache_url + route + str(place["latitude"]) + "/" + str(place["longitude"])
+        )
+    return cache_url + route + str(place["id"])
 
-    logger.info(f"Running URL: {url}")
 
-    start_time = time.perf_counter()
+async def crawl_endpoints(
+    endpoints, concurrency, route_rate_limit, max_retries, timeout
+):
+    """Requests every (route, URL) pair in endpoints through one pooled,
+    keep-alive HTTP client, with at most `concurrency` requests in flight.
 
-    # Collects returned status from GET request
-    status = requests.get(url)
+     Args:
+         endpoints - List of (route, place_id, url) tuples
+         concurrency - Maximum number of requests in flight at once
+         route_rate_limit - Maximum requests per second started against any one route
+         max_retries - Number of retries for 5XX or connection errors
+         timeout - Seconds to wait for a single request
 
-    end_time = time.perf_counter()
+     Returns:
+         A list of result dicts, one per endpoint, as returned by get_endpoint.
 
-    # Count status code
-    code = status.status_code
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiter = RouteRateLimiter(route_rate_limit)
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+
+    async with httpx.AsyncClient(
+        limits=limits, timeout=timeout, follow_redirects=True
+    ) as client:
+        return await asyncio.gather(
+            *[
+                get_endpoint(
+                    client, semaphore, rate_limiter, route, place_id, url, max_retries
+                )
+                for route, place_id, url in endpoints
+            ]
+        )
+
+
+async def get_endpoint(
+    client, semaphore, rate_limiter, route, place_id, url, max_retries
+):
+    """Requests a specific endpoint of the API, retrying with exponential
+    backoff on 5XX responses and connection errors.
+
+     Args:
+         client - Shared httpx.AsyncClient
+         semaphore - Semaphore bounding the number of requests in flight
+         rate_limiter - RouteRateLimiter shared across the crawl
+         route - Current route ex. /taspr/area/
+         place_id - ID of the community or area in the URL
+         url - Full URL to request
+         max_retries - Number of retries for 5XX or connection errors
+
+     Returns:
+         A dict with the route, place, URL, final status code (or exception
+         name), response size in bytes and latency in seconds of the last attempt.
+
+    """
+    logger = get_run_logger()
+
+    for attempt in range(max_retries + 1):
+        # Wait for the route's slot before taking a request slot, so requests queued
+        # on one route do not hold up requests to the others
+        await rate_limiter.wait(route)
+
+        async with semaphore:
+            logger.info(f"Running URL: {url}")
+
+            start_time = time.perf_counter()
+
+            # Collects returned status from GET request
+            try:
+                status = await client.get(url)
+                code = status.status_code
+            except httpx.TransportError as e:
+                status = None
+                code = type(e).__name__
 
-    # Initializes the status_counts diectionary for a given status code
-    # and increments the count for that status code.
-    status_counts[code] = status_counts.get(code, 0) + 1
+            end_time = time.perf_counter()
 
-    # Track any non-200 URLs
-    if code != 200:
-        # setdefault initializes the list if the key does not exist
-        # Append the URL to the list for this status code
-        error_urls.setdefault(code, []).append(url)
+        # Retry 5XX errors and connection problems with exponential backoff
+        retryable = status is None or code >= 500
+        if retryable and attempt < max_retries:
+            delay = 2**attempt
+            logger.warning(
+                f"Retrying {url} in {delay} seconds after {code} (attempt {attempt + 1} of {max_retries})"
+            )
+            await asyncio.sleep(delay)
+            continue
+        break
+
+    # Size of the response content in bytes
+    size_in_bytes = len(status.content) if status is not None else 0
 
     # If the status code is 200, we print out the status code, the content size.
     if code == 200:
-        # Size of the response content in bytes
-        size_in_bytes = len(status.content)
-
         logger.info(
-            f"Successfully recached {url}\nStatus Code: {status.status_code}\nSize of response: {size_in_bytes} bytes\nTime taken for request: {end_time - start_time:.1f} seconds"
+            f"Successfully recached {url}\nStatus Code: {code}\nSize of response: {size_in_bytes} bytes\nTime taken for request: {end_time - start_time:.1f} seconds"
         )
     elif code == 404:
         logger.warning(
-            f"No data available at {url}\nStatus Code: {status.status_code}\nTime taken for request: {end_time - start_time:.1f} seconds"
+            f"No data available at {url}\nStatus Code: {code}\nTime taken for request: {end_time - start_time:.1f} seconds"
         )
     elif code == 422:
         logger.warning(
-            f"Outside of bounding box at {url}\nStatus Code: {status.status_code}\nTime taken for request: {end_time - start_time:.1f} seconds"
+            f"Outside of bounding box at {url}\nStatus Code: {code}\nTime taken for request: {end_time - start_time:.1f} seconds"
         )
     else:
         # Catch all for 5XX errors
         logger.error(
-            f"Failed to recache {url}\nStatus Code: {status.status_code}\nTime taken for request: {end_time - start_time:.1f} seconds"
+            f"Failed to recache {url}\nStatus Code: {code}\nTime taken for request: {end_time - start_time:.1f} seconds"
         )
+
+    return {
+        "route": route,
+        "place": place_id,
+        "url": url,
+        "status": code,
+        "bytes": size_in_bytes,
+        "latency": end_time - start_time,
+    }
+
+
+def open_results_db(results_db):
+    conn = sqlite3.connect(results_db)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started TEXT,
+            cache_url TEXT,
+            url_count INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS results (
+            run_id INTEGER,
+            route TEXT,
+            place TEXT,
+            status,
+            bytes INTEGER,
+            latency REAL
+        );
+        CREATE INDEX IF NOT EXISTS results_run_route ON results (run_id, route);
+        """)
+    return conn
+
+
+def save_results(results_db, started, cache_url, results):
+    """Writes one row per recached URL to the results store.
+
+    Args:
+        results_db - Path to the SQLite results store
+        started - Timestamp of the start of the run
+        cache_url - The base URL for the API cache
+        results - List of result dicts from get_endpoint
+
+    Returns:
+        The ID of the new run.
+
+    """
+    conn = open_results_db(results_db)
+    try:
+        with conn:
+            run_id = conn.execute(
+                "INSERT INTO runs (started, cache_url, url_count) VALUES (?, ?, ?)",
+                (started, cache_url, len(results)),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        r["route"],
+                        r["place"],
+                        r["status"],
+                        r["bytes"],
+                        r["latency"],
+                    )
+                    for r in results
+                ],
+            )
+    finally:
+        conn.close()
+    return run_id
+
+
+# Helper: nearest-rank percentile of an already sorted list
+def percentile(sorted_values, pct):
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def get_route_latencies(conn, run_id):
+    """Returns {route: {"count", "p50", "p95", "p99"}} for the successful
+    requests of a run."""
+    latencies = {}
+    rows = conn.execute(
+        "SELECT route, latency FROM results WHERE run_id = ? AND status = 200",
+        (run_id,),
+    )
+    for route, latency in rows:
+        latencies.setdefault(route, []).append(latency)
+
+    stats = {}
+    for route, values in latencies.items():
+        values.sort()
+        stats[route] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+    return stats
+
+
+def get_previous_run(conn, run_id, route):
+    """Gets the latest run before run_id against the same cache_url with
+    successful requests to route, or None. Incremental runs only request some
+    routes, so the previous run differs between routes."""
+    return conn.execute(
+        """
+        SELECT MAX(results.run_id) FROM results
+        JOIN runs ON runs.run_id = results.run_id
+        WHERE results.run_id < ? AND results.route = ? AND results.status = 200
+            AND runs.cache_url = (SELECT cache_url FROM runs WHERE run_id = ?)
+        """,
+        (run_id, route, run_id),
+    ).fetchone()[0]
+
+
+def create_latency_report(results_db, run_id, regression_threshold):
+    """Publishes a markdown artifact with p50/p95/p99 latency per route for a
+    run, compared for each route against the latest earlier run against the
+    same cache_url that requested it. Routes whose p95 latency grew by more
+    than regression_threshold are flagged.
+
+    Args:
+        results_db - Path to the SQLite results store
+        run_id - ID of the run to report on
+        regression_threshold - Factor of p95 growth that counts as a regression
+
+    Returns:
+        The ID of the created artifact.
+
+    """
+    logger = get_run_logger()
+
+    conn = open_results_db(results_db)
+    try:
+        current = get_route_latencies(conn, run_id)
+        previous_runs = {}
+        run_latencies = {}
+        for route in current:
+            previous_run = get_previous_run(conn, run_id, route)
+            previous_runs[route] = previous_run
+            if previous_run is not None and previous_run not in run_latencies:
+                run_latencies[previous_run] = get_route_latencies(conn, previous_run)
+    finally:
+        conn.close()
+
+    regressions = []
+    rows = ""
+    for route, stats in sorted(current.items()):
+        previous_run = previous_runs[route]
+        prev = run_latencies.get(previous_run, {}).get(route)
+        if prev:
+            change = stats["p95"] / prev["p95"] if prev["p95"] else float("inf")
+            change_text = f"{change:.2f}x"
+            if change > regression_threshold:
+                regressions.append(route)
+                change_text = f"⚠️ {change_text}"
+        else:
+            change_text = "N/A"
+        compared_to = previous_run if previous_run is not None else "N/A"
+        rows += f"| `{route}` | {stats['count']} | {stats['p50']:.2f} | {stats['p95']:.2f} | {stats['p99']:.2f} | {change_text} | {compared_to} |\n"
+
+    if regressions:
+        for route in regressions:
+            logger.warning(f"p95 latency regression on {route}")
+        regression_section = "\n".join(f"- `{route}`" for route in regressions)
+    else:
+        regression_section = "*No latency regressions*"
+
+    markdown_content = f"""# API Recache Latency Report
+
+**Run**: {run_id}  
+**Compared to**: the latest earlier run against the same cache URL that requested each route  
+**Regression threshold**: {regression_threshold}x p95
+
+## Latency per route (seconds, successful requests)
+
+| Route | Requests | p50 | p95 | p99 | p95 vs. previous | Previous run |
+|-------|----------|-----|-----|-----|------------------|--------------|
+{rows}
+## Regressions
+
+{regression_section}
+"""
+
+    artifact_id = create_markdown_artifact(
+        markdown_content, key="recache-latency-report"
+    )
+    logger.info(f"Created recache latency report artifact: {artifact_id}")
+
+    return artifact_id
@@ -0,0 +1,354 @@
+"""Worker script for fused cascade regridding of CMIP6 data.
+
+This script is not run by Prefect directly. The downscale_cmip6 flow uploads it to
+the remote working directory and runs it as a Slurm array job in the cmip6-utils
+conda environment, one array task per batch file of raw CMIP6 files.
+
+Each file is regridded through all cascade stages (e.g. native -> 0.5 deg -> 0.25 deg
+-> ERA5 grid) in memory, one year at a time, and only the final grid is written.
+
+With --output_format netcdf (the default) one NetCDF file is written per year, in the
+same layout as the staged regridding. With --output_format zarr one Zarr store is
+written per year instead, chunked in spatial tiles of --tile_size cells, under
+<output_dir>/<var>_<model>_<scenario>/. downscaling/rechunk_zarr.py then joins the
+years of each tile into the final store for bias adjustment, without any NetCDF
+conversion.
+The regridding weights for each stage are read from the shared weight cache built by
+regrid_weights.py (or computed, if no cache is given) once per task and reused for
+every year of every file in the batch.
+
+With --derive_dtr, tasks for tasmax batch files also write the diurnal temperature
+range (dtr = tasmax - tasmin, negative values set to 0). For each year of tasmax held
+in memory, the same year of tasmin is read from the raw files listed in the tasmin
+batch files of the same model, scenario, member and grid (in the same directory as
+--batch_file). DTR is computed on the model grid, as the separate DTR processing does,
+and regridded through the same cascade, so no DTR archive is needed.
+
+Example usage:
+    python cascade_regrid.py \
+        --batch_file /path/to/batch/batch_CESM2_historical_day_tasmax_gn_1.txt \
+        --target_grid_files first_regrid_target_file.nc second_regrid_target_file.nc final_regrid_target_file.nc \
+        --sftlf_files first_sftlf/first_regrid_target_sftlf_{model}.nc second_sftlf/second_regrid_target_sftlf_{model}.nc final_sftlf/final_regrid_target_sftlf_{model}.nc \
+        --interp_method bilinear \
+        --mask_variables "mrro mrsol mrsos snd snw" \
+        --output_dir /path/to/run/final_regrid
+"""
+
+import argparse
+import logging
+import shutil
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from regrid_weights import (
+    build_regridders,
+    default_land_threshold,
+    get_land_masks,
+    parse_cmip6_filename,
+    read_batch_file,
+)
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch_file", type=str, required=True)
+    parser.add_argument("--target_grid_files", type=str, nargs="+", required=True)
+    parser.add_argument(
+        "--sftlf_files",
+        type=str,
+        nargs="*",
+        default=[],
+        help="One land fraction file per target grid, with {model} in place of the model name",
+    )
+    parser.add_argument("--interp_method", type=str, default="bilinear")
+    parser.add_argument("--mask_variables", type=str, default="")
+    parser.add_argument("--land_threshold", type=float, default=default_land_threshold)
+    parser.add_argument(
+        "--weights_dir",
+        type=str,
+        default=None,
+        help="Shared cache of regridding weights, see regrid_weights.py",
+    )
+    parser.add_argument("--output_dir", type=str, required=True)
+    parser.add_argument(
+        "--output_format", type=str, choices=["netcdf", "zarr"], default="netcdf"
+    )
+    parser.add_argument(
+        "--tile_size",
+        type=int,
+        default=32,
+        help="Size of the spatial chunks of Zarr output",
+    )
+    parser.add_argument(
+        "--derive_dtr",
+        action="store_true",
+        help="Also derive dtr from the tasmax files of the batch and matching tasmin files",
+    )
+    parser.add_argument("--no_clobber", action="store_true")
+
+    return parser.parse_args()
+
+
+def regrid_cascade(da, regridders, masks=None):
+    """Regrid a DataArray through every cascade stage, masking ocean cells after each
+    stage if land masks are given, so NaNs propagate to the next stage.
+    """
+    for i, regridder in enumerate(regridders):
+        da = regridder(da, keep_attrs=True)
+        if masks:
+            da = da.where(masks[i].values)
+
+    return da
+
+
+def convert_to_noleap(ds):
+    calendar = ds.time.dt.calendar
+    if calendar in ("noleap", "365_day"):
+        return ds
+    if calendar == "360_day":
+        return ds.convert_calendar("noleap", align_on="date", missing=np.nan)
+
+    return ds.convert_calendar("noleap")
+
+
+def get_year_range(fp):
+    """Get the first and last year of a CMIP6 file from its name, e.g.
+    tasmin_day_CESM2_historical_r11i1p1f1_gn_19500101-19991231.nc -> (1950, 1999)
+    """
+    start, end = Path(fp).stem.split("_")[-1].split("-")
+    return int(start[:4]), int(end[:4])
+
+
+def find_tasmin_files(batch_file, fp):
+    """Find the raw tasmin files matching a tasmax file (same model, scenario, member
+    and grid) in the tasmin batch files next to batch_file.
+    """
+    # tasmax_day_CESM2_historical_r11i1p1f1_gn_19500101-19991231.nc
+    key = Path(fp).name.split("_")[1:6]
+    tasmin_files = []
+    for other_batch_file in sorted(Path(batch_file).parent.glob("*.txt")):
+        files = read_batch_file(other_batch_file)
+        if files and Path(files[0]).name.split("_")[0] == "tasmin":
+            tasmin_files.extend(
+                tasmin_fp
+                for tasmin_fp in files
+                if Path(tasmin_fp).name.split("_")[1:6] == key
+            )
+
+    return tasmin_files
+
+
+def read_tasmin_year(tasmin_files, year):
+    """Read one year of tasmin from the file that covers it."""
+    for tasmin_fp in tasmin_files:
+        first_year, last_year = get_year_range(tasmin_fp)
+        if first_year <= year <= last_year:
+            with xr.open_dataset(tasmin_fp) as tasmin_ds:
+                years = tasmin_ds.time.dt.year.values
+                return (
+                    tasmin_ds[["tasmin"]]
+                    .isel(time=np.flatnonzero(years == year))
+                    .load()
+                )
+
+    raise FileNotFoundError(f"No tasmin file covers {year} in {tasmin_files}")
+
+
+def derive_dtr(tasmax_ds, tasmin_ds):
+    """Diurnal temperature range from one year of tasmax and tasmin."""
+    tasmax, tasmin = xr.align(tasmax_ds["tasmax"], tasmin_ds["tasmin"], join="inner")
+    if tasmax.sizes["time"] != tasmax_ds.sizes["time"]:
+        raise ValueError("tasmax and tasmin days do not match")
+
+    # tasmin is above tasmax on some days of some models
+    dtr = (tasmax - tasmin).clip(min=0)
+    dtr.attrs = {"long_name": "Diurnal Temperature Range", "units": "K"}
+
+    return dtr.to_dataset(name="dtr")
+
+
+def get_output_path(output_dir, attrs, year, output_format="netcdf"):
+    if output_format == "zarr":
+        store_name = f"{attrs['var_id']}_{attrs['model']}_{attrs['scenario']}"
+        return Path(output_dir).joinpath(store_name, f"{store_name}_{year}.zarr")
+
+    return Path(output_dir).joinpath(
+        attrs["model"],
+        attrs["scenario"],
+        attrs["frequency"],
+        attrs["var_id"],
+        f"{attrs['var_id']}_{attrs['frequency']}_{attrs['model']}_{attrs['scenario']}_regrid_{year}0101-{year}1231.nc",
+    )
+
+
+def write_output(out_ds, var_id, out_fp, output_format, tile_size):
+    """Write one year of regridded data under a temporary name, then rename it, so
+    an interrupted task never leaves a partial file that looks complete.
+    """
+    out_fp.parent.mkdir(parents=True, exist_ok=True)
+    if output_format == "zarr":
+        tmp_fp = out_fp.with_suffix(".zarr.tmp")
+        if tmp_fp.exists():
+            shutil.rmtree(tmp_fp)
+        chunks = tuple(
+            out_ds.sizes[dim] if dim == "time" else min(tile_size, out_ds.sizes[dim])
+            for dim in out_ds[var_id].dims
+        )
+        out_ds.to_zarr(
+            tmp_fp,
+            encoding={var_id: {"dtype": "float32", "chunks": chunks}},
+            consolidated=True,
+        )
+        if out_fp.exists():
+            shutil.rmtree(out_fp)
+    else:
+        tmp_fp = out_fp.with_suffix(".nc.tmp")
+        out_ds.to_netcdf(
+            tmp_fp,
+            encoding={var_id: {"zlib": True, "complevel": 1, "dtype": "float32"}},
+        )
+    tmp_fp.rename(out_fp)
+
+
+def regrid_year(
+    year_ds,
+    var_id,
+    out_fp,
+    regridders,
+    masks,
+    src_attrs,
+    target_attrs,
+    final_grid_ds,
+    output_format,
+    tile_size,
+):
+    regridded = regrid_cascade(year_ds[var_id], regridders, masks)
+
+    out_ds = regridded.to_dataset(name=var_id)
+    out_ds.attrs = src_attrs | target_attrs
+    # carry over projection info (e.g. x/y and crs) from the final target grid
+    out_ds = out_ds.assign_coords(
+        {
+            name: coord
+            for name, coord in final_grid_ds.coords.items()
+            if name not in out_ds.coords and set(coord.dims) <= set(out_ds.dims)
+        }
+    )
+
+    write_output(out_ds, var_id, out_fp, output_format, tile_size)
+    logging.info(f"Wrote {out_fp}")
+
+
+def regrid_file(
+    fp,
+    regridders,
+    masks,
+    output_dir,
+    no_clobber,
+    target_attrs,
+    final_grid_ds,
+    output_format="netcdf",
+    tile_size=32,
+    tasmin_files=None,
+):
+    """Regrid one raw file, one year at a time. If tasmin_files are given for a
+    tasmax file, dtr is derived from each year and regridded as well.
+    """
+    attrs = parse_cmip6_filename(fp)
+    var_id = attrs["var_id"]
+    dtr_attrs = attrs | {"var_id": "dtr"}
+
+    with xr.open_dataset(fp) as src_ds:
+        years = src_ds.time.dt.year.values
+        for year in np.unique(years):
+            out_fp = get_output_path(output_dir, attrs, year, output_format)
+            dtr_fp = None
+            if tasmin_files:
+                dtr_fp = get_output_path(output_dir, dtr_attrs, year, output_format)
+            if no_clobber and out_fp.exists() and (dtr_fp is None or dtr_fp.exists()):
+                logging.info(f"{out_fp} exists, skipping")
+                continue
+
+            # one year of the raw file is all that is held in memory
+            year_ds = convert_to_noleap(
+                src_ds[[var_id]].isel(time=np.flatnonzero(years == year)).load()
+            )
+            kwargs = {
+                "regridders": regridders,
+                "masks": masks,
+                "src_attrs": src_ds.attrs,
+                "target_attrs": target_attrs,
+                "final_grid_ds": final_grid_ds,
+                "output_format": output_format,
+                "tile_size": tile_size,
+            }
+            if not (no_clobber and out_fp.exists()):
+                regrid_year(year_ds, var_id, out_fp, **kwargs)
+
+            if dtr_fp and not (no_clobber and dtr_fp.exists()):
+                tasmin_ds = convert_to_noleap(read_tasmin_year(tasmin_files, year))
+                dtr_ds = derive_dtr(year_ds, tasmin_ds)
+                dtr_kwargs = kwargs | {
+                    "src_attrs": src_ds.attrs | {"variable_id": "dtr"}
+                }
+                regrid_year(dtr_ds, "dtr", dtr_fp, **dtr_kwargs)
+
+
+def main():
+    args = parse_args()
+
+    files = read_batch_file(args.batch_file)
+    if not files:
+        logging.info(f"No files in {args.batch_file}, nothing to do")
+        return
+
+    attrs = parse_cmip6_filename(files[0])
+    mask_variables = args.mask_variables.split()
+
+    masks = None
+    if attrs["var_id"] in mask_variables and args.sftlf_files:
+        masks = get_land_masks(args.sftlf_files, attrs["model"], args.land_threshold)
+
+    # all files in a batch share a grid, so the weights are loaded once for the batch
+    with xr.open_dataset(files[0]) as src_ds:
+        regridders = build_regridders(
+            src_ds, args.target_grid_files, args.interp_method, masks, args.weights_dir
+        )
+
+    target_attrs = {
+        "regrid_method": args.interp_method,
+        "regrid_cascade": " -> ".join(Path(fp).name for fp in args.target_grid_files),
+    }
+
+    with xr.open_dataset(args.target_grid_files[-1]) as final_grid_ds:
+        final_grid_ds = final_grid_ds.drop_vars(
+            [name for name in final_grid_ds.data_vars]
+        ).load()
+
+    for fp in files:
+        logging.info(f"Regridding {fp}")
+        tasmin_files = None
+        if args.derive_dtr and attrs["var_id"] == "tasmax":
+            tasmin_files = find_tasmin_files(args.batch_file, fp)
+            if not tasmin_files:
+                raise FileNotFoundError(f"No tasmin batch files found for {fp}")
+        regrid_file(
+            fp,
+            regridders,
+            masks,
+            args.output_dir,
+            args.no_clobber,
+            target_attrs,
+            final_grid_ds,
+            args.output_format,
+            args.tile_size,
+            tasmin_files,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Shared cache of regridding weights for CMIP6 cascade regridding.
+
+This script is not run by Prefect directly. The downscale_cmip6 flow uploads it to
+the remote working directory, next to cascade_regrid.py which imports it, and runs it
+as the weight-generation Slurm array job with one task per distinct model grid.
+
+Weights are stored as xESMF weight files in a shared cache directory, named by a key
+built from the source grid, the target grid, the interpolation method and the land
+mask applied to the source grid (if any):
+
+    <weights_dir>/<interp_method>_<sha256 of the above, first 16 characters>.nc
+
+The key is computed from the grid coordinates and mask values, not file paths, so
+identical grids share weights across runs and models. There are only about 13
+distinct model grids and three target grids, so the cache stays small.
+
+Example usage:
+    python regrid_weights.py \
+        --batch_file /path/to/batch/batch_CESM2_historical_day_snw_gn_1.txt \
+        --target_grid_files first_regrid_target_file.nc second_regrid_target_file.nc final_regrid_target_file.nc \
+        --sftlf_files first_sftlf/first_regrid_target_sftlf_{model}.nc second_sftlf/second_regrid_target_sftlf_{model}.nc final_sftlf/final_regrid_target_sftlf_{model}.nc \
+        --interp_method conservative \
+        --mask_variables "mrro mrsol mrsos snd snw" \
+        --weights_dir /beegfs/CMIP6/arctic-cmip6/regrid_weights
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+import xesmf as xe
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+# sftlf is a percentage, cells with at least this much land are kept for land variables
+default_land_threshold = 50
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch_file", type=str, required=True)
+    parser.add_argument("--target_grid_files", type=str, nargs="+", required=True)
+    parser.add_argument("--sftlf_files", type=str, nargs="*", default=[])
+    parser.add_argument("--interp_method", type=str, default="bilinear")
+    parser.add_argument("--mask_variables", type=str, default="")
+    parser.add_argument("--land_threshold", type=float, default=default_land_threshold)
+    parser.add_argument("--weights_dir", type=str, required=True)
+
+    return parser.parse_args()
+
+
+def read_batch_file(batch_file):
+    with open(batch_file) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_cmip6_filename(fp):
+    """Get the variable, frequency, model and scenario from a CMIP6 file name, e.g.
+    tas_day_CESM2_ssp370_r11i1p1f1_gn_20150101-20241231.nc
+    """
+    var_id, frequency, model, scenario = Path(fp).name.split("_")[:4]
+    return {
+        "var_id": var_id,
+        "frequency": frequency,
+        "model": model,
+        "scenario": scenario,
+    }
+
+
+def get_edges(coord):
+    """Cell edges for 1D (n -> n + 1) or 2D ((ny, nx) -> (ny + 1, nx + 1)) cell centers,
+    extrapolated linearly at the grid boundary. Needed for conservative regridding.
+    """
+    padded = np.pad(coord, 1, mode="reflect", reflect_type="odd")
+    if coord.ndim == 1:
+        return (padded[:-1] + padded[1:]) / 2
+    return (padded[:-1, :-1] + padded[1:, :-1] + padded[:-1, 1:] + padded[1:, 1:]) / 4
+
+
+def get_grid(ds, conservative=False):
+    """Pull the lat/lon grid (and cell bounds, if needed) out of a dataset."""
+    grid = xr.Dataset(coords={"lat": ds["lat"], "lon": ds["lon"]})
+    if conservative:
+        lat_b = get_edges(ds["lat"].values)
+        lon_b = get_edges(ds["lon"].values)
+        if ds["lat"].ndim == 1:
+            grid = grid.assign_coords(
+                lat_b=("lat_b", np.clip(lat_b, -90, 90)), lon_b=("lon_b", lon_b)
+            )
+        else:
+            grid = grid.assign_coords(
+                lat_b=(("y_b", "x_b"), np.clip(lat_b, -90, 90)),
+                lon_b=(("y_b", "x_b"), lon_b),
+            )
+    return grid.load()
+
+
+def get_land_masks(sftlf_files, model, land_threshold):
+    """Land masks for each cascade stage, or None if a model has no land fraction
+    file for every stage (e.g. no source sftlf available for the model).
+    """
+    sftlf_files = [sftlf_file.format(model=model) for sftlf_file in sftlf_files]
+    missing = [
+        sftlf_file for sftlf_file in sftlf_files if not Path(sftlf_file).exists()
+    ]
+    if missing:
+        logging.warning(f"No land fraction files {missing} for {model}, not masking")
+        return None
+
+    masks = []
+    for sftlf_file in sftlf_files:
+        with xr.open_dataset(sftlf_file) as sftlf_ds:
+            masks.append((sftlf_ds["sftlf"] >= land_threshold).load())
+
+    return masks
+
+
+def hash_arrays(*arrays):
+    sha = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        sha.update(str((array.shape, array.dtype.str)).encode())
+        sha.update(array.tobytes())
+    return sha.hexdigest()
+
+
+def get_weights_path(
+    weights_dir, src_grid, dst_grid, interp_method, periodic, src_mask=None
+):
+    key = hash_arrays(
+        np.array([periodic]),
+        src_grid["lat"].values,
+        src_grid["lon"].values,
+        dst_grid["lat"].values,
+        dst_grid["lon"].values,
+        np.array([]) if src_mask is None else src_mask.values.astype("uint8"),
+    )
+    return Path(weights_dir).joinpath(f"{interp_method}_{key[:16]}.nc")
+
+
+def get_regridder(src_grid, dst_grid, interp_method, periodic, weights_dir=None):
+    """Get a regridder for src_grid -> dst_grid, reading its weights from weights_dir
+    if they have been generated already. New weights are written to the cache under
+    a temporary name first, so concurrent tasks never read a partial file.
+    """
+    kwargs = {"periodic": periodic, "unmapped_to_nan": True}
+    if weights_dir is None:
+        return xe.Regridder(src_grid, dst_grid, interp_method, **kwargs)
+
+    weights_path = get_weights_path(
+        weights_dir, src_grid, dst_grid, interp_method, periodic, src_grid.get("mask")
+    )
+    if weights_path.exists():
+        logging.info(f"Using cached weights {weights_path}")
+        return xe.Regridder(
+            src_grid, dst_grid, interp_method, weights=str(weights_path), **kwargs
+        )
+
+    regridder = xe.Regridder(src_grid, dst_grid, interp_method, **kwargs)
+    tmp_path = weights_path.with_suffix(f".{os.getpid()}.tmp")
+    regridder.to_netcdf(str(tmp_path))
+    os.replace(tmp_path, weights_path)
+    logging.info(f"Wrote weights {weights_path}")
+
+    return regridder
+
+
+def build_regridders(
+    src_ds, target_grid_files, interp_method, masks=None, weights_dir=None
+):
+    """Build one regridder per cascade stage. The first stage regrids from the native
+    model grid, every later stage from the previous target grid.
+
+    If land masks are given, the ocean cells of each intermediate grid are excluded
+    from the source of the next stage, so coastal values are interpolated from land
+    cells only.
+    """
+    conservative = interp_method.startswith("conservative")
+    src_grid = get_grid(src_ds, conservative)
+    regridders = []
+    for i, target_grid_file in enumerate(target_grid_files):
+        with xr.open_dataset(target_grid_file) as target_ds:
+            dst_grid = get_grid(target_ds, conservative)
+        regridders.append(
+            get_regridder(
+                src_grid,
+                dst_grid,
+                interp_method,
+                # only the raw model grids are global
+                periodic=i == 0,
+                weights_dir=weights_dir,
+            )
+        )
+        src_grid = dst_grid
+        if masks:
+            src_grid = src_grid.assign(mask=masks[i].astype("int32"))
+
+    return regridders
+
+
+def main():
+    args = parse_args()
+
+    files = read_batch_file(args.batch_file)
+    if not files:
+        logging.info(f"No files in {args.batch_file}, nothing to do")
+        return
+
+    attrs = parse_cmip6_filename(files[0])
+    masks = None
+    if attrs["var_id"] in args.mask_variables.split() and args.sftlf_files:
+        masks = get_land_masks(args.sftlf_files, attrs["model"], args.land_threshold)
+
+    Path(args.weights_dir).mkdir(parents=True, exist_ok=True)
+    with xr.open_dataset(files[0]) as src_ds:
+        build_regridders(
+            src_ds, args.target_grid_files, args.interp_method, masks, args.weights_dir
+        )
+
+
+if __name__ == "__main__":
+    main()
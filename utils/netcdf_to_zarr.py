@@ -9,6 +9,7 @@ from prefect import flow, task
 import paramiko
 from pathlib import Path
 from utils import utils
+from utils import zarr_chunks
 import logging
 
 # Define your SSH parameters
@@ -32,6 +33,7 @@ def run_netcdf_zarr_conversion(
 ):
     script_dir = Path(launcher_script).parent
     cmd = (
+        f"conda activate {conda_env_name}; "
         f"python {launcher_script} "
         f"--conda_env_name {conda_env_name} "
         f"--script_dir {script_dir} "
@@ -47,6 +49,29 @@ def run_netcdf_zarr_conversion(
     if chunks_dict:
         cmd += f"--chunks_dict {chunks_dict} "
 
+    exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
+    if exit_status != 0:
+        raise Exception(f"Error in starting the Zarr conversion. Error: {stderr}")
+    if stdout != "":
+        print(stdout)
+
+    job_ids = utils.parse_job_ids(stdout)
+    print(f"Netcdf-to-Zarr conversion job submitted! (job IDs: {job_ids})")
+
+    return job_ids
+
+
+def get_netcdf_files(
+    netcdf_dir, glob_str=None, year_str=None, start_year=None, end_year=None
+):
+    """Remote NetCDF files to convert, as a glob pattern or a list of yearly files."""
+    if glob_str:
+        return f"{netcdf_dir}/{glob_str}"
+    return " ".join(
+        f"{netcdf_dir}/{year_str.format(year=year)}"
+        for year in range(int(start_year), int(end_year) + 1)
+    )
+
 
 @flow(log_prints=True)
 def netcdf_to_zarr(
@@ -64,7 +89,16 @@ def netcdf_to_zarr(
     start_year=None,
     end_year=None,
     chunks_dict=None,
+    consumer="training",
+    target_chunk_mb=zarr_chunks.default_target_chunk_mb,
 ):
+    """Convert a set of NetCDF files to a Zarr store.
+
+    Unless chunks_dict is given, the chunks are planned from the dimensions and dtype
+    of the data for the consumer of the store ("training", "adjustment" or
+    "point_extraction"), targeting chunks of target_chunk_mb MB. The chunking is
+    recorded in <zarr_store_name>.manifest.json next to the store.
+    """
     # Create an SSH client
     ssh = paramiko.SSHClient()
     ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -100,6 +134,24 @@ def netcdf_to_zarr(
             ssh, [write_directory, output_directory, slurm_directory]
         )
 
+        dataset_info = zarr_chunks.inspect_remote_dataset(
+            ssh,
+            conda_env_name,
+            get_netcdf_files(netcdf_dir, glob_str, year_str, start_year, end_year),
+        )
+        if chunks_dict:
+            chunks = chunks_dict
+        else:
+            chunks = zarr_chunks.plan_zarr_chunks(
+                dataset_info["dims"],
+                dataset_info["sizes"],
+                dataset_info["itemsize"],
+                consumer,
+                target_chunk_mb,
+            )
+            chunks_dict = zarr_chunks.format_chunks_dict(chunks)
+        print(f"Chunking {zarr_path} as {chunks_dict}")
+
         kwargs = {
             "ssh": ssh,
             "launcher_script": launcher_script,
@@ -121,6 +173,14 @@ def netcdf_to_zarr(
             completion_message="Slurm jobs for Zarr conversion complete.",
         )
 
+        zarr_chunks.write_chunk_manifest(
+            ssh,
+            zarr_path,
+            zarr_chunks.build_chunk_manifest(
+                zarr_path, dataset_info, consumer, chunks, target_chunk_mb
+            ),
+        )
+
     finally:
         ssh.close()
 
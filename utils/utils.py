@@ -792,6 +792,119 @@ def create_directories(ssh, dir_list, logger=None):
                 print(f"Directory {directory} created successfully.")
 
 
+def write_remote_file(ssh, remote_path, content):
+    """Write text content to a file on the remote server via SFTP.
+
+    Parameters:
+    - ssh: Paramiko SSHClient object
+    - remote_path: Path of the file to write on the remote server
+    - content: Text to write to the file
+    """
+    sftp = ssh.open_sftp()
+    try:
+        with sftp.open(str(remote_path), "w") as f:
+            f.write(content)
+    finally:
+        sftp.close()
+
+
+def upload_file(ssh, local_path, remote_path):
+    """Copy a local file to the remote server via SFTP.
+
+    Used to ship worker scripts from this repo to the remote server, where they are
+    run by Slurm jobs alongside the scripts from the cloned processing repos.
+
+    Parameters:
+    - ssh: Paramiko SSHClient object
+    - local_path: Path of the local file to copy
+    - remote_path: Destination path on the remote server
+    """
+    sftp = ssh.open_sftp()
+    try:
+        sftp.put(str(local_path), str(remote_path))
+    finally:
+        sftp.close()
+
+
+def build_array_sbatch_script(
+    job_name,
+    partition,
+    slurm_dir,
+    task_file,
+    n_tasks,
+    conda_env_name,
+    command,
+    max_parallel_tasks=None,
+    time="24:00:00",
+    mem=None,
+    cpus_per_task=1,
+):
+    """Build the text of an sbatch script for a Slurm array job.
+
+    Each array task reads line SLURM_ARRAY_TASK_ID + 1 of task_file into the $task
+    shell variable and then runs command, which should make use of $task.
+
+    Parameters:
+    - job_name: Name of the Slurm job, also used for the log file names
+    - partition: Slurm partition to submit to
+    - slurm_dir: Directory for the Slurm log files
+    - task_file: Remote file with one task per line
+    - n_tasks: Number of lines in task_file
+    - conda_env_name: Name of the Conda environment to activate
+    - command: Shell command to run for each task
+    - max_parallel_tasks: Maximum number of array tasks to run at once (optional)
+    - time: Time limit for each task
+    - mem: Memory for each task, e.g. "64G" (optional, partition default if None)
+    - cpus_per_task: Number of CPUs for each task
+    """
+    array = f"0-{n_tasks - 1}"
+    if max_parallel_tasks:
+        array += f"%{max_parallel_tasks}"
+
+    directives = [
+        f"--job-name={job_name}",
+        f"--partition={partition}",
+        "--nodes=1",
+        "--ntasks=1",
+        f"--cpus-per-task={cpus_per_task}",
+        f"--time={time}",
+        f"--output={slurm_dir}/{job_name}_%A_%a.out",
+        f"--array={array}",
+    ]
+    if mem:
+        directives.append(f"--mem={mem}")
+
+    header = "\n".join(f"#SBATCH {directive}" for directive in directives)
+
+    return (
+        "#!/bin/bash\n"
+        f"{header}\n\n"
+        'eval "$($HOME/miniconda3/bin/conda shell.bash hook)"\n'
+        f"conda activate {conda_env_name}\n\n"
+        f'task=$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" {task_file})\n'
+        f"{command}\n"
+    )
+
+
+def submit_sbatch(ssh, sbatch_script_path):
+    """Submit an sbatch script on the remote server and return the job IDs.
+
+    Parameters:
+    - ssh: Paramiko SSHClient object
+    - sbatch_script_path: Path to the sbatch script on the remote server
+    """
+    exit_status, stdout, stderr = exec_command(
+        ssh, f"sbatch --parsable {sbatch_script_path}"
+    )
+    if exit_status != 0:
+        raise Exception(
+            f"Error submitting sbatch script {sbatch_script_path}. Error: {stderr}"
+        )
+
+    # --parsable prints "<job_id>" or "<job_id>;<cluster>"
+    return parse_job_ids(stdout.splitlines()[-1].split(";")[0])
+
+
 @task
 def rsync_task(ssh, source_directory, destination_directory, exclude=None):
     """Task wrapper for utils.rsync"""
@@ -0,0 +1,179 @@
+"""Chunk planning for the Zarr stores used in bias adjustment.
+
+The chunking of a store is chosen from the dimensions and dtype of the dataset and
+the consumer that will read it:
+    training - xclim training reads the full time series of each grid cell, so every
+        chunk holds the full time series and the spatial tile is sized to the target
+    adjustment - adjustment is applied to whole years at a time, so time chunks are
+        aligned to whole years (365 days, all data is on the noleap calendar) and the
+        spatial tile is sized to the target
+    point_extraction - point queries read the full time series of single cells, so
+        every chunk holds the full time series and chunks are kept at the small end of
+        the size range, so each query reads as little as possible
+
+The chosen layout is recorded in a JSON manifest next to the store,
+<store>.manifest.json.
+"""
+
+import json
+import math
+from datetime import datetime
+
+from utils import utils
+
+consumers = ["training", "adjustment", "point_extraction"]
+
+# chunk sizes in MB that work well with dask and the Chinook filesystems
+default_target_chunk_mb = 100
+min_chunk_mb = 50
+
+days_per_year = 365
+# years of data in each time chunk for the adjustment consumer
+adjustment_years_per_chunk = 10
+
+# Inline python run on the remote to read the dimensions and dtype of a dataset made of
+# one or more NetCDF files, without loading any data. The data variable is the one with
+# the most dimensions, so bounds variables such as time_bnds are never picked. The first
+# argument is a start:end year range to count the time steps of, or - for all of them.
+inspect_script = """
+import json, sys
+import xarray as xr
+years, files = sys.argv[1], sorted(sys.argv[2:])
+ds = xr.open_mfdataset(files, combine="by_coords", data_vars="minimal", coords="minimal", compat="override")
+var_id = max((name for name, var in ds.data_vars.items() if "time" in var.dims), key=lambda name: ds[name].ndim)
+da = ds[var_id]
+if years != "-":
+    start, end = map(int, years.split(":"))
+    da = da.isel(time=((da.time.dt.year >= start) & (da.time.dt.year <= end)).values)
+print(json.dumps({"variable": var_id, "dims": list(da.dims), "sizes": dict(da.sizes), "itemsize": da.dtype.itemsize}))
+"""
+
+
+def inspect_remote_dataset(
+    ssh, conda_env_name, netcdf_files, start_year=None, end_year=None
+):
+    """Get the data variable, dimensions, sizes and itemsize of a remote dataset.
+
+    Parameters:
+    - ssh: Paramiko SSHClient object, "connected"
+    - conda_env_name: Name of a Conda environment with xarray
+    - netcdf_files: Remote NetCDF file or glob pattern of files that make up the dataset
+    - start_year, end_year: If given, the time size only counts the time steps of
+        these years, inclusive
+
+    Returns:
+    - dict with variable, dims, sizes and itemsize
+    """
+    years = "-" if start_year is None else f"{start_year}:{end_year}"
+    cmd = (
+        f"conda activate {conda_env_name}; "
+        f"python -c '{inspect_script}' {years} {netcdf_files}"
+    )
+    exit_status, stdout, stderr = utils.exec_command(ssh, cmd)
+    if exit_status != 0:
+        raise Exception(f"Error inspecting {netcdf_files}. Error: {stderr}")
+
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def plan_zarr_chunks(
+    dims, sizes, itemsize, consumer, target_chunk_mb=default_target_chunk_mb
+):
+    """Plan the chunks of a (time, y, x) dataset for a consumer.
+
+    Parameters:
+    - dims: Dimension names, with time first, e.g. ["time", "y", "x"]
+    - sizes: dict of dimension sizes
+    - itemsize: Size of one value in bytes, e.g. 4 for float32
+    - consumer: One of consumers
+    - target_chunk_mb: Target size of each chunk in MB
+
+    Returns:
+    - dict of chunk sizes per dimension
+    """
+    if consumer not in consumers:
+        raise ValueError(f"Unknown consumer {consumer}, expected one of {consumers}")
+
+    time_dim, *spatial_dims = dims
+    n_time = sizes[time_dim]
+
+    if consumer == "adjustment":
+        time_chunk = min(n_time, adjustment_years_per_chunk * days_per_year)
+    else:
+        time_chunk = n_time
+
+    if consumer == "point_extraction":
+        target_chunk_mb = min(target_chunk_mb, min_chunk_mb)
+
+    # square spatial tiles, as large as the target allows
+    cells_per_chunk = target_chunk_mb * 1024**2 / (time_chunk * itemsize)
+    tile_size = max(1, math.isqrt(int(cells_per_chunk)))
+
+    chunks = {time_dim: time_chunk}
+    for dim in spatial_dims:
+        chunks[dim] = min(tile_size, sizes[dim])
+
+    return chunks
+
+
+def get_chunk_mb(chunks, itemsize):
+    return math.prod(chunks.values()) * itemsize / 1024**2
+
+
+def format_chunks_dict(chunks):
+    """Format chunks as the --chunks_dict argument of the cmip6-utils Zarr scripts."""
+    return f"'{json.dumps(chunks)}'"
+
+
+def build_chunk_manifest(store, dataset_info, consumer, chunks, target_chunk_mb):
+    """Build the manifest of a store. chunks may also be a chunks_dict string given by
+    the user, which is recorded as is.
+    """
+    chunk_mb = None
+    if isinstance(chunks, dict):
+        chunk_mb = round(get_chunk_mb(chunks, dataset_info["itemsize"]), 1)
+
+    return {
+        "store": str(store),
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "consumer": consumer,
+        "target_chunk_mb": target_chunk_mb,
+        "variable": dataset_info["variable"],
+        "planned_sizes": dataset_info["sizes"],
+        "itemsize": dataset_info["itemsize"],
+        "chunks": chunks,
+        "chunk_mb": chunk_mb,
+    }
+
+
+def read_store_layout(ssh, store, variable):
+    """Read the dimension sizes and chunks of a variable of a written Zarr store from
+    its consolidated metadata (.zmetadata, or zarr.json for Zarr v3 stores).
+
+    Returns:
+    - tuple of dicts of the sizes and the chunks of each dimension
+    """
+    exit_status, stdout, stderr = utils.exec_command(
+        ssh, f"cat {store}/.zmetadata 2>/dev/null || cat {store}/zarr.json"
+    )
+    if exit_status != 0:
+        raise Exception(f"Error reading the metadata of {store}: {stderr}")
+    metadata = json.loads(stdout)
+
+    if "metadata" in metadata:
+        array = metadata["metadata"][f"{variable}/.zarray"]
+        dims = metadata["metadata"][f"{variable}/.zattrs"]["_ARRAY_DIMENSIONS"]
+        chunk_shape = array["chunks"]
+    else:
+        array = metadata["consolidated_metadata"]["metadata"][variable]
+        dims = array["dimension_names"]
+        chunk_shape = array["chunk_grid"]["configuration"]["chunk_shape"]
+
+    return dict(zip(dims, array["shape"])), dict(zip(dims, chunk_shape))
+
+
+def write_chunk_manifest(ssh, store, manifest):
+    """Write a chunk manifest next to a Zarr store, as <store>.manifest.json."""
+    utils.write_remote_file(
+        ssh, f"{store}.manifest.json", json.dumps(manifest, indent=2) + "\n"
+    )
@@ -3,10 +3,22 @@ import argparse
 import geopandas as gpd
 from shapely.geometry import Point
 import os
+import sqlite3
 from datetime import datetime, timedelta
 
 script_dir = os.path.dirname(__file__)
 
+# Fields requested from the Purple Air API, in the column order used by the
+# sensor store. The API always prepends sensor_index to the returned rows.
+purple_air_fields = [
+    "last_seen",
+    "location_type",
+    "latitude",
+    "longitude",
+    "pm2.5_10minute",
+    "pm2.5_24hour",
+]
+
 
 def calculate_aqi(pm25_concentration):
     """
@@ -41,13 +53,19 @@ def calculate_aqi(pm25_concentration):
         return 500  # Max AQI
 
 
-def fetch_purple_air_data():
-    one_week_ago = int((datetime.now() - timedelta(days=7)).timestamp())
+def fetch_purple_air_data(modified_since):
+    """
+    Fetch Purple Air sensors within the Alaska bounding box that have been
+    modified since the provided Unix timestamp.
 
+    Returns the decoded API response, which includes the field names, the
+    sensor rows, and the data_time_stamp of the response that is used as the
+    starting point of the next poll.
+    """
     api_url = "https://map.purpleair.com/v1/sensors"
     query_params = {
-        "fields": "last_seen,location_type,latitude,longitude,pm2.5_10minute,pm2.5_24hour",
-        "modified_since": one_week_ago,
+        "fields": ",".join(purple_air_fields),
+        "modified_since": modified_since,
         "nwlat": 70,
         "selat": 54.56,
         "nwlng": -169.41,
@@ -59,13 +77,120 @@ def fetch_purple_air_data():
     response = requests.get(api_url, params=query_params, headers=headers)
     response.raise_for_status()
 
-    data = response.json()
+    return response.json()
 
-    for sensor in data["data"]:
-        sensor.append(0)  # AQI 2.5 PM 1 hour
-        sensor.append("pa")  # type
 
-    return data
+def open_sensor_store(store_path):
+    """
+    Open (and create, if needed) the SQLite store that holds the latest state of
+    every Purple Air sensor keyed by sensor_index, the history of readings, and
+    the timestamp of the last successful poll.
+    """
+    conn = sqlite3.connect(store_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS sensors (
+            sensor_index INTEGER PRIMARY KEY,
+            last_seen INTEGER,
+            location_type INTEGER,
+            latitude REAL,
+            longitude REAL,
+            pm2_5_10m REAL,
+            pm2_5_24hr REAL
+        );
+        CREATE TABLE IF NOT EXISTS readings (
+            sensor_index INTEGER,
+            last_seen INTEGER,
+            pm2_5_10m REAL,
+            pm2_5_24hr REAL,
+            PRIMARY KEY (sensor_index, last_seen)
+        );
+        CREATE TABLE IF NOT EXISTS poll_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER
+        );
+        """)
+    return conn
+
+
+def get_last_poll(conn):
+    row = conn.execute(
+        "SELECT value FROM poll_state WHERE key = 'last_poll'"
+    ).fetchone()
+    return row[0] if row else None
+
+
+def merge_sensors(conn, data):
+    """
+    Upsert the sensors from a Purple Air API response into the store, append
+    their readings to the history table, and record the response timestamp as
+    the last successful poll. Everything is committed in a single transaction so
+    a failed run never advances the poll timestamp.
+    """
+    field_index = {field: i for i, field in enumerate(data["fields"])}
+    rows = [
+        tuple(
+            sensor[field_index[field]] for field in ["sensor_index"] + purple_air_fields
+        )
+        for sensor in data["data"]
+    ]
+
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO sensors (sensor_index, last_seen, location_type, latitude, longitude, pm2_5_10m, pm2_5_24hr)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(sensor_index) DO UPDATE SET
+                last_seen = excluded.last_seen,
+                location_type = excluded.location_type,
+                latitude = excluded.latitude,
+                longitude = excluded.longitude,
+                pm2_5_10m = excluded.pm2_5_10m,
+                pm2_5_24hr = excluded.pm2_5_24hr
+            """,
+            rows,
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO readings VALUES (?, ?, ?, ?)",
+            [(row[0], row[1], row[5], row[6]) for row in rows],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO poll_state VALUES ('last_poll', ?)",
+            (data["data_time_stamp"],),
+        )
+
+    return len(rows)
+
+
+def expire_stale_sensors(conn, stale_days, history_days):
+    """
+    Remove sensors that have not reported within stale_days from the current
+    layer, and prune readings older than history_days from the history table.
+    """
+    now = datetime.now()
+    stale_cutoff = int((now - timedelta(days=stale_days)).timestamp())
+    history_cutoff = int((now - timedelta(days=history_days)).timestamp())
+
+    with conn:
+        expired = conn.execute(
+            "DELETE FROM sensors WHERE last_seen < ?", (stale_cutoff,)
+        ).rowcount
+        conn.execute("DELETE FROM readings WHERE last_seen < ?", (history_cutoff,))
+
+    return expired
+
+
+def load_sensors(conn):
+    """
+    Read the current sensor state back out of the store in the same row layout
+    that the Purple Air API returns, with the AQI 1hr and type columns appended.
+    """
+    rows = conn.execute("""
+        SELECT sensor_index, last_seen, location_type, latitude, longitude, pm2_5_10m, pm2_5_24hr
+        FROM sensors ORDER BY sensor_index
+        """).fetchall()
+
+    # AQI 2.5 PM 1 hour, type
+    return {"data": [list(row) + [0, "pa"] for row in rows]}
 
 
 def fetch_dec_air_data():
@@ -164,8 +289,29 @@ def create_shapefile(data, output_path):
     gdf.to_file(output_path, driver="ESRI Shapefile")
 
 
-def main(out_dir):
-    data = fetch_purple_air_data()
+def main(out_dir, store_path=None, stale_days=7, history_days=30):
+    if store_path is None:
+        store_path = os.path.join(out_dir, "purple_air_sensors.sqlite")
+
+    conn = open_sensor_store(store_path)
+    try:
+        # Only ask for sensors modified since the last successful poll. On the
+        # first run, seed the store with everything seen in the stale window.
+        modified_since = get_last_poll(conn)
+        if modified_since is None:
+            modified_since = int(
+                (datetime.now() - timedelta(days=stale_days)).timestamp()
+            )
+
+        merged = merge_sensors(conn, fetch_purple_air_data(modified_since))
+        expired = expire_stale_sensors(conn, stale_days, history_days)
+        print(
+            f"Merged {merged} Purple Air sensors modified since {modified_since}, expired {expired} stale sensors"
+        )
+
+        data = load_sensors(conn)
+    finally:
+        conn.close()
 
     # Add DEC Air data to the Purple Air data
     data["data"] = data["data"] + fetch_dec_air_data()
@@ -185,5 +331,23 @@ if __name__ == "__main__":
         default=f"{script_dir}/",
         help="Directory to output shapefile to.",
     )
+    parser.add_argument(
+        "--store-path",
+        type=str,
+        default=None,
+        help="Path to the SQLite sensor store. Defaults to purple_air_sensors.sqlite in the output directory.",
+    )
+    parser.add_argument(
+        "--stale-days",
+        type=int,
+        default=7,
+        help="Drop sensors that have not reported in this many days.",
+    )
+    parser.add_argument(
+        "--history-days",
+        type=int,
+        default=30,
+        help="Number of days of sensor readings to keep in the store.",
+    )
     args = parser.parse_args()
-    main(args.out_dir)
+    main(args.out_dir, args.store_path, args.stale_days, args.history_days)
@@ -1,6 +1,12 @@
 from prefect import flow
 from prefect.blocks.system import Secret
-from snapshot_tasks import create_tarball, upload_to_s3, cleanup_temp_file
+from snapshot_tasks import (
+    create_tarball,
+    upload_to_s3,
+    cleanup_temp_file,
+    stream_snapshot_to_s3,
+    create_incremental_snapshot,
+)
 from datetime import datetime
 import os
 
@@ -9,13 +15,26 @@ import os
 def create_alaskawildfires_snapshot(
     source_directory,
     s3_bucket,
+    streaming=True,
+    incremental=False,
+    compressor="zstd",
+    part_size_mb=64,
+    max_concurrency=8,
 ):
     """
-    Create a gzipped tarball of a directory and upload it to S3.
+    Create a compressed tarball of a directory and upload it to S3.
 
     Args:
         source_directory: Path to the directory to archive
         s3_bucket: Name of the S3 bucket to upload to
+        streaming: If True, stream the tarball through a multi-threaded
+            compressor directly into a multipart upload instead of writing
+            a .tgz to local disk first
+        incremental: If True, upload only new content-addressed chunks and a
+            per-snapshot manifest instead of a full tarball
+        compressor: Compressor used when streaming, "zstd" or "pigz"
+        part_size_mb: Multipart upload part size in MB when streaming
+        max_concurrency: Number of parallel part or chunk uploads
 
     Returns:
         Status dictionary with operation details
@@ -33,20 +52,43 @@ def create_alaskawildfires_snapshot(
         dir_name = os.path.basename(source_directory)
         parent_dir = os.path.dirname(source_directory)
         date_str = datetime.now().strftime("%m_%d_%Y")
-        output_path = os.path.join(parent_dir, f"{dir_name}_{date_str}.tgz")
+        snapshot_name = f"{dir_name}_{date_str}"
 
-        tarball_path = create_tarball(source_directory, output_path)
-        status["tarball_path"] = tarball_path
+        if incremental:
+            status["s3_uri"] = create_incremental_snapshot(
+                source_directory,
+                s3_bucket,
+                snapshot_name,
+                aws_access_key_id,
+                aws_secret_access_key,
+                max_concurrency=max_concurrency,
+            )
+        elif streaming:
+            status["s3_uri"] = stream_snapshot_to_s3(
+                source_directory,
+                s3_bucket,
+                snapshot_name,
+                aws_access_key_id,
+                aws_secret_access_key,
+                compressor,
+                part_size_mb,
+                max_concurrency,
+            )
+        else:
+            output_path = os.path.join(parent_dir, f"{snapshot_name}.tgz")
 
-        s3_uri = upload_to_s3(
-            tarball_path,
-            s3_bucket,
-            aws_access_key_id,
-            aws_secret_access_key,
-        )
-        status["s3_uri"] = s3_uri
+            tarball_path = create_tarball(source_directory, output_path)
+            status["tarball_path"] = tarball_path
 
-        cleanup_temp_file(tarball_path)
+            s3_uri = upload_to_s3(
+                tarball_path,
+                s3_bucket,
+                aws_access_key_id,
+                aws_secret_access_key,
+            )
+            status["s3_uri"] = s3_uri
+
+            cleanup_temp_file(tarball_path)
 
         status["completed"] = datetime.now().strftime("%Y%m%d%H%M%S")
         status["succeeded"] = True
@@ -70,5 +112,10 @@ if __name__ == "__main__":
         parameters={
             "source_directory": "/usr/share/geoserver/data_dir/data/alaska_wildfires",
             "s3_bucket": "alaskawildfires-snapshots",
+            "streaming": True,
+            "incremental": False,
+            "compressor": "zstd",
+            "part_size_mb": 64,
+            "max_concurrency": 8,
         },
     )
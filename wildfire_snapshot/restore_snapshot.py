@@ -0,0 +1,67 @@
+from prefect import flow
+from prefect.blocks.system import Secret
+from snapshot_tasks import restore_snapshot
+from datetime import datetime
+
+
+@flow(log_prints=True)
+def restore_alaskawildfires_snapshot(
+    snapshot_name,
+    destination_directory,
+    s3_bucket,
+):
+    """
+    Rebuild a dated incremental snapshot from its manifest.
+
+    Args:
+        snapshot_name: Name of the snapshot to restore, e.g. alaska_wildfires_01_31_2026
+        destination_directory: Directory to restore the snapshot into
+        s3_bucket: Name of the S3 bucket holding the snapshots
+
+    Returns:
+        Status dictionary with operation details
+    """
+    status = {
+        "started": datetime.now().strftime("%Y%m%d%H%M%S"),
+        "snapshot_name": snapshot_name,
+        "destination_directory": destination_directory,
+        "s3_bucket": s3_bucket,
+    }
+
+    try:
+        aws_access_key_id = Secret.load("alaskawildfires-snapshot-access-key").get()
+        aws_secret_access_key = Secret.load("alaskawildfires-snapshot-secret-key").get()
+
+        status["restored_path"] = restore_snapshot(
+            s3_bucket,
+            snapshot_name,
+            destination_directory,
+            aws_access_key_id,
+            aws_secret_access_key,
+        )
+
+        status["completed"] = datetime.now().strftime("%Y%m%d%H%M%S")
+        status["succeeded"] = True
+
+        print("Snapshot restore completed successfully")
+        print(status)
+
+    except Exception as e:
+        status["completed"] = datetime.now().strftime("%Y%m%d%H%M%S")
+        status["succeeded"] = False
+        status["error"] = str(e)
+        print(f"Snapshot restore failed: {e}")
+
+    return status
+
+
+if __name__ == "__main__":
+    restore_alaskawildfires_snapshot.serve(
+        name="Restore Alaska Wildfires Snapshot",
+        tags=["wildfire snapshot", "backup"],
+        parameters={
+            "snapshot_name": "alaska_wildfires_01_31_2026",
+            "destination_directory": "/tmp/alaska_wildfires_restore",
+            "s3_bucket": "alaskawildfires-snapshots",
+        },
+    )
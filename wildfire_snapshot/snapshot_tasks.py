@@ -1,9 +1,44 @@
+import hashlib
+import json
 import os
+import shutil
+import subprocess
 import tarfile
+import tempfile
+import threading
+import zlib
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from prefect import task
 
+# Multi-threaded compressors usable by stream_snapshot_to_s3, with the
+# command that reads a tar stream on stdin and the extension of the output.
+compressors = {
+    "zstd": (["zstd", "-T0", "-3", "-c"], "tar.zst"),
+    "pigz": (["pigz", "-c"], "tgz"),
+}
+
+# Prefixes of the content-addressed chunk store and the per-snapshot manifests
+# used by incremental snapshots.
+chunk_prefix = "chunks"
+manifest_prefix = "manifests"
+
+
+def get_s3_client(aws_access_key_id=None, aws_secret_access_key=None):
+    """
+    Create an S3 client, using explicit credentials if they are provided.
+    """
+    if aws_access_key_id and aws_secret_access_key:
+        session = boto3.Session(
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key,
+        )
+        return session.client("s3")
+    return boto3.client("s3")
+
 
 @task
 def create_tarball(source_directory, output_path=None):
@@ -69,14 +104,7 @@ def upload_to_s3(
 
     print(f"Uploading {file_path} to s3://{bucket_name}/{file_path.name}")
 
-    if aws_access_key_id and aws_secret_access_key:
-        session = boto3.Session(
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-        )
-        s3 = session.client("s3")
-    else:
-        s3 = boto3.client("s3")
+    s3 = get_s3_client(aws_access_key_id, aws_secret_access_key)
 
     s3.upload_file(str(file_path), bucket_name, file_path.name)
 
@@ -86,6 +114,407 @@ def upload_to_s3(
     return s3_uri
 
 
+@task
+def stream_snapshot_to_s3(
+    source_directory,
+    bucket_name,
+    snapshot_name,
+    aws_access_key_id=None,
+    aws_secret_access_key=None,
+    compressor="zstd",
+    part_size_mb=64,
+    max_concurrency=8,
+):
+    """
+    Stream a compressed tarball of a directory straight into an S3 multipart
+    upload, without writing the tarball to local disk.
+
+    The tar stream is piped through a multi-threaded compressor (zstd or pigz)
+    and the compressed output is read in part_size_mb chunks that are uploaded
+    by max_concurrency threads.
+
+    Args:
+        source_directory: Path to the directory to archive
+        bucket_name: Name of the S3 bucket
+        snapshot_name: Name of the snapshot, used as the key without extension
+        aws_access_key_id: AWS access key (optional if using environment variables or IAM roles)
+        aws_secret_access_key: AWS secret access key (optional if using environment variables or IAM roles)
+        compressor: Either "zstd" or "pigz"
+        part_size_mb: Size of each multipart upload part in MB
+        max_concurrency: Number of threads uploading parts at once
+
+    Returns:
+        S3 URI of the uploaded snapshot
+    """
+    source_path = Path(source_directory)
+
+    if not source_path.is_dir():
+        raise NotADirectoryError(f"Source path is not a directory: {source_directory}")
+
+    if compressor not in compressors:
+        raise ValueError(
+            f"Unknown compressor {compressor}, expected one of {list(compressors)}"
+        )
+
+    compress_command, extension = compressors[compressor]
+    if shutil.which(compress_command[0]) is None:
+        raise FileNotFoundError(f"Compressor not found on PATH: {compress_command[0]}")
+
+    key = f"{snapshot_name}.{extension}"
+    s3_uri = f"s3://{bucket_name}/{key}"
+    print(f"Streaming {source_directory} to {s3_uri} through {compressor}")
+
+    s3 = get_s3_client(aws_access_key_id, aws_secret_access_key)
+    config = TransferConfig(
+        multipart_threshold=part_size_mb * 1024 * 1024,
+        multipart_chunksize=part_size_mb * 1024 * 1024,
+        max_concurrency=max_concurrency,
+        use_threads=True,
+    )
+
+    # stderr goes to temporary files, a pipe that is only read after the upload could
+    # fill up and stall the pipeline
+    tar_stderr = tempfile.TemporaryFile()
+    compress_stderr = tempfile.TemporaryFile()
+    tar_process = subprocess.Popen(
+        ["tar", "-C", str(source_path.parent), "-cf", "-", source_path.name],
+        stdout=subprocess.PIPE,
+        stderr=tar_stderr,
+    )
+    compress_process = subprocess.Popen(
+        compress_command,
+        stdin=tar_process.stdout,
+        stdout=subprocess.PIPE,
+        stderr=compress_stderr,
+    )
+    # Let tar receive SIGPIPE if the compressor exits early
+    tar_process.stdout.close()
+
+    try:
+        s3.upload_fileobj(compress_process.stdout, bucket_name, key, Config=config)
+    finally:
+        compress_process.stdout.close()
+        compress_returncode = compress_process.wait()
+        tar_returncode = tar_process.wait()
+        tar_stderr.seek(0)
+        compress_stderr.seek(0)
+        tar_messages = tar_stderr.read().decode()
+        compress_messages = compress_stderr.read().decode()
+        tar_stderr.close()
+        compress_stderr.close()
+
+    # GNU tar exits 1 when files changed while they were read, which is routine on the
+    # live GeoServer data directory, the archive is still complete
+    if tar_returncode == 1 and compress_returncode == 0:
+        print(f"tar warnings while archiving {source_directory}: {tar_messages}")
+    elif tar_returncode != 0 or compress_returncode != 0:
+        # Don't leave a truncated snapshot behind
+        s3.delete_object(Bucket=bucket_name, Key=key)
+        raise Exception(
+            f"Failed to stream snapshot of {source_directory}. "
+            f"tar: {tar_messages} "
+            f"{compressor}: {compress_messages}"
+        )
+
+    print(f"Upload complete: {s3_uri}")
+
+    return s3_uri
+
+
+def chunk_key(chunk_hash):
+    return f"{chunk_prefix}/{chunk_hash[:2]}/{chunk_hash}"
+
+
+def list_stored_chunks(s3, bucket_name):
+    """
+    List the hashes of every chunk already in the bucket's chunk store.
+    """
+    stored = set()
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=f"{chunk_prefix}/"):
+        for obj in page.get("Contents", []):
+            stored.add(obj["Key"].rsplit("/", 1)[-1])
+    return stored
+
+
+def load_latest_manifest(s3, bucket_name):
+    """
+    Load the most recently written snapshot manifest, or None if there isn't one.
+    """
+    latest = None
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=f"{manifest_prefix}/"):
+        for obj in page.get("Contents", []):
+            if latest is None or obj["LastModified"] > latest["LastModified"]:
+                latest = obj
+
+    if latest is None:
+        return None
+
+    body = s3.get_object(Bucket=bucket_name, Key=latest["Key"])["Body"].read()
+    return json.loads(body)
+
+
+def hash_file_chunks(file_path, chunk_size):
+    """
+    Yield (sha256, bytes) for each fixed-size chunk of a file.
+    """
+    with open(file_path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            yield hashlib.sha256(data).hexdigest(), data
+
+
+@task
+def create_incremental_snapshot(
+    source_directory,
+    bucket_name,
+    snapshot_name,
+    aws_access_key_id=None,
+    aws_secret_access_key=None,
+    chunk_size_mb=8,
+    max_concurrency=8,
+):
+    """
+    Create an incremental, content-deduplicated snapshot of a directory.
+
+    Every file is split into fixed-size chunks that are stored in the bucket
+    under their SHA-256 hash, so a chunk is only uploaded the first time its
+    content is seen. Files whose size and mtime match the previous snapshot
+    reuse its chunk list without being re-read. The snapshot itself is a small
+    JSON manifest listing each file and its chunks, and each directory and
+    symlink, so that the directory tree can be rebuilt exactly as the tarball
+    snapshots capture it.
+
+    Args:
+        source_directory: Path to the directory to snapshot
+        bucket_name: Name of the S3 bucket
+        snapshot_name: Name of the snapshot, used as the manifest name
+        aws_access_key_id: AWS access key (optional if using environment variables or IAM roles)
+        aws_secret_access_key: AWS secret access key (optional if using environment variables or IAM roles)
+        chunk_size_mb: Size of each chunk in MB
+        max_concurrency: Number of threads uploading chunks at once
+
+    Returns:
+        S3 URI of the snapshot manifest
+    """
+    source_path = Path(source_directory)
+
+    if not source_path.is_dir():
+        raise NotADirectoryError(f"Source path is not a directory: {source_directory}")
+
+    s3 = get_s3_client(aws_access_key_id, aws_secret_access_key)
+    chunk_size = chunk_size_mb * 1024 * 1024
+
+    stored_chunks = list_stored_chunks(s3, bucket_name)
+    previous = load_latest_manifest(s3, bucket_name)
+    previous_files = {}
+    if previous is not None and previous["chunk_size"] == chunk_size:
+        previous_files = {
+            entry["path"]: entry
+            for entry in previous["files"]
+            if entry.get("type", "file") == "file"
+        }
+
+    print(
+        f"Creating incremental snapshot {snapshot_name} of {source_directory} "
+        f"({len(stored_chunks)} chunks already stored)"
+    )
+
+    # Bound the number of chunks held in memory while waiting to be uploaded
+    pending = threading.BoundedSemaphore(max_concurrency * 2)
+
+    def upload_chunk(chunk_hash, data):
+        try:
+            s3.put_object(
+                Bucket=bucket_name,
+                Key=chunk_key(chunk_hash),
+                Body=zlib.compress(data, 3),
+            )
+        finally:
+            pending.release()
+        return len(data)
+
+    files = []
+    futures = []
+    reused_files = 0
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for root, dirs, filenames in os.walk(source_path):
+            dirs.sort()
+            # os.walk does not follow symlinks to directories, but lists them
+            for name in dirs + sorted(filenames):
+                path = Path(root) / name
+                relative_path = str(path.relative_to(source_path))
+                if path.is_symlink():
+                    files.append(
+                        {
+                            "path": relative_path,
+                            "type": "symlink",
+                            "target": os.readlink(path),
+                        }
+                    )
+                elif path.is_dir():
+                    stat = path.stat()
+                    files.append(
+                        {
+                            "path": relative_path,
+                            "type": "dir",
+                            "mtime": stat.st_mtime,
+                            "mode": stat.st_mode & 0o7777,
+                        }
+                    )
+
+            for filename in sorted(filenames):
+                file_path = Path(root) / filename
+                if file_path.is_symlink() or not file_path.is_file():
+                    continue
+
+                stat = file_path.stat()
+                relative_path = str(file_path.relative_to(source_path))
+                entry = {
+                    "path": relative_path,
+                    "type": "file",
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "mode": stat.st_mode & 0o777,
+                }
+
+                old_entry = previous_files.get(relative_path)
+                if (
+                    old_entry is not None
+                    and old_entry["size"] == entry["size"]
+                    and old_entry["mtime"] == entry["mtime"]
+                    and set(old_entry["chunks"]) <= stored_chunks
+                ):
+                    entry["chunks"] = old_entry["chunks"]
+                    reused_files += 1
+                else:
+                    entry["chunks"] = []
+                    for chunk_hash, data in hash_file_chunks(file_path, chunk_size):
+                        entry["chunks"].append(chunk_hash)
+                        if chunk_hash not in stored_chunks:
+                            stored_chunks.add(chunk_hash)
+                            pending.acquire()
+                            futures.append(
+                                executor.submit(upload_chunk, chunk_hash, data)
+                            )
+
+                files.append(entry)
+
+        uploaded_bytes = sum(future.result() for future in futures)
+
+    manifest = {
+        "snapshot": snapshot_name,
+        "source_directory": str(source_path),
+        "chunk_size": chunk_size,
+        "compression": "zlib",
+        "files": files,
+    }
+    manifest_key = f"{manifest_prefix}/{snapshot_name}.json"
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=manifest_key,
+        Body=json.dumps(manifest).encode("utf-8"),
+    )
+
+    s3_uri = f"s3://{bucket_name}/{manifest_key}"
+    file_count = sum(1 for entry in files if entry["type"] == "file")
+    print(
+        f"Snapshot manifest written to {s3_uri}: {file_count} files, "
+        f"{reused_files} unchanged, {len(futures)} new chunks "
+        f"({uploaded_bytes / (1024 * 1024):.2f} MB uncompressed) uploaded"
+    )
+
+    return s3_uri
+
+
+@task
+def restore_snapshot(
+    bucket_name,
+    snapshot_name,
+    destination_directory,
+    aws_access_key_id=None,
+    aws_secret_access_key=None,
+    max_concurrency=8,
+):
+    """
+    Rebuild a directory from an incremental snapshot manifest: its directories,
+    files and symlinks, with their modes and modification times.
+
+    Args:
+        bucket_name: Name of the S3 bucket
+        snapshot_name: Name of the snapshot to restore, e.g. alaska_wildfires_01_31_2026
+        destination_directory: Directory to restore the files into
+        aws_access_key_id: AWS access key (optional if using environment variables or IAM roles)
+        aws_secret_access_key: AWS secret access key (optional if using environment variables or IAM roles)
+        max_concurrency: Number of files restored at once
+
+    Returns:
+        Path to the restored directory
+    """
+    s3 = get_s3_client(aws_access_key_id, aws_secret_access_key)
+    manifest_key = f"{manifest_prefix}/{snapshot_name}.json"
+
+    try:
+        body = s3.get_object(Bucket=bucket_name, Key=manifest_key)["Body"].read()
+    except ClientError as e:
+        raise FileNotFoundError(
+            f"Snapshot manifest not found: s3://{bucket_name}/{manifest_key}"
+        ) from e
+    manifest = json.loads(body)
+
+    destination_path = Path(destination_directory)
+    # manifests written before directories and symlinks were recorded only
+    # list files, without a type
+    entries = {"file": [], "dir": [], "symlink": []}
+    for entry in manifest["files"]:
+        entries[entry.get("type", "file")].append(entry)
+    print(
+        f"Restoring {len(entries['file'])} files, {len(entries['dir'])} "
+        f"directories and {len(entries['symlink'])} symlinks from snapshot "
+        f"{snapshot_name} to {destination_path}"
+    )
+
+    destination_path.mkdir(parents=True, exist_ok=True)
+    for entry in entries["dir"]:
+        (destination_path / entry["path"]).mkdir(parents=True, exist_ok=True)
+
+    def restore_file(entry):
+        file_path = destination_path / entry["path"]
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_path, "wb") as f:
+            for chunk_hash in entry["chunks"]:
+                data = s3.get_object(Bucket=bucket_name, Key=chunk_key(chunk_hash))[
+                    "Body"
+                ].read()
+                f.write(zlib.decompress(data))
+        os.chmod(file_path, entry["mode"])
+        os.utime(file_path, (entry["mtime"], entry["mtime"]))
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        list(executor.map(restore_file, entries["file"]))
+
+    for entry in entries["symlink"]:
+        link_path = destination_path / entry["path"]
+        link_path.parent.mkdir(parents=True, exist_ok=True)
+        if link_path.is_symlink() or link_path.is_file():
+            link_path.unlink()
+        os.symlink(entry["target"], link_path)
+
+    # directory modes and times are set last, deepest first, since creating
+    # their contents changes their mtime and a read-only mode would block it
+    for entry in sorted(entries["dir"], key=lambda entry: entry["path"], reverse=True):
+        dir_path = destination_path / entry["path"]
+        os.chmod(dir_path, entry["mode"])
+        os.utime(dir_path, (entry["mtime"], entry["mtime"]))
+
+    print(f"Restore complete: {destination_path}")
+
+    return str(destination_path)
+
+
 @task
 def cleanup_temp_file(file_path):
     """